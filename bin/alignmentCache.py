@@ -0,0 +1,199 @@
+"""Content addressed cache of cactus alignments, so that an alignment built
+with the same config, inputs and tools is never built twice.
+
+Each entry is a directory named by the hash of its key, holding the files
+of an alignment output directory (the cactus disk, its config, experiment
+and jobTree stats). Entries are evicted least recently used first once the
+cache grows beyond its maximum size. An entry is renamed out of the way before
+it is removed, so a concurrent fetch of it either copies all of it or fails
+and is treated as a miss. The partial entries of stores, and the entries being
+removed, count towards the size of the cache, and those left by killed jobs are
+removed once they have not changed for a day.
+
+If links are used, only the xml files are hard linked. The cactus disk is always
+copied, as the stats programs may write to it, which would change the cached copy.
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import subprocess
+
+from sonLib.bioio import logger
+
+from referenceScripts.src.scripts.outputManifest import getFileDigest
+
+def getToolVersionString():
+    """Returns a string identifying the versions of cactus and cactusTools, their git
+    revisions if they are checked out from git, else the modification times of their modules.
+    """
+    import cactus
+    import cactusTools
+    versions = []
+    for module in (cactus, cactusTools):
+        moduleDir = os.path.split(os.path.abspath(module.__file__))[0]
+        try:
+            process = subprocess.Popen([ "git", "rev-parse", "HEAD" ], cwd=moduleDir,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            revision = process.communicate()[0].strip()
+            if process.returncode != 0:
+                raise OSError()
+        except OSError:
+            revision = str(max([ os.path.getmtime(os.path.join(moduleDir, i)) for i in os.listdir(moduleDir) ]))
+        versions.append("%s:%s" % (module.__name__, revision))
+    return " ".join(versions)
+
+def getDirSize(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for fileName in files:
+            size += os.path.getsize(os.path.join(root, fileName))
+    return size
+
+def getLastModified(path):
+    """Returns the latest modification time of the path and everything under it.
+    """
+    lastModified = os.path.getmtime(path)
+    for root, dirs, files in os.walk(path):
+        for i in dirs + files:
+            lastModified = max(lastModified, os.path.getmtime(os.path.join(root, i)))
+    return lastModified
+
+def copyPath(source, destination, link=False):
+    """Copies a file or directory tree, hard linking the files rather than copying
+    them if link is true and the two paths are on the same file system.
+    """
+    if os.path.isdir(source):
+        os.mkdir(destination)
+        for i in os.listdir(source):
+            copyPath(os.path.join(source, i), os.path.join(destination, i), link)
+        return
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, destination)
+
+class AlignmentCache:
+    """Cache of alignment output directories, keyed by the inputs to the alignment.
+    """
+    def __init__(self, cacheDir, maxSize, useLinks=False, staleAge=24*60*60):
+        self.cacheDir = cacheDir
+        self.maxSize = int(maxSize)
+        self.useLinks = useLinks
+        self.staleAge = staleAge
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+    def getKey(self, configString, sequenceFiles, newickTree, requiredSpecies,
+               singleCopySpecies, outgroupEvent, toolVersions, phases=""):
+        """Hashes the inputs to an alignment. Sequences are keyed by their file name,
+        which determines their event name, and their contents. Phases distinguishes
+        alignments with the same config that run different phases of the workflow.
+        """
+        key = hashlib.sha1()
+        for i in [ configString, newickTree, requiredSpecies, singleCopySpecies, outgroupEvent, toolVersions, phases ] + \
+        [ "%s:%s" % (os.path.split(i)[-1], getFileDigest(i)) for i in sequenceFiles ]:
+            key.update(str(i))
+            key.update("\0")
+        return key.hexdigest()
+
+    def getEntryDir(self, key):
+        return os.path.join(self.cacheDir, key)
+
+    def isLinked(self, fileName):
+        """Only the xml files are linked, they are not changed once written.
+        """
+        return self.useLinks and fileName.endswith(".xml")
+
+    def fetch(self, key, outputDir, fileNames):
+        """Copies the cached files into the output directory, returning false if the
+        key is not in the cache, or was evicted while being copied. The files are only
+        moved into place, in order, once all of them have been copied.
+        """
+        entryDir = self.getEntryDir(key)
+        tempOutputFiles = [ os.path.join(outputDir, fileName) + ".tmp" for fileName in fileNames ]
+        def removeTempOutputFiles():
+            for tempOutputFile in tempOutputFiles:
+                if os.path.isdir(tempOutputFile):
+                    shutil.rmtree(tempOutputFile)
+                elif os.path.exists(tempOutputFile):
+                    os.remove(tempOutputFile)
+        if not os.path.isdir(entryDir):
+            return False
+        removeTempOutputFiles()
+        try:
+            os.utime(entryDir, None) #Mark it as recently used
+            for fileName, tempOutputFile in zip(fileNames, tempOutputFiles):
+                copyPath(os.path.join(entryDir, fileName), tempOutputFile, self.isLinked(fileName))
+        except (IOError, OSError), e:
+            logger.info("Alignment %s was evicted from the cache while being fetched: %s" % (key, e))
+            removeTempOutputFiles()
+            return False
+        missingFiles = [ fileName for fileName, tempOutputFile in zip(fileNames, tempOutputFiles) if not os.path.exists(tempOutputFile) ]
+        if len(missingFiles) > 0:
+            logger.info("Alignment %s in the cache is missing %s" % (key, " ".join(missingFiles)))
+            removeTempOutputFiles()
+            return False
+        for fileName, tempOutputFile in zip(fileNames, tempOutputFiles):
+            os.rename(tempOutputFile, os.path.join(outputDir, fileName))
+        logger.info("Got alignment %s from the cache" % key)
+        return True
+
+    def store(self, key, outputDir, fileNames):
+        """Copies the given files from the output directory into the cache, then evicts
+        old entries as needed.
+        """
+        entryDir = self.getEntryDir(key)
+        if os.path.isdir(entryDir):
+            return
+        tempEntryDir = "%s.tmp.%i" % (entryDir, os.getpid())
+        os.mkdir(tempEntryDir)
+        for fileName in fileNames:
+            copyPath(os.path.join(outputDir, fileName), os.path.join(tempEntryDir, fileName), self.isLinked(fileName))
+        try:
+            os.rename(tempEntryDir, entryDir)
+        except OSError: #Another job stored the same alignment first
+            shutil.rmtree(tempEntryDir)
+        logger.info("Stored alignment %s in the cache" % key)
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is within its maximum size,
+        first removing the partial and evicted entries left by killed jobs.
+        """
+        entries = []
+        otherSize = 0 #Of the partial and evicted entries of running jobs
+        for i in os.listdir(self.cacheDir):
+            entryDir = os.path.join(self.cacheDir, i)
+            if not os.path.isdir(entryDir):
+                continue
+            try:
+                if ".tmp." in i or ".evicted." in i:
+                    if time.time() - getLastModified(entryDir) > self.staleAge:
+                        logger.info("Removing %s from the cache, left by a killed job" % entryDir)
+                        shutil.rmtree(entryDir, ignore_errors=True)
+                    else:
+                        otherSize += getDirSize(entryDir)
+                else:
+                    entries.append((os.path.getmtime(entryDir), getDirSize(entryDir), entryDir))
+            except OSError: #Renamed or removed by another job
+                pass
+        entries.sort()
+        totalSize = otherSize + sum([ size for lastUsed, size, entryDir in entries ])
+        while totalSize > self.maxSize and len(entries) > 1: #Never evict the newest entry
+            lastUsed, size, entryDir = entries.pop(0)
+            logger.info("Evicting alignment %s from the cache" % entryDir)
+            #Renamed first, so the entry disappears at once rather than file by file under a fetch
+            evictedDir = "%s.evicted.%i" % (entryDir, os.getpid())
+            try:
+                os.rename(entryDir, evictedDir)
+            except OSError: #Evicted by another job
+                continue
+            shutil.rmtree(evictedDir)
+            totalSize -= size
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+"""Lib and script for the backends that run the cactus programs of the pipeline.
+
+The cactus backend runs the cactus workflow, the cactusTools functions and the stats
+binaries. The stub backend stands in for all of them, writing synthetic outputs of a
+configurable size after a configurable latency, so that the overhead of the pipeline
+itself (the fan out of the targets, the pickling of the options, the moves of the outputs
+and the stats chain) can be run and profiled without cactus or a cactus disk, e.g.
+
+    pipeline.py --backend stub --stubOutputSize 100000 --stubLatency 0.1 ...
+
+The stub cactus disk is a directory holding a file of the output size, so copies and
+moves of it cost what they would for a real one of that size. The stub stats programs
+fail if the cactus disk they are given has not been built, and their snpStats and
+pathStats outputs can be aggregated, so the order of the targets is still checked.
+
+The stats binaries are replaced by this script, run as:
+
+    backends.py --stubProgram snpStats --stubOutputSize N --stubLatency L --cactusDisk ... --outputFile ...
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import xml.etree.ElementTree as ET
+from optparse import OptionParser
+
+rootPath = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+
+class CactusBackend:
+    """Runs the cactus programs.
+    """
+    def __init__(self):
+        self.toolVersionString = None
+
+    def writeExperimentFile(self, experimentFile, **kwargs):
+        from cactus.shared.config import CactusWorkflowExperiment
+        CactusWorkflowExperiment(**kwargs).writeExperimentFile(experimentFile)
+
+    def runCactusWorkflow(self, **kwargs):
+        from cactus.shared.common import runCactusWorkflow
+        runCactusWorkflow(**kwargs)
+
+    def checkJobTree(self, jobTreeDir):
+        from jobTree.test.jobTree.jobTreeTest import runJobTreeStatusAndFailIfNotComplete
+        runJobTreeStatusAndFailIfNotComplete(jobTreeDir)
+
+    def runCactusTreeStats(self, outputFile, cactusDisk, **kwargs):
+        from cactusTools.shared.common import runCactusTreeStats
+        runCactusTreeStats(outputFile, cactusDisk, **kwargs)
+
+    def runCactusMAFGenerator(self, outputFile, cactusDisk, **kwargs):
+        from cactusTools.shared.common import runCactusMAFGenerator
+        runCactusMAFGenerator(outputFile, cactusDisk, **kwargs)
+
+    def getStatsCommand(self, binaryName):
+        """Returns the command line, less its arguments, of a stats binary.
+        """
+        return os.path.join(rootPath, "bin", binaryName)
+
+    def getJobTreeStatsCommand(self, jobTreeDir, outputFile):
+        return "jobTreeStats --jobTree %s --outputFile %s" % (jobTreeDir, outputFile)
+
+    def getToolVersionString(self):
+        from referenceScripts.bin.alignmentCache import getToolVersionString
+        if self.toolVersionString == None:
+            self.toolVersionString = getToolVersionString()
+        return self.toolVersionString
+
+    def getProgramVersion(self, program):
+        """Returns a string identifying the version of a stats binary, or for the cactusTools
+        functions the version of cactusTools.
+        """
+        from referenceScripts.src.scripts.outputManifest import getFileDigest
+        binary = self.getStatsCommand(program)
+        if os.path.exists(binary):
+            return getFileDigest(binary)
+        return self.getToolVersionString()
+
+######################
+#Synthetic outputs
+######################
+
+stubSamples = [ "reference", "sample0", "sample1", "sample2", "sample3", "panTro3" ]
+
+#The programs whose outputs are text rather than xml
+stubTextPrograms = ("danielAlignment", "sequenceCoverages")
+
+def getCactusDiskDir(cactusDisk):
+    """Returns the database dir of a cactus disk string.
+    """
+    match = re.search("database_dir=\"([^\"]*)\"", cactusDisk)
+    if match == None:
+        raise RuntimeError("No database dir in the cactus disk string: %s" % cactusDisk)
+    return match.group(1)
+
+def checkCactusDisk(cactusDisk):
+    if not os.path.isdir(getCactusDiskDir(cactusDisk)):
+        raise RuntimeError("The cactus disk has not been built: %s" % cactusDisk)
+
+def getStubRng(*args):
+    """Returns a random number generator seeded by the program and its options, but not the paths
+    of its cactus disk or output, which are temporary, so the outputs of a run can be compared.
+    """
+    return random.Random(" ".join([ str(i) for i in args ]))
+
+def writeRecords(fileHandle, size, recordFn):
+    """Writes the lines made by the record function until size bytes are written.
+    """
+    written = 0
+    i = 0
+    while written < size:
+        line = recordFn(i) + "\n"
+        fileHandle.write(line)
+        written += len(line)
+        i += 1
+
+def writeStubFile(fileName, size, byte="0", chunkSize=1000000):
+    fileHandle = open(fileName, 'w')
+    chunk = byte * chunkSize
+    while size > 0:
+        fileHandle.write(chunk[:size])
+        size -= chunkSize
+    fileHandle.close()
+
+def writeStubStats(outputFile, program, size, rng):
+    """Writes synthetic stats of roughly the given size. The records of the snpStats and pathStats
+    are in the formats the aggregates are made from.
+    """
+    fileHandle = open(outputFile, 'w')
+    if program in ("snpStats", "pathStats"):
+        fileHandle.write("<%s>" % program)
+        for sample in stubSamples:
+            fileHandle.write("<statsForSample sampleName=\"%s\" referenceName=\"reference\" totalInsertion=\"0\" totalDeletion=\"0\">" % sample)
+            def fn(i):
+                position = rng.randint(0, 1000000)
+                if program == "snpStats":
+                    return "%s %i reference %i %s %s" % (sample, position, position, rng.choice("ACGT"), rng.choice("ACGT"))
+                return " ".join([ "reference", "chr0", str(position), "1", "+", str(rng.choice((0, 1, 5))),
+                                  sample, "chr0", str(position), "1", "+", "0", "0", str(rng.choice((0, 2))) ])
+            writeRecords(fileHandle, size / len(stubSamples), fn)
+            fileHandle.write("</statsForSample>")
+        fileHandle.write("</%s>\n" % program)
+    elif program not in stubTextPrograms:
+        fileHandle.write("<%s stub=\"1\">\n" % program)
+        writeRecords(fileHandle, size, lambda i : "<record index=\"%i\" value=\"%f\"/>" % (i, rng.random()))
+        fileHandle.write("</%s>\n" % program)
+    else:
+        writeRecords(fileHandle, size, lambda i : "%s\t%i\t%f" % (rng.choice(stubSamples), i, rng.random()))
+    fileHandle.close()
+
+def writeStubMaf(outputFile, size, rng, showOnlySubstitutionsWithRespectToTheReference=False):
+    """Writes a synthetic maf of roughly the given size, of blocks with a row for each of the samples.
+    """
+    fileHandle = open(outputFile, 'w')
+    fileHandle.write("##maf version=1 scoring=N/A\n\n")
+    def fn(i):
+        reference = "".join([ rng.choice("ACGT") for j in xrange(50) ])
+        rows = [ "a score=0" ]
+        for sample in stubSamples:
+            text = "".join([ rng.choice("ACGT") if rng.random() < 0.01 else j for j in reference ])
+            if showOnlySubstitutionsWithRespectToTheReference and sample != "reference":
+                text = "".join([ "." if j == k else j for j, k in zip(text, reference) ])
+            rows.append("s %s.chr0 %i 50 + 100000000 %s" % (sample, 50*i, text))
+        return "\n".join(rows) + "\n"
+    writeRecords(fileHandle, size, fn)
+    fileHandle.close()
+
+def writeStubJobTreeStats(jobTreeDir, outputFile):
+    """Writes the summary of the stub workflow's targets, as jobTreeStats does.
+    """
+    fileHandle = open(os.path.join(jobTreeDir, "stubWorkflow.json"), 'r')
+    workflow = json.load(fileHandle)
+    fileHandle.close()
+    stats = ET.Element("stats", { "total_time":str(workflow["wallTime"]), "total_clock":str(workflow["wallTime"]) })
+    targetTypes = ET.SubElement(stats, "target_types")
+    for targetClass in workflow["targetClasses"]:
+        targetTime = workflow["wallTime"] / len(workflow["targetClasses"])
+        ET.SubElement(targetTypes, targetClass, { "total_number":"1", "total_time":str(targetTime), "max_time":str(targetTime),
+                                                  "total_clock":str(targetTime), "max_memory":"0" })
+    ET.ElementTree(stats).write(outputFile)
+
+class StubBackend:
+    """Stands in for the cactus programs, see the module docstring.
+    """
+    def __init__(self, outputSize, latency):
+        self.outputSize = int(outputSize)
+        self.latency = float(latency)
+
+
+    def writeExperimentFile(self, experimentFile, **kwargs):
+        experiment = ET.Element("cactus_workflow_experiment", { "stub":"1", "databaseName":kwargs["databaseName"],
+                                                                "outputDir":kwargs["outputDir"], "sequences":" ".join(kwargs["sequences"]) })
+        ET.ElementTree(experiment).write(experimentFile)
+
+    def runCactusWorkflow(self, experimentFile, jobTreeDir, setupAndBuildAlignments=True, buildReference=True, **kwargs):
+        startTime = time.time()
+        experiment = ET.parse(experimentFile).getroot()
+        cactusDisk = os.path.join(experiment.attrib["outputDir"], experiment.attrib["databaseName"])
+        time.sleep(self.latency)
+        targetClasses = []
+        if setupAndBuildAlignments:
+            os.mkdir(cactusDisk)
+            writeStubFile(os.path.join(cactusDisk, "alignment"), self.outputSize)
+            targetClasses += [ "CactusSetupPhase", "CactusAlignmentPhase" ]
+        elif not os.path.isdir(cactusDisk):
+            raise RuntimeError("The base alignment has not been copied to: %s" % cactusDisk)
+        if buildReference:
+            writeStubFile(os.path.join(cactusDisk, "reference"), self.outputSize / 10)
+            targetClasses += [ "CactusReferencePhase" ]
+        os.mkdir(jobTreeDir)
+        fileHandle = open(os.path.join(jobTreeDir, "stubWorkflow.json"), 'w')
+        json.dump({ "wallTime":time.time() - startTime, "targetClasses":targetClasses }, fileHandle)
+        fileHandle.close()
+
+    def checkJobTree(self, jobTreeDir):
+        if not os.path.exists(os.path.join(jobTreeDir, "stubWorkflow.json")):
+            raise RuntimeError("The stub workflow did not complete: %s" % jobTreeDir)
+
+    def runCactusTreeStats(self, outputFile, cactusDisk, **kwargs):
+        checkCactusDisk(cactusDisk)
+        time.sleep(self.latency)
+        writeStubStats(outputFile, "treeStats", self.outputSize, getStubRng("treeStats"))
+
+    def runCactusMAFGenerator(self, outputFile, cactusDisk, showOnlySubstitutionsWithRespectToTheReference=False, **kwargs):
+        checkCactusDisk(cactusDisk)
+        time.sleep(self.latency)
+        writeStubMaf(outputFile, self.outputSize, getStubRng("maf"), showOnlySubstitutionsWithRespectToTheReference)
+
+    def getStatsCommand(self, binaryName):
+        return "%s %s --stubProgram %s --stubOutputSize %i --stubLatency %f" % (sys.executable, os.path.abspath(__file__),
+                                                                                binaryName, self.outputSize, self.latency)
+
+    def getJobTreeStatsCommand(self, jobTreeDir, outputFile):
+        return "%s %s --stubProgram jobTreeStats --jobTree %s --outputFile %s" % (sys.executable, os.path.abspath(__file__),
+                                                                                 jobTreeDir, outputFile)
+
+    def getToolVersionString(self):
+        return "stub"
+
+    def getProgramVersion(self, program):
+        #The outputs of the stub depend on their size
+        return "stub %i" % self.outputSize
+
+backends = {}
+
+def getBackend(options):
+    """Returns the backend chosen by the options, one per process.
+    """
+    key = (options.backend, options.stubOutputSize, options.stubLatency)
+    if key not in backends:
+        if options.backend == "cactus":
+            backends[key] = CactusBackend()
+        elif options.backend == "stub":
+            backends[key] = StubBackend(options.stubOutputSize, options.stubLatency)
+        else:
+            raise RuntimeError("Unrecognised backend: %s" % options.backend)
+    return backends[key]
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--stubProgram", dest="stubProgram", help="The stats binary, or jobTreeStats, to stand in for")
+    parser.add_option("--stubOutputSize", dest="stubOutputSize", type="int", default=1000000)
+    parser.add_option("--stubLatency", dest="stubLatency", type="float", default=0.0)
+    #The arguments of the stats binaries and jobTreeStats
+    parser.add_option("--cactusDisk", dest="cactusDisk")
+    parser.add_option("--outputFile", dest="outputFile")
+    parser.add_option("--jobTree", dest="jobTree")
+    parser.add_option("--minimumNsForScaffoldGap", dest="minimumNsForScaffoldGap")
+    parser.add_option("--sampleNumber", dest="sampleNumber")
+    parser.add_option("--referenceEventString", dest="referenceEventString")
+    parser.add_option("--otherReferenceEventString", dest="otherReferenceEventString")
+    parser.add_option("--outgroupEventString", dest="outgroupEventString")
+    parser.add_option("--ignoreAdjacencies", dest="ignoreAdjacencies", action="store_true", default=False)
+    parser.add_option("--ignoreFirstNBasesOfBlock", dest="ignoreFirstNBasesOfBlock")
+    parser.add_option("--minimumRecurrence", dest="minimumRecurrence")
+    options, args = parser.parse_args()
+    if options.stubProgram == None or options.outputFile == None:
+        parser.print_help()
+        sys.exit(1)
+
+    if options.stubProgram == "jobTreeStats":
+        writeStubJobTreeStats(options.jobTree, options.outputFile)
+        return
+    checkCactusDisk(options.cactusDisk)
+    time.sleep(options.stubLatency)
+    writeStubStats(options.outputFile, options.stubProgram, options.stubOutputSize,
+                   getStubRng(options.stubProgram, options.referenceEventString, options.otherReferenceEventString, options.ignoreAdjacencies,
+                              options.ignoreFirstNBasesOfBlock, options.minimumRecurrence))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""Wraps the blast command run by cactus, caching the cigars it produces so that
+alignments sharing sequences (such as the held out alignments) reuse them.
+
+For a pairwise blast the cache is keyed by the blast string and the name and
+contents of each pair of sequences, so that only the pairs not seen before are
+blasted. The self blast is keyed by the blast string and the whole sequence file.
+The blast string uses TARGET_FILE, QUERY_FILE and OUTPUT_FILE in place of cactus's
+SEQ_FILE_1, SEQ_FILE_2 (or SEQ_FILE) and CIGARS_FILE. The pairs missing from the cache
+are blasted in a single run, as the targets are indexed once per run.
+
+To check the cached blast matches the uncached one:
+    cachedBlast.py --check --blastString "lastz ... TARGET_FILE[multiple] QUERY_FILE > OUTPUT_FILE" target.fa query.fa
+"""
+
+import os
+import shutil
+import hashlib
+from optparse import OptionParser
+
+from sonLib.bioio import fastaRead, fastaWrite
+from sonLib.bioio import getTempFile
+from sonLib.bioio import system
+from sonLib.bioio import getTempDirectory
+
+from referenceScripts.src.scripts.outputManifest import getFileDigest
+
+def getHash(*strings):
+    i = hashlib.sha1()
+    for string in strings:
+        i.update(string)
+        i.update("\0")
+    return i.hexdigest()
+
+class BlastCache:
+    """Directory of cigar files, named by their keys.
+    """
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+
+    def getFile(self, key):
+        return os.path.join(self.cacheDir, key[:2], key)
+
+    def get(self, key):
+        """Returns the cached cigar lines, or None if not present.
+        """
+        cacheFile = self.getFile(key)
+        if not os.path.exists(cacheFile):
+            return None
+        fileHandle = open(cacheFile, 'r')
+        lines = fileHandle.readlines()
+        fileHandle.close()
+        return lines
+
+    def put(self, key, lines):
+        cacheFile = self.getFile(key)
+        if not os.path.isdir(os.path.split(cacheFile)[0]):
+            try:
+                os.makedirs(os.path.split(cacheFile)[0])
+            except OSError: #Made by a concurrent blast
+                pass
+        tempCacheFile = "%s.tmp.%i" % (cacheFile, os.getpid())
+        fileHandle = open(tempCacheFile, 'w')
+        fileHandle.write("".join(lines))
+        fileHandle.close()
+        os.rename(tempCacheFile, cacheFile)
+
+def runBlast(blastString, targetFile, queryFile, tempDir):
+    """Runs the blast string, returning the lines of cigars.
+    """
+    outputFile = getTempFile(rootDir=tempDir)
+    system(blastString.replace("TARGET_FILE", targetFile).replace("QUERY_FILE", queryFile).replace("OUTPUT_FILE", outputFile))
+    fileHandle = open(outputFile, 'r')
+    lines = fileHandle.readlines()
+    fileHandle.close()
+    os.remove(outputFile)
+    return lines
+
+def cachedSelfBlast(cache, blastString, sequenceFile, tempDir):
+    key = getHash(blastString, getFileDigest(sequenceFile))
+    lines = cache.get(key)
+    if lines == None:
+        lines = runBlast(blastString, sequenceFile, sequenceFile, tempDir)
+        cache.put(key, lines)
+    return lines
+
+def readSequences(sequenceFile):
+    """Returns the (shortName, name, sequence, hash) of each sequence of a fasta file, the short
+    name being the first word of the header, as parsed by the blast string.
+    """
+    sequences = []
+    fileHandle = open(sequenceFile, 'r')
+    for name, sequence in fastaRead(fileHandle):
+        sequences.append((name.split()[0], name, sequence, getHash(name, sequence)))
+    fileHandle.close()
+    shortNames = set([ i[0] for i in sequences ])
+    if len(shortNames) != len(sequences):
+        raise RuntimeError("The sequence names of %s are not unique, so the cigars can't be split by sequence" % sequenceFile)
+    return sequences
+
+def cachedPairwiseBlast(cache, blastString, targetFile, queryFile, tempDir):
+    """Blasts the pairs of target and query sequences that have no cached cigars in one run,
+    of the queries with missing pairs against the union of their missing targets, splitting
+    the resulting cigars by pair so each pair is cached separately. Returns the cigars of
+    every pair, by query then target.
+    """
+    targets = readSequences(targetFile)
+    queries = readSequences(queryFile)
+    linesByPair = {}
+    missingPairs = set()
+    for queryName, queryFullName, querySequence, queryHash in queries:
+        for targetName, targetFullName, targetSequence, targetHash in targets:
+            cachedLines = cache.get(getHash(blastString, targetHash, queryHash))
+            if cachedLines == None:
+                missingPairs.add((queryName, targetName))
+                linesByPair[(queryName, targetName)] = []
+            else:
+                linesByPair[(queryName, targetName)] = cachedLines
+    if len(missingPairs) > 0:
+        missingQueries = set([ queryName for queryName, targetName in missingPairs ])
+        missingTargets = set([ targetName for queryName, targetName in missingPairs ])
+        tempTargetFile = getTempFile(rootDir=tempDir)
+        tempQueryFile = getTempFile(rootDir=tempDir)
+        try:
+            fileHandle = open(tempTargetFile, 'w')
+            for targetName, name, sequence, targetHash in targets:
+                if targetName in missingTargets:
+                    fastaWrite(fileHandle, name, sequence)
+            fileHandle.close()
+            fileHandle = open(tempQueryFile, 'w')
+            for queryName, name, sequence, queryHash in queries:
+                if queryName in missingQueries:
+                    fastaWrite(fileHandle, name, sequence)
+            fileHandle.close()
+            for line in runBlast(blastString, tempTargetFile, tempQueryFile, tempDir):
+                tokens = line.split()
+                #cigar: queryName start end strand targetName start end strand score ..., lastz putting
+                #the second (query) sequence first
+                if len(tokens) <= 5 or (tokens[1], tokens[5]) not in linesByPair:
+                    raise RuntimeError("Could not assign blast output line to a pair of sequences: %s" % line)
+                #Pairs blasted only as they share a query or target with missing pairs are already cached
+                if (tokens[1], tokens[5]) in missingPairs:
+                    linesByPair[(tokens[1], tokens[5])].append(line)
+        finally:
+            for tempFile in (tempTargetFile, tempQueryFile):
+                if os.path.exists(tempFile):
+                    os.remove(tempFile)
+        for queryName, queryFullName, querySequence, queryHash in queries:
+            for targetName, targetFullName, targetSequence, targetHash in targets:
+                if (queryName, targetName) in missingPairs:
+                    cache.put(getHash(blastString, targetHash, queryHash), linesByPair[(queryName, targetName)])
+    lines = []
+    for queryName, queryFullName, querySequence, queryHash in queries:
+        for targetName, targetFullName, targetSequence, targetHash in targets:
+            lines += linesByPair[(queryName, targetName)]
+    return lines
+
+def checkCachedBlast(blastString, targetFile, queryFile, tempDir):
+    """Returns true if the cigars of a pairwise blast, through a fresh cache both when it is
+    empty and when it is full, are those of the blast run directly, ignoring their order.
+    """
+    cacheDir = os.path.join(tempDir, "blastCache")
+    lines = sorted(runBlast(blastString, targetFile, queryFile, tempDir))
+    coldLines = sorted(cachedPairwiseBlast(BlastCache(cacheDir), blastString, targetFile, queryFile, tempDir))
+    warmLines = sorted(cachedPairwiseBlast(BlastCache(cacheDir), blastString, targetFile, queryFile, tempDir))
+    return lines == coldLines and lines == warmLines
+
+def getCachedBlastString(blastString, cacheDir, selfBlast=False):
+    """Wraps a cactus blast string so that it is run through this script.
+    """
+    if selfBlast:
+        wrappedString = blastString.replace("SEQ_FILE", "TARGET_FILE")
+        files = "--self SEQ_FILE CIGARS_FILE"
+    else:
+        wrappedString = blastString.replace("SEQ_FILE_1", "TARGET_FILE").replace("SEQ_FILE_2", "QUERY_FILE")
+        files = "SEQ_FILE_1 SEQ_FILE_2 CIGARS_FILE"
+    wrappedString = wrappedString.replace("CIGARS_FILE", "OUTPUT_FILE")
+    return "python %s --cacheDir %s --blastString \"%s\" %s" % (os.path.abspath(__file__).replace(".pyc", ".py"),
+                                                               cacheDir, wrappedString.replace("\"", "\\\""), files)
+
+def main():
+    parser = OptionParser(usage="%prog [options] (SEQ_FILE_1 SEQ_FILE_2 | --self SEQ_FILE) CIGARS_FILE")
+    parser.add_option("--cacheDir", dest="cacheDir")
+    parser.add_option("--blastString", dest="blastString")
+    parser.add_option("--self", dest="selfBlast", action="store_true", default=False)
+    parser.add_option("--check", dest="check", action="store_true", default=False,
+                      help="Check that the cached blast of SEQ_FILE_1 against SEQ_FILE_2 gives the cigars of the uncached blast")
+    options, args = parser.parse_args()
+
+    if options.check:
+        if len(args) != 2:
+            raise RuntimeError("Expected two sequence files: %s" % " ".join(args))
+        tempDir = getTempDirectory()
+        try:
+            if not checkCachedBlast(options.blastString, args[0], args[1], tempDir):
+                raise RuntimeError("The cached blast of %s against %s differs from the uncached blast" % (args[1], args[0]))
+        finally:
+            shutil.rmtree(tempDir)
+        print "The cached blast gives the cigars of the uncached blast"
+        return
+
+    cache = BlastCache(options.cacheDir)
+    outputFile = args[-1]
+    tempDir = os.path.split(os.path.abspath(outputFile))[0]
+    if options.selfBlast:
+        if len(args) != 2:
+            raise RuntimeError("Expected a sequence file and an output file: %s" % " ".join(args))
+        lines = cachedSelfBlast(cache, options.blastString, args[0], tempDir)
+    else:
+        if len(args) != 3:
+            raise RuntimeError("Expected two sequence files and an output file: %s" % " ".join(args))
+        lines = cachedPairwiseBlast(cache, options.blastString, args[0], args[1], tempDir)
+    fileHandle = open(outputFile, 'w')
+    fileHandle.write("".join(lines))
+    fileHandle.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Lib for staging a cactus disk from the shared output volume to node local scratch, so the
+stats programs run on an alignment read a local copy rather than each reading the
+database cold over the network.
+
+A tmpfs dir is used when the disk is small enough, else the local temp dir of the target.
+A disk is only staged if it is under the maximum size and a dir has room for it, so larger
+disks are read in place.
+"""
+
+import os
+import shutil
+import tempfile
+
+from sonLib.bioio import logger
+
+from referenceScripts.bin.alignmentCache import getDirSize
+
+def getFreeSpace(path):
+    """Returns the bytes available to a non-root user on the file system of the path.
+    """
+    stats = os.statvfs(path)
+    return stats.f_bavail * stats.f_frsize
+
+def getStagingDir(size, candidateDirs, maxSize, margin=0.1):
+    """Returns the first of a list of (dir, maxSize) pairs that takes a disk of the given size
+    and has room for it, leaving the margin, or None if the disk should be read in place.
+    """
+    if size > maxSize:
+        return None
+    for stagingDir, dirMaxSize in candidateDirs:
+        if stagingDir != None and os.path.isdir(stagingDir) and size <= dirMaxSize and \
+           getFreeSpace(stagingDir) > size * (1.0 + margin):
+            return stagingDir
+    return None
+
+def stageCactusDisk(alignment, candidateDirs, maxSize):
+    """Copies the cactus disk to the first suitable candidate dir (see getStagingDir), returning
+    the path of the copy, or None if it was not staged.
+    """
+    size = getDirSize(alignment)
+    stagingDir = getStagingDir(size, candidateDirs, maxSize)
+    if stagingDir == None:
+        logger.info("Reading the cactus disk %s of %i bytes in place" % (alignment, size))
+        return None
+    tempDir = tempfile.mkdtemp(prefix="stagedCactusDisk", dir=stagingDir)
+    stagedAlignment = os.path.join(tempDir, os.path.split(alignment)[-1])
+    try:
+        if os.path.isdir(alignment):
+            shutil.copytree(alignment, stagedAlignment)
+        else:
+            shutil.copy2(alignment, stagedAlignment)
+    except (IOError, OSError), e:
+        #E.g. the dir filled up since its free space was checked
+        logger.info("Failed to stage the cactus disk %s in %s, reading it in place: %s" % (alignment, stagingDir, e))
+        shutil.rmtree(tempDir, ignore_errors=True)
+        return None
+    logger.info("Staged the cactus disk %s of %i bytes in %s" % (alignment, size, stagedAlignment))
+    return stagedAlignment
+
+def unstageCactusDisk(stagedAlignment):
+    """Removes a copy made by stageCactusDisk.
+    """
+    shutil.rmtree(os.path.split(stagedAlignment)[0], ignore_errors=True)
@@ -4,10 +4,12 @@
 """
 
 import os
+import shutil
 import xml.etree.ElementTree as ET
 import xml
 import sys
 from optparse import OptionParser
+from multiprocessing.pool import ThreadPool
 
 from jobTree.scriptTree.target import Target 
 from jobTree.scriptTree.stack import Stack
@@ -15,17 +17,17 @@ from jobTree.scriptTree.stack import Stack
 from sonLib.bioio import logger
 from sonLib.bioio import setLoggingFromOptions
 
-from cactus.shared.config import CactusWorkflowExperiment
-from cactus.shared.common import runCactusWorkflow
-
-from cactusTools.shared.common import runCactusTreeStats
-from cactusTools.shared.common import runCactusMAFGenerator
-
 from sonLib.bioio import getTempFile, getTempDirectory
 from sonLib.bioio import fastaRead, fastaWrite
-from sonLib.bioio import system
 
-from jobTree.test.jobTree.jobTreeTest import runJobTreeStatusAndFailIfNotComplete
+from referenceScripts.bin.alignmentCache import AlignmentCache, getDirSize
+from referenceScripts.bin.backends import getBackend
+from referenceScripts.bin.cactusDiskStaging import stageCactusDisk, unstageCactusDisk
+from referenceScripts.src.scripts.outputManifest import getFingerprint, getCodeVersion, makeManifest, writeManifest, getStaleReason
+from referenceScripts.bin.cachedBlast import getCachedBlastString
+from referenceScripts.bin.stepTimings import StepTimings
+from referenceScripts.src.scripts.statsAggregation import SnpAggregator, IndelAggregator, writeAllAggregates, getAggregatesFile
+from referenceScripts.src.scripts.compressedIO import compressions, getAvailableCompression, getCompressedFileName, stripCompressionSuffix, compressFile
 
 def getRootPathString():
     """
@@ -39,6 +41,35 @@ def getRootPathString():
 def getCactusDiskString(alignmentFile):
     return "<st_kv_database_conf type=\"tokyo_cabinet\"><tokyo_cabinet database_dir=\"%s\"/></st_kv_database_conf>" % alignmentFile
 
+def getAlignmentResources(sequences, options):
+    """Returns the (threads, memory) to give the alignment of the given sequence files, sized by
+    the total sequence length and the number of samples unless overridden by the options.
+    """
+    sequenceFiles = sequences.split()
+    totalSize = sum([ os.path.getsize(i) for i in sequenceFiles if os.path.exists(i) ])
+    #The blast phase is all against all, so there is useful work for a thread per sample
+    threads = max(1, min(len(sequenceFiles), int(options.maxThreadsPerTarget)))
+    if options.alignmentThreads != None:
+        threads = int(options.alignmentThreads)
+    memory = max(2000000000, int(float(options.alignmentMemoryPerBase) * totalSize))
+    if options.alignmentMemory != None:
+        memory = int(options.alignmentMemory)
+    return threads, memory
+
+def getStepTimings(target):
+    """Returns the recorder of the steps of a target, which are written to its output dir.
+    """
+    return StepTimings(target.outputDir, target.__class__.__name__)
+
+def getStatsMemory(alignment, options):
+    """Returns the memory to give a stats program, sized by the cactus disk it reads unless overridden.
+    """
+    if options.statsMemory != None:
+        return int(options.statsMemory)
+    if not os.path.exists(alignment):
+        return 4000000000
+    return max(1000000000, 2*getDirSize(alignment))
+
 class MakeAlignment(Target):
     """Target runs the alignment.
     """
@@ -48,8 +79,10 @@ class MakeAlignment(Target):
                  singleCopySpecies,
                  referenceAlgorithm, minimumBlockDegree, 
                  blastAlignmentString, baseLevel, maxNumberOfChains, permutations,
-                 theta, useSimulatedAnnealing, heldOutSequence, pruneOutStubAlignments, gapGamma):
-        Target.__init__(self, cpu=1, memory=4000000000)
+                 theta, useSimulatedAnnealing, heldOutSequence, pruneOutStubAlignments, gapGamma,
+                 baseAlignment=None):
+        self.threads, memory = getAlignmentResources(sequences, options)
+        Target.__init__(self, cpu=self.threads, memory=memory)
         self.sequences = sequences
         self.requiredSpecies = requiredSpecies
         self.singleCopySpecies = singleCopySpecies
@@ -66,50 +99,114 @@ class MakeAlignment(Target):
         self.heldOutSequence = heldOutSequence
         self.pruneOutStubAlignments = pruneOutStubAlignments
         self.gapGamma = gapGamma
+        self.baseAlignment = baseAlignment
     
-    def run(self):
+    buildReference = True
+    
+    def getPhasesString(self):
+        """Returns the phases of the workflow the alignment runs, which its config does not determine,
+        as a base alignment has the config of its first variant.
+        """
+        return "setupAndBuildAlignments=%s buildReference=%s" % (self.baseAlignment == None, self.buildReference)
+    
+    def getConfig(self):
+        """Makes the cactus config for the alignment.
+        """
+        config = ET.parse(os.path.join(getRootPathString(), "lib", "cactus_workflow_config.xml")).getroot()
+        
+        #Set the reference algorithm
+        config.find("reference").attrib["matching_algorithm"] = self.referenceAlgorithm
+        
+        #Do the minimum block degree configuration
+        iterations = config.find("alignment").find("iterations")
+        blastIteration = iterations.findall("iteration")[0]
+        baseIteration = iterations.findall("iteration")[1]
+        
+        minimumBlastBlockDegree = self.minimumBlockDegree
+        if minimumBlastBlockDegree <= 1:
+            minimumBlastBlockDegree = 2
+        blastIteration.find("core").attrib["minimumBlockDegree"] = str(minimumBlastBlockDegree)
+        baseIteration.attrib["minimumBlockDegree"] = str(self.minimumBlockDegree)
+        baseIteration.attrib["prune_out_stub_alignments"] = str(int(self.pruneOutStubAlignments))
+        baseIteration.attrib["gap_gamma"] = str(float(self.gapGamma))
+        
+        #Set the blast string
+        blastIteration.find("blast").attrib["blastString"] = blastIteration.find("blast").attrib["blastString"].replace("PARAMETERS", self.blastAlignmentString)
+        blastIteration.find("blast").attrib["selfBlastString"] = blastIteration.find("blast").attrib["selfBlastString"].replace("PARAMETERS", self.blastAlignmentString)
+        
+        #Reuse the blast results of earlier alignments that share sequences, if asked
+        if self.options.blastCacheDir != None:
+            blast = blastIteration.find("blast")
+            blast.attrib["blastString"] = getCachedBlastString(blast.attrib["blastString"], self.options.blastCacheDir)
+            blast.attrib["selfBlastString"] = getCachedBlastString(blast.attrib["selfBlastString"], self.options.blastCacheDir, selfBlast=True)
+        
+        #Get rid of the base level, if needed
+        if not self.baseLevel:
+            iterations.remove(baseIteration)
+        
+        #Set the number of chains to allow in a level, during promotion
+        config.find("normal").attrib["max_number_of_chains"] = str(self.maxNumberOfChains)
+        
+        #Set the number of chains to order per round of the matching algorithm
+        config.find("reference").attrib["permutations"]  = str(self.permutations)
+        
+        #Set the chain weight function
+        if bool(self.useSimulatedAnnealing):
+            config.find("reference").attrib["useSimulatedAnnealing"]="1"
+            
+        config.find("reference").attrib["theta"] = str(self.theta)
+        return config
+    
+    def buildAlignment(self, cactusAlignmentName, tempConfigFile):
+        """Runs the cactus workflow, moving the alignment and its supporting files to the output dir.
+        """
+        outputFile = os.path.join(self.outputDir, cactusAlignmentName)
+        timings = getStepTimings(self)
+        backend = getBackend(self.options)
+        #Make the supporting temporary files
+        tempExperimentFile = os.path.join(self.getLocalTempDir(), "experiment.xml")
+        tempJobTreeDir = os.path.join(self.getLocalTempDir(), "jobTree")
+        #Make the experiment file
+        backend.writeExperimentFile(tempExperimentFile,
+                                    sequences=self.sequences.split(), 
+                                    newickTreeString=self.options.newickTree, 
+                                    requiredSpecies=[ (1, self.requiredSpecies.split() ) ],
+                                    singleCopySpecies=self.singleCopySpecies,
+                                    outgroupEvent = self.options.outgroupEvent,
+                                    databaseName=cactusAlignmentName,
+                                    outputDir=self.getLocalTempDir(),
+                                    configFile=tempConfigFile)
+        localCactusDisk = os.path.join(self.getLocalTempDir(), cactusAlignmentName)
+        if self.baseAlignment != None:
+            #Start from a copy of the alignment phase, which is shared with other reference parameters
+            timings.system("copyBaseAlignment", "cp -r %s %s" % (self.baseAlignment, localCactusDisk))
+        #Now run cactus workflow
+        timings.call("runCactusWorkflow", backend.runCactusWorkflow, experimentFile=tempExperimentFile, jobTreeDir=tempJobTreeDir, 
+                     setupAndBuildAlignments=(self.baseAlignment == None),
+                     buildTrees=False, buildFaces=False, buildReference=self.buildReference,
+                     batchSystem="single_machine", maxThreads=self.threads, jobTreeStats=True)
+        logger.info("Ran the workflow")
+        #Check if the jobtree completed sucessively.
+        timings.call("checkJobTree", backend.checkJobTree, tempJobTreeDir)
+        logger.info("Checked the job tree dir")
+        #Now copy the true assembly back to the output
+        timings.system("moveExperiment", "mv %s %s/experiment.xml" % (tempExperimentFile, self.outputDir))
+        timings.system("moveConfig", "mv %s %s/config.xml" % (tempConfigFile, self.outputDir))
+        #Move the final db
+        timings.system("moveCactusDisk", "mv %s %s" % (localCactusDisk, outputFile))
+        #Compute the stats
+        timings.system("jobTreeStats", backend.getJobTreeStatsCommand(tempJobTreeDir, os.path.join(self.outputDir, "jobTreeStats.xml")))
+    
+    def makeAlignment(self):
+        """Makes the alignment in the output dir, if not already present, returning its path.
+        """
         if not os.path.isdir(self.outputDir):
             os.mkdir(self.outputDir)
         cactusAlignmentName = "cactusAlignment"
         outputFile = os.path.join(self.outputDir, cactusAlignmentName)
         if not os.path.exists(outputFile):
-            config = ET.parse(os.path.join(getRootPathString(), "lib", "cactus_workflow_config.xml")).getroot()
-            
-            #Set the reference algorithm
-            config.find("reference").attrib["matching_algorithm"] = self.referenceAlgorithm
-            
-            #Do the minimum block degree configuration
-            iterations = config.find("alignment").find("iterations")
-            blastIteration = iterations.findall("iteration")[0]
-            baseIteration = iterations.findall("iteration")[1]
-            
-            minimumBlastBlockDegree = self.minimumBlockDegree
-            if minimumBlastBlockDegree <= 1:
-                minimumBlastBlockDegree = 2
-            blastIteration.find("core").attrib["minimumBlockDegree"] = str(minimumBlastBlockDegree)
-            baseIteration.attrib["minimumBlockDegree"] = str(self.minimumBlockDegree)
-            baseIteration.attrib["prune_out_stub_alignments"] = str(int(self.pruneOutStubAlignments))
-            baseIteration.attrib["gap_gamma"] = str(float(self.gapGamma))
-            
-            #Set the blast string
-            blastIteration.find("blast").attrib["blastString"] = blastIteration.find("blast").attrib["blastString"].replace("PARAMETERS", self.blastAlignmentString)
-            blastIteration.find("blast").attrib["selfBlastString"] = blastIteration.find("blast").attrib["selfBlastString"].replace("PARAMETERS", self.blastAlignmentString)
-            
-            #Get rid of the base level, if needed
-            if not self.baseLevel:
-                iterations.remove(baseIteration)
-            
-            #Set the number of chains to allow in a level, during promotion
-            config.find("normal").attrib["max_number_of_chains"] = str(self.maxNumberOfChains)
-            
-            #Set the number of chains to order per round of the matching algorithm
-            config.find("reference").attrib["permutations"]  = str(self.permutations)
-            
-            #Set the chain weight function
-            if bool(self.useSimulatedAnnealing):
-                config.find("reference").attrib["useSimulatedAnnealing"]="1"
-                
-            config.find("reference").attrib["theta"] = str(self.theta)
+            timings = getStepTimings(self)
+            config = timings.call("getConfig", self.getConfig)
             
             #Write the config file
             tempConfigFile = os.path.join(self.getLocalTempDir(), "config.xml")
@@ -118,74 +215,155 @@ class MakeAlignment(Target):
             tree.write(fileHandle)
             fileHandle.close()
             
-            #Make the supporting temporary files
-            tempExperimentFile = os.path.join(self.getLocalTempDir(), "experiment.xml")
-            tempJobTreeDir = os.path.join(self.getLocalTempDir(), "jobTree")
-            #Make the experiment file
-            cactusWorkflowExperiment = CactusWorkflowExperiment(
-                                                 sequences=self.sequences.split(), 
-                                                 newickTreeString=self.options.newickTree, 
-                                                 requiredSpecies=[ (1, self.requiredSpecies.split() ) ],
-                                                 singleCopySpecies=self.singleCopySpecies,
-                                                 outgroupEvent = self.options.outgroupEvent,
-                                                 databaseName=cactusAlignmentName,
-                                                 outputDir=self.getLocalTempDir(),
-                                                 configFile=tempConfigFile)
-            cactusWorkflowExperiment.writeExperimentFile(tempExperimentFile)
-            #Now run cactus workflow
-            runCactusWorkflow(experimentFile=tempExperimentFile, jobTreeDir=tempJobTreeDir, 
-                              setupAndBuildAlignments=True,
-                              buildTrees=False, buildFaces=False, buildReference=True,
-                              batchSystem="single_machine", maxThreads=1, jobTreeStats=True)
-            logger.info("Ran the workflow")
-            #Check if the jobtree completed sucessively.
-            runJobTreeStatusAndFailIfNotComplete(tempJobTreeDir)
-            logger.info("Checked the job tree dir")
-            #Now copy the true assembly back to the output
-            system("mv %s %s/experiment.xml" % (tempExperimentFile, self.outputDir))
-            system("mv %s %s/config.xml" % (tempConfigFile, self.outputDir))
-            #Copy across the final alignment
-            localCactusDisk = os.path.join(self.getLocalTempDir(), cactusAlignmentName)
-            #Move the final db
-            system("mv %s %s" % (localCactusDisk, outputFile))
-            #Compute the stats
-            system("jobTreeStats --jobTree %s --outputFile %s/jobTreeStats.xml" % (tempJobTreeDir, self.outputDir))
+            if self.options.alignmentCacheDir == None:
+                self.buildAlignment(cactusAlignmentName, tempConfigFile)
+            else:
+                #The alignment goes last, as its presence marks the output dir as complete
+                cachedFiles = ("config.xml", "experiment.xml", "jobTreeStats.xml", cactusAlignmentName)
+                cache = AlignmentCache(self.options.alignmentCacheDir, self.options.alignmentCacheSize, 
+                                       useLinks=self.options.alignmentCacheUseLinks)
+                cacheKey = cache.getKey(ET.tostring(config), self.sequences.split(), self.options.newickTree,
+                                        self.requiredSpecies, self.singleCopySpecies, self.options.outgroupEvent,
+                                        getBackend(self.options).getToolVersionString(), self.getPhasesString())
+                if not timings.call("fetchFromAlignmentCache", cache.fetch, cacheKey, self.outputDir, cachedFiles):
+                    self.buildAlignment(cactusAlignmentName, tempConfigFile)
+                    timings.call("storeInAlignmentCache", cache.store, cacheKey, self.outputDir, cachedFiles)
             #We're done!
+        return outputFile
+    
+    def run(self):
+        outputFile = self.makeAlignment()
         self.addChildTarget(MakeStats(outputFile, self.outputDir, self.options))
 
-def makeHeldOutAlignments(self, options, outputDir, requiredSpecies,
-                 singleCopySpecies,
-                 referenceAlgorithm, minimumBlockDegree, 
-                 blastAlignmentString, baseLevel, maxNumberOfChains, permutations,
-                 theta, useSimulatedAnnealing, pruneOutStubAlignments, gapGamma):
+class MakeBaseAlignment(MakeAlignment):
+    """Target runs the alignment phase shared by a set of alignments that differ only
+    in the parameters of the reference phase, then makes each of those alignments from it.
+    """
+    def __init__(self, options,
+                 sequences, 
+                 outputDir, requiredSpecies,
+                 singleCopySpecies, minimumBlockDegree, 
+                 blastAlignmentString, baseLevel, heldOutSequence, pruneOutStubAlignments, gapGamma,
+                 variants):
+        #The reference parameters of the first variant are only used to fill out the config
+        referenceAlgorithm, maxNumberOfChains, permutations, theta, useSimulatedAnnealing = variants[0][1:]
+        MakeAlignment.__init__(self, options, sequences, outputDir, requiredSpecies, singleCopySpecies, 
+                               referenceAlgorithm, minimumBlockDegree, blastAlignmentString, baseLevel, 
+                               maxNumberOfChains, permutations, theta, useSimulatedAnnealing, 
+                               heldOutSequence, pruneOutStubAlignments, gapGamma)
+        self.variants = variants
+    
+    buildReference = False
+    
+    def run(self):
+        variantAlignments = [ os.path.join(variant[0], "cactusAlignment") for variant in self.variants ]
+        if False in [ os.path.exists(i) for i in variantAlignments ]:
+            baseAlignment = self.makeAlignment()
+        else:
+            #The variants are all made, so won't copy the base alignment
+            baseAlignment = os.path.join(self.outputDir, "cactusAlignment")
+        for outputDir, referenceAlgorithm, maxNumberOfChains, permutations, theta, useSimulatedAnnealing in self.variants:
+            self.addChildTarget(MakeAlignment(self.options, self.sequences, outputDir, 
+                                              self.requiredSpecies, self.singleCopySpecies,
+                                              referenceAlgorithm, self.minimumBlockDegree, 
+                                              self.blastAlignmentString, self.baseLevel, maxNumberOfChains, permutations,
+                                              theta, useSimulatedAnnealing, self.heldOutSequence, 
+                                              self.pruneOutStubAlignments, self.gapGamma, baseAlignment=baseAlignment))
+        self.setFollowOnTarget(RemoveBaseAlignment(baseAlignment))
+
+class RemoveBaseAlignment(Target):
+    """Target removes the cactus disk of a base alignment once the alignments built from it
+    are made. The rest of its output dir is kept, as its jobTreeStats.xml holds the time
+    taken to build it (see jobTreeStatsAnalysis.py).
+    """
+    def __init__(self, baseAlignment):
+        Target.__init__(self)
+        self.baseAlignment = baseAlignment
+    
+    def run(self):
+        if os.path.isdir(self.baseAlignment):
+            shutil.rmtree(self.baseAlignment)
+        elif os.path.exists(self.baseAlignment):
+            os.remove(self.baseAlignment)
+
+def makeHeldOutAlignments(self, options, baseOutputDir, variants, requiredSpecies,
+                 singleCopySpecies, minimumBlockDegree, 
+                 blastAlignmentString, baseLevel, pruneOutStubAlignments, gapGamma):
+    """Adds the alignments for each variant of the reference parameters, given as tuples of
+    (outputDir, referenceAlgorithm, maxNumberOfChains, permutations, theta, useSimulatedAnnealing),
+    and their held out versions. Where there is more than one variant the alignment phase
+    is built once, in the base output dir, and shared between them. The cactus disk of the
+    base is removed once they are made.
+    """
+    def addAlignments(sequences, suffix, requiredSpecies, singleCopySpecies, heldOutSequence):
+        suffixedVariants = [ (variant[0] + suffix,) + tuple(variant[1:]) for variant in variants ]
+        if len(suffixedVariants) == 1:
+            outputDir, referenceAlgorithm, maxNumberOfChains, permutations, theta, useSimulatedAnnealing = suffixedVariants[0]
+            self.addChildTarget(MakeAlignment(options, 
+                          sequences,
+                          outputDir, requiredSpecies,
+                          singleCopySpecies,
+                          referenceAlgorithm, minimumBlockDegree, 
+                          blastAlignmentString, baseLevel, maxNumberOfChains, permutations,
+                          theta, useSimulatedAnnealing, heldOutSequence, pruneOutStubAlignments, gapGamma))
+        else:
+            self.addChildTarget(MakeBaseAlignment(options, 
+                          sequences,
+                          baseOutputDir + suffix, requiredSpecies,
+                          singleCopySpecies, minimumBlockDegree, 
+                          blastAlignmentString, baseLevel, heldOutSequence, pruneOutStubAlignments, gapGamma,
+                          suffixedVariants))
+    
     nullSequence = os.path.join(self.getGlobalTempDir(), "nullSequence.fa")
     open(nullSequence, 'w').close()
     for heldoutSequence in self.options.heldOutSequences.split():
-        heldOutOutputDir = outputDir + "_" + heldoutSequence
         def fn(i):
             if heldoutSequence == i.split("/")[-1]:
                 return nullSequence
             return i
         heldOutSequences = " ".join([ fn(i) for i in options.haplotypeSequences.split() ])
-        #print "NULL", nullSequence
-        #print "heldoutsequences", heldOutSequences
-        #sys.exit()
         heldOutRequiredSpecies = " ".join([ i for i in requiredSpecies.split() if i != heldoutSequence ])
         heldOutSingleCopySpecies = " ".join([ i for i in singleCopySpecies.split() if i != heldoutSequence ])
-        self.addChildTarget(MakeAlignment(options, 
-                      heldOutSequences,
-                      heldOutOutputDir, heldOutRequiredSpecies,
-                      heldOutSingleCopySpecies,
-                      referenceAlgorithm, minimumBlockDegree, 
-                      blastAlignmentString, baseLevel, maxNumberOfChains, permutations,
-                      theta, useSimulatedAnnealing, heldoutSequence, pruneOutStubAlignments, gapGamma))
-    self.addChildTarget(MakeAlignment(options, 
-                  options.haplotypeSequences,
-                  outputDir, requiredSpecies,
-                  singleCopySpecies,
-                  referenceAlgorithm, minimumBlockDegree, 
-                  blastAlignmentString, baseLevel, maxNumberOfChains, permutations,
-                  theta, useSimulatedAnnealing, None, pruneOutStubAlignments, gapGamma))
+        addAlignments(heldOutSequences, "_" + heldoutSequence, heldOutRequiredSpecies, heldOutSingleCopySpecies, heldoutSequence)
+    addAlignments(options.haplotypeSequences, "", requiredSpecies, singleCopySpecies, None)
+
+def getAlignmentGroups(options):
+    """Returns the keys of the groups of alignments of the sweep, in order, and a dict of each key 
+    to the (outputDir, referenceAlgorithm, maxNumberOfChains, permutations, theta, useSimulatedAnnealing)
+    of the variants of the group, which differ only in the parameters of the reference phase.
+    """
+    alignmentGroups = {}
+    alignmentGroupKeys = []
+    for gapGamma in options.gapGamma.split():
+        for pruneOutStubAlignments in (True,): # False):
+            singleCopySpeciesCount = 0
+            for singleCopySpecies in options.singleCopySpecies.split("%"):
+                singleCopySpeciesCount += 1
+                for requiredSpecies in (options.requiredSpecies,):
+                    for referenceAlgorithm in options.referenceAlgorithms.split():
+                        for minimumBlockDegree in [ int(i) for i in options.rangeOfMinimumBlockDegrees.split() ]:
+                            blastAlignmentStrings = options.blastAlignmentStrings.split("%")
+                            for blastAlignmentStringIndex in xrange(len(blastAlignmentStrings)):
+                                for baseLevel in [ bool(int(i)) for i in options.baseLevel.split() ]:
+                                    for maxNumberOfChains in [ int(i) for i in options.maxNumberOfChains.split() ]:
+                                        for permutations in [ int(i) for i in options.permutations.split() ]:
+                                            for theta in [ float(i) for i in options.theta.split() ]:
+                                                for useSimulatedAnnealing in [ bool(int(i)) for i in options.useSimulatedAnnealing.split() ]:
+                                                    os.path.exists(options.outputDir)
+                                                    def fn(i, string="required-species"):
+                                                        if i == None:
+                                                            return "no-%s" % string
+                                                        return string
+                                                    jobOutputDir = "%s-%s-%s-%s-%s-%s-%s-%s-%s-%s-%s-%s" % (fn(requiredSpecies), fn(singleCopySpecies, "single-copy-species_%i" % singleCopySpeciesCount), referenceAlgorithm, minimumBlockDegree, blastAlignmentStringIndex, baseLevel, maxNumberOfChains, permutations, theta, useSimulatedAnnealing, pruneOutStubAlignments, gapGamma)
+                                                    absJobOutputDir = os.path.join(options.outputDir, jobOutputDir)
+                                                    baseOutputDir = "baseAlignment-%s-%s-%s-%s-%s-%s-%s" % (fn(requiredSpecies), fn(singleCopySpecies, "single-copy-species_%i" % singleCopySpeciesCount), minimumBlockDegree, blastAlignmentStringIndex, baseLevel, pruneOutStubAlignments, gapGamma)
+                                                    key = (baseOutputDir, requiredSpecies, singleCopySpecies, minimumBlockDegree, 
+                                                           blastAlignmentStrings[blastAlignmentStringIndex], baseLevel, pruneOutStubAlignments, gapGamma)
+                                                    if key not in alignmentGroups:
+                                                        alignmentGroups[key] = []
+                                                        alignmentGroupKeys.append(key)
+                                                    alignmentGroups[key].append((absJobOutputDir, referenceAlgorithm, maxNumberOfChains, permutations, theta, useSimulatedAnnealing))
+    return alignmentGroupKeys, alignmentGroups
 
 class MakeAlignments(Target):
     """Makes alignments using pipeline.
@@ -195,125 +373,309 @@ class MakeAlignments(Target):
         self.options = options
     
     def run(self):
-        statsFiles = []
-        statsNames = []
-        for gapGamma in self.options.gapGamma.split():
-            for pruneOutStubAlignments in (True,): # False):
-                singleCopySpeciesCount = 0
-                for singleCopySpecies in self.options.singleCopySpecies.split("%"):
-                    singleCopySpeciesCount += 1
-                    for requiredSpecies in (self.options.requiredSpecies,):
-                        for referenceAlgorithm in self.options.referenceAlgorithms.split():
-                            for minimumBlockDegree in [ int(i) for i in self.options.rangeOfMinimumBlockDegrees.split() ]:
-                                blastAlignmentStrings = self.options.blastAlignmentStrings.split("%")
-                                for blastAlignmentStringIndex in xrange(len(blastAlignmentStrings)):
-                                    for baseLevel in [ bool(int(i)) for i in self.options.baseLevel.split() ]:
-                                        for maxNumberOfChains in [ int(i) for i in self.options.maxNumberOfChains.split() ]:
-                                            for permutations in [ int(i) for i in self.options.permutations.split() ]:
-                                                for theta in [ float(i) for i in self.options.theta.split() ]:
-                                                    for useSimulatedAnnealing in [ bool(int(i)) for i in self.options.useSimulatedAnnealing.split() ]:
-                                                        os.path.exists(self.options.outputDir)
-                                                        def fn(i, string="required-species"):
-                                                            if i == None:
-                                                                return "no-%s" % string
-                                                            return string
-                                                        jobOutputDir = "%s-%s-%s-%s-%s-%s-%s-%s-%s-%s-%s-%s" % (fn(requiredSpecies), fn(singleCopySpecies, "single-copy-species_%i" % singleCopySpeciesCount), referenceAlgorithm, minimumBlockDegree, blastAlignmentStringIndex, baseLevel, maxNumberOfChains, permutations, theta, useSimulatedAnnealing, pruneOutStubAlignments, gapGamma)
-                                                        statsNames.append(jobOutputDir)
-                                                        absJobOutputDir = os.path.join(self.options.outputDir, jobOutputDir)
-                                                        statsFiles.append(os.path.join(absJobOutputDir, "treeStats.xml"))
-                                                        makeHeldOutAlignments(self, self.options, absJobOutputDir, 
-                                                                              requiredSpecies, singleCopySpecies, referenceAlgorithm, minimumBlockDegree, 
-                                                                              blastAlignmentStrings[blastAlignmentStringIndex], 
-                                                                              baseLevel, maxNumberOfChains, permutations, 
-                                                                              theta, useSimulatedAnnealing, pruneOutStubAlignments, gapGamma)
+        alignmentGroupKeys, alignmentGroups = getAlignmentGroups(self.options)
+        for key in alignmentGroupKeys:
+            baseOutputDir, requiredSpecies, singleCopySpecies, minimumBlockDegree, blastAlignmentString, baseLevel, pruneOutStubAlignments, gapGamma = key
+            makeHeldOutAlignments(self, self.options, os.path.join(self.options.outputDir, baseOutputDir), alignmentGroups[key], 
+                                  requiredSpecies, singleCopySpecies, minimumBlockDegree, blastAlignmentString, 
+                                  baseLevel, pruneOutStubAlignments, gapGamma)
+
+def getOutputFile(outputDir, outputFile, options):
+    """Returns the path of an output of the stats phase. The mafs, snpStats and pathStats are the 
+    largest outputs, so are compressed if asked, taking the suffix of the compression.
+    """
+    outputFile = os.path.join(outputDir, outputFile)
+    name = os.path.split(outputFile)[-1]
+    if name.endswith(".maf") or name.startswith("snpStats") or name.startswith("pathStats"):
+        return getCompressedFileName(outputFile, options.compressOutputs)
+    return outputFile
+
+def getStatsPrograms(outputDir, options):
+    """Returns the (binaryName, outputFile, specialOptions) of each stats program run on an alignment.
+    None of them depend on each other, they only read the cactus disk.
+    """
+    programs = []
+    ref1, ref2 = options.referenceSpecies.split()
+    for outputFile, program in (("coverageStats.xml", "coverageStats"), 
+                                ("copyNumberStats.xml", "copyNumberStats"),
+                                ("filterNonComponentSequences.xml", "filterNonComponentSequences")):
+        programs.append((program, getOutputFile(outputDir, outputFile, options), "--referenceEventString %s --otherReferenceEventString %s --outgroupEventString %s" % (ref1, ref2, options.outgroupEvent)))
+    for outputFile, program, specialOptions in (("contiguityStats_%s.xml", "contiguityStats", ""), 
+                                                ("pathStats_%s.xml", "pathStats", ""), 
+                                                ("pathStats_ignoreAdjacencies_%s.xml", "pathStats", "--ignoreAdjacencies"), 
+                                                ("snpStats_%s.xml", "snpStats", ""),
+                                                ("snpStats_filtered_%s.xml", "snpStats", "--ignoreFirstNBasesOfBlock 5"),
+                                                ("snpStats_%s_recurrent.xml", "snpStats", "--minimumRecurrence 2"),
+                                                ("snpStats_filtered_%s_recurrent.xml", "snpStats", "--ignoreFirstNBasesOfBlock 5 --minimumRecurrence 2")):
+        for reference in options.referenceSpecies.split():
+            programs.append((program, getOutputFile(outputDir, outputFile % reference, options), "--referenceEventString %s %s" % (reference, specialOptions)))
+    programs.append(("snpStats", getOutputFile(outputDir, "snpStatsIntersection_%s.xml" % ref1, options), "--referenceEventString %s --otherReferenceEventString %s" % (ref1, ref2)))
+    programs.append(("snpStats", getOutputFile(outputDir, "snpStatsIntersection_%s.xml" % ref2, options), "--referenceEventString %s --otherReferenceEventString %s" % (ref2, ref1)))
+    programs.append(("danielAlignment", getOutputFile(outputDir, "danielAlignment.txt", options), "--referenceEventString hg19 --otherReferenceEventString NA12891"))
+    programs.append(("sequenceCoverages", getOutputFile(outputDir, "sequenceCoverages.txt", options), "--referenceEventString reference"))
+    return programs
+
+def getAlignmentFingerprint(alignment):
+    """Returns the fingerprint of the files written with the cactus disk when it was built, rather than
+    of the disk itself, which the stats programs may touch as they read it.
+    """
+    outputDir = os.path.split(alignment)[0]
+    buildFiles = [ os.path.join(outputDir, i) for i in ("config.xml", "experiment.xml", "jobTreeStats.xml") ]
+    buildFiles = [ i for i in buildFiles if os.path.exists(i) ]
+    if len(buildFiles) == 0:
+        return getFingerprint([ alignment ])
+    return getFingerprint(buildFiles)
+
+def getScriptManifest(binaryName, specialOptions, alignmentFingerprint, options):
+    return makeManifest(binaryName, getBackend(options).getProgramVersion(binaryName), 
+                        "--minimumNsForScaffoldGap %s --sampleNumber %s %s" % (options.minimumNsForScaffoldGap, options.sampleNumber, specialOptions),
+                        { "alignment":alignmentFingerprint })
+
+def getCactusToolManifest(program, kwargs, alignmentFingerprint, options):
+    return makeManifest(program, getBackend(options).getProgramVersion(program), 
+                        " ".join([ "%s=%s" % i for i in sorted(kwargs.items()) ]), { "alignment":alignmentFingerprint })
+
+def getAggregatesManifest(statsFile, aggregatorClass):
+    return makeManifest("writeAllAggregates", getCodeVersion(writeAllAggregates), aggregatorClass.__name__, 
+                        { "stats":getFingerprint([ statsFile ]) })
+
+def getStaleStatsOutputs(alignmentFingerprint, outputDir, options, adopt=False):
+    """Returns the (outputFile, reason, methodName, args) of each stale output of the stats programs of an
+    alignment (see outputManifest.py), the method of MakeStats and its args making it. None of them
+    depend on each other.
+    """
+    staleOutputs = []
+    def fn(outputFile, manifest, methodName, args):
+        reason = getStaleReason(outputFile, manifest, adopt)
+        if reason != None:
+            staleOutputs.append((outputFile, reason, methodName, args))
+    cactusToolOutputs = [ ("treeStats.xml", "runCactusTreeStats", {}),
+                          ("alignment.maf", "runCactusMAFGenerator", {}),
+                          ("alignment_substitutionsOnly.maf", "runCactusMAFGenerator", 
+                           { "showOnlySubstitutionsWithRespectToTheReference":True }) ]
+    for outputFile, program, kwargs in cactusToolOutputs:
+        outputFile = getOutputFile(outputDir, outputFile, options)
+        fn(outputFile, getCactusToolManifest(program, kwargs, alignmentFingerprint, options), "runCactusTool", (outputFile, program, kwargs))
+    for binaryName, outputFile, specialOptions in getStatsPrograms(outputDir, options):
+        fn(outputFile, getScriptManifest(binaryName, specialOptions, alignmentFingerprint, options), "runScript", (binaryName, outputFile, specialOptions))
+    return staleOutputs
+
+def getStatsFilesAndAggregates(outputDir, options):
+    """Returns the (statsFile, aggregatorClass) of each stats file given aggregates.
+    """
+    statsFilesAndAggregates = []
+    for reference in options.referenceSpecies.split():
+        for statsFile in ("snpStats_%s.xml", "snpStats_filtered_%s.xml", "snpStats_%s_recurrent.xml", "snpStats_filtered_%s_recurrent.xml"):
+            statsFilesAndAggregates.append((getOutputFile(outputDir, statsFile % reference, options), SnpAggregator))
+        for statsFile in ("pathStats_%s.xml", "pathStats_ignoreAdjacencies_%s.xml"):
+            statsFilesAndAggregates.append((getOutputFile(outputDir, statsFile % reference, options), IndelAggregator))
+    return statsFilesAndAggregates
+
+def getStaleAggregates(outputDir, options, staleFiles=set(), adopt=False):
+    """Returns the (aggregatesFile, reason, statsFile, aggregatorClass) of each stale aggregates file of an 
+    alignment, those of the given stale stats files being stale.
+    """
+    staleAggregates = []
+    for statsFile, aggregatorClass in getStatsFilesAndAggregates(outputDir, options):
+        aggregatesFile = getAggregatesFile(statsFile)
+        if statsFile in staleFiles or not os.path.exists(statsFile):
+            reason = "input stats stale"
+        else:
+            reason = getStaleReason(aggregatesFile, getAggregatesManifest(statsFile, aggregatorClass), adopt)
+        if reason != None:
+            staleAggregates.append((aggregatesFile, reason, statsFile, aggregatorClass))
+    return staleAggregates
 
 class MakeStats(Target):
-    """Builds basic stats and the maf alignment.
+    """Builds basic stats and the maf alignment. The independent programs are run in parallel
+    as child targets, or if staging the cactus disk as threads of one target, the aggregates that 
+    depend on their outputs as a follow on. Only stale outputs are made (see outputManifest.py).
     """
-    def __init__(self, alignment, outputDir, options, cpu=1, memory=4000000000):
+    def __init__(self, alignment, outputDir, options, cpu=1, memory=None):
+        if memory == None:
+            memory = getStatsMemory(alignment, options)
         Target.__init__(self, cpu=cpu, memory=memory)
         self.alignment = alignment
         self.outputDir = outputDir
         self.options = options
+        self.alignmentFingerprint = None
+        if os.path.exists(alignment):
+            self.alignmentFingerprint = getAlignmentFingerprint(alignment)
+    
+    def getTempOutputFile(self):
+        """Returns a path in the local temp dir, unique across the threads of a target.
+        """
+        tempOutputFile = getTempFile(rootDir=self.getLocalTempDir())
+        os.remove(tempOutputFile)
+        return tempOutputFile
+    
+    def isStale(self, outputFile, manifest):
+        return getStaleReason(outputFile, manifest, self.options.adoptUnmanifestedOutputs) != None
+    
+    def moveOutput(self, timings, stepName, tempFile, outputFile, manifest):
+        """Moves the temp file made by a step to its output, compressing it first if the output is compressed,
+        then writes the manifest of the output.
+        """
+        if stripCompressionSuffix(outputFile) != outputFile:
+            compressedTempFile = self.getTempOutputFile()
+            timings.call("compress " + stepName, compressFile, tempFile, compressedTempFile, self.options.compressOutputs)
+            os.remove(tempFile)
+            tempFile = compressedTempFile
+        timings.system("move " + stepName, "mv %s %s" % (tempFile, outputFile))
+        writeManifest(outputFile, manifest)
     
     def runScript(self, binaryName, outputFile, specialOptions):
-        if not os.path.exists(outputFile):
-            tempOutputFile = getTempFile(rootDir=self.getLocalTempDir())
-            os.remove(tempOutputFile)
-            system("%s --cactusDisk '%s' --outputFile %s --minimumNsForScaffoldGap %s --sampleNumber %s %s" % 
-            (os.path.join(getRootPathString(), "bin", binaryName),
+        manifest = getScriptManifest(binaryName, specialOptions, self.alignmentFingerprint, self.options)
+        if self.isStale(outputFile, manifest):
+            tempOutputFile = self.getTempOutputFile()
+            timings = getStepTimings(self)
+            stepName = os.path.split(outputFile)[-1]
+            timings.system(stepName, "%s --cactusDisk '%s' --outputFile %s --minimumNsForScaffoldGap %s --sampleNumber %s %s" % 
+            (getBackend(self.options).getStatsCommand(binaryName),
              getCactusDiskString(self.alignment),
              tempOutputFile, 
              self.options.minimumNsForScaffoldGap, self.options.sampleNumber, specialOptions))
-            system("mv %s %s" % (tempOutputFile, outputFile))
+            self.moveOutput(timings, stepName, tempOutputFile, outputFile, manifest)
+    
+    def runCactusTool(self, outputFile, program, kwargs):
+        """Runs the named cactusTools function of the backend, e.g. runCactusTreeStats.
+        """
+        manifest = getCactusToolManifest(program, kwargs, self.alignmentFingerprint, self.options)
+        if self.isStale(outputFile, manifest):
+            tempFile = self.getTempOutputFile()
+            timings = getStepTimings(self)
+            stepName = os.path.split(outputFile)[-1]
+            timings.call(stepName, getattr(getBackend(self.options), program), tempFile, getCactusDiskString(self.alignment), **kwargs)
+            self.moveOutput(timings, stepName, tempFile, outputFile, manifest)
         
+    def getStatsJobs(self):
+        """Returns the (methodName, args) of each of the jobs making the stale outputs, 
+        none of which depend on each other.
+        """
+        jobs = []
+        for outputFile, reason, methodName, args in getStaleStatsOutputs(self.alignmentFingerprint, self.outputDir, 
+                                                                        self.options, self.options.adoptUnmanifestedOutputs):
+            logger.info("Making %s, as it is stale: %s" % (outputFile, reason))
+            if (methodName, args) not in jobs:
+                jobs.append((methodName, args))
+        return jobs
+    
+    def addStatsTargets(self, jobs):
+        """Adds a child target for each of the jobs.
+        """
+        for methodName, args in jobs:
+            self.addChildTarget(statsTargetClasses[methodName](self.alignment, self.outputDir, self.options, *args))
+    
     def run(self):
-        for outputFile, program in (("treeStats.xml", runCactusTreeStats),
-                                    ("alignment.maf", runCactusMAFGenerator),
-                                    ("alignment_substitutionsOnly.maf", runCactusMAFGenerator)):
-            outputFile = os.path.join(self.outputDir, outputFile)
-            if not os.path.exists(outputFile):
-                tempFile = os.path.join(self.getLocalTempDir(), "temp")
-                if "alignment_substitutionsOnly.maf" in outputFile:
-                    program(tempFile, getCactusDiskString(self.alignment), showOnlySubstitutionsWithRespectToTheReference=True)
-                else:
-                    program(tempFile, getCactusDiskString(self.alignment))
-                system("mv %s %s" % (tempFile, outputFile))
-        self.addChildTarget(MakeStats2(self.alignment, self.outputDir, self.options))    
-
-class MakeStats2(MakeStats):
-    def run(self):  
-        #Now build the different stats files..
-        for outputFile, program in (("coverageStats.xml", "coverageStats"), 
-                                    ("copyNumberStats.xml", "copyNumberStats"),
-                                    ("filterNonComponentSequences.xml", "filterNonComponentSequences")):
-            outputFile = os.path.join(self.outputDir, outputFile)
-            ref1, ref2 = self.options.referenceSpecies.split()
-            self.runScript(program, outputFile, "--referenceEventString %s --otherReferenceEventString %s --outgroupEventString %s" % (ref1, ref2, self.options.outgroupEvent))
-        self.addChildTarget(MakeStats3(self.alignment, self.outputDir, self.options))
-
-class MakeStats3(MakeStats):
-    def run(self):          
-        for outputFile, program, specialOptions in ( 
-                                     ("contiguityStats_%s.xml", "contiguityStats", ""), 
-                                     ):
-            for reference in self.options.referenceSpecies.split():
-                self.runScript(program, os.path.join(self.outputDir, outputFile % reference), "--referenceEventString %s %s" % (reference, specialOptions))
-        self.addChildTarget(MakeStats4(self.alignment, self.outputDir, self.options))
-
-class MakeStats4(MakeStats):
-    def run(self):          
-        for outputFile, program, specialOptions in (("pathStats_%s.xml", "pathStats", ""), 
-                                                    ("pathStats_ignoreAdjacencies_%s.xml", "pathStats", "--ignoreAdjacencies"), 
-                                                    ("snpStats_%s.xml", "snpStats", ""),
-                                                    ("snpStats_filtered_%s.xml", "snpStats", "--ignoreFirstNBasesOfBlock 5"),
-                                                    ("snpStats_%s_recurrent.xml", "snpStats", "--minimumRecurrence 2"),
-                                                    ("snpStats_filtered_%s_recurrent.xml", "snpStats", "--ignoreFirstNBasesOfBlock 5 --minimumRecurrence 2")
-                                     ):
-            for reference in self.options.referenceSpecies.split():
-                self.runScript(program, os.path.join(self.outputDir, outputFile % reference), "--referenceEventString %s %s" % (reference, specialOptions))
-        
-        for reference in self.options.referenceSpecies.split():
-            system("python %s %s" % (os.path.join(getRootPathString(), "src", "scripts", "snpIntersection.py"), os.path.join(self.outputDir, "snpStats_%s.xml") % reference))
-            system("python %s %s" % (os.path.join(getRootPathString(), "src", "scripts", "snpIntersection.py"), os.path.join(self.outputDir, "snpStats_filtered_%s.xml") % reference))
-            system("python %s %s" % (os.path.join(getRootPathString(), "src", "scripts", "snpIntersection.py"), os.path.join(self.outputDir, "snpStats_%s_recurrent.xml") % reference))
-            system("python %s %s" % (os.path.join(getRootPathString(), "src", "scripts", "snpIntersection.py"), os.path.join(self.outputDir, "snpStats_filtered_%s_recurrent.xml") % reference))
-            system("python %s %s" % (os.path.join(getRootPathString(), "src", "scripts", "indelIntersection.py"), os.path.join(self.outputDir, "pathStats_%s.xml") % reference))
-            system("python %s %s" % (os.path.join(getRootPathString(), "src", "scripts", "indelIntersection.py"), os.path.join(self.outputDir, "pathStats_ignoreAdjacencies_%s.xml") % reference))
-        
-        self.addChildTarget(MakeStats5(self.alignment, self.outputDir, self.options))      
+        jobs = self.getStatsJobs()
+        if self.options.stageCactusDisk and len(jobs) > 0:
+            self.addChildTarget(MakeStagedStats(self.alignment, self.outputDir, self.options, jobs))
+        else:
+            self.addStatsTargets(jobs)
+        self.setFollowOnTarget(MakeStatsAggregates(self.alignment, self.outputDir, self.options))
+
+class MakeCactusToolOutput(MakeStats):
+    """Runs one of the cactusTools functions on the alignment.
+    """
+    def __init__(self, alignment, outputDir, options, outputFile, program, kwargs):
+        MakeStats.__init__(self, alignment, outputDir, options)
+        self.outputFile = outputFile
+        self.program = program
+        self.kwargs = kwargs
+    
+    def run(self):
+        self.runCactusTool(self.outputFile, self.program, self.kwargs)
+
+class MakeStatsOutput(MakeStats):
+    """Runs one of the stats programs on the alignment.
+    """
+    def __init__(self, alignment, outputDir, options, binaryName, outputFile, specialOptions):
+        MakeStats.__init__(self, alignment, outputDir, options)
+        self.binaryName = binaryName
+        self.outputFile = outputFile
+        self.specialOptions = specialOptions
+    
+    def run(self):
+        self.runScript(self.binaryName, self.outputFile, self.specialOptions)
+
+statsTargetClasses = { "runCactusTool":MakeCactusToolOutput, "runScript":MakeStatsOutput }
 
-class MakeStats5(MakeStats):
-    def run(self):       
-        ref1, ref2 = self.options.referenceSpecies.split()
-        self.runScript("snpStats", os.path.join(self.outputDir, "snpStatsIntersection_%s.xml" % ref1), "--referenceEventString %s --otherReferenceEventString %s" % (ref1, ref2))
-        self.runScript("snpStats", os.path.join(self.outputDir, "snpStatsIntersection_%s.xml" % ref2), "--referenceEventString %s --otherReferenceEventString %s" % (ref2, ref1))                 
-        self.addChildTarget(MakeStats6(self.alignment, self.outputDir, self.options))
+def getStagingDirs(target, options):
+    """Returns the (dir, maxSize) pairs the cactus disk may be staged in, tmpfs first.
+    """
+    return [ (options.stagingTmpfsDir, int(options.stagingTmpfsMaxSize)), 
+             (target.getLocalTempDir(), int(options.stagingMaxSize)) ]
+
+class MakeStagedStats(MakeStats):
+    """Copies the cactus disk to node local scratch, then runs all the stats programs against
+    the copy in a pool of threads, removing it afterwards. If the disk is too large to stage
+    the programs are run in place as child targets, as without staging.
+    """
+    def __init__(self, alignment, outputDir, options, jobs):
+        memory = getStatsMemory(alignment, options)
+        if os.path.exists(alignment) and getDirSize(alignment) <= int(options.stagingTmpfsMaxSize):
+            #A copy in tmpfs is held in memory
+            memory += getDirSize(alignment)
+        MakeStats.__init__(self, alignment, outputDir, options, cpu=int(options.stagedStatsThreads), memory=memory)
+        self.jobs = jobs
+    
+    def run(self):
+        timings = getStepTimings(self)
+        stagedAlignment = timings.call("stageCactusDisk", stageCactusDisk, self.alignment, 
+                                       getStagingDirs(self, self.options), int(self.options.stagingMaxSize))
+        if stagedAlignment == None:
+            self.addStatsTargets(self.jobs)
+            return
+        #Only the programs run by this target read the copy, it is not passed to any other target
+        self.alignment = stagedAlignment
+        try:
+            pool = ThreadPool(int(self.options.stagedStatsThreads))
+            pool.map(lambda (methodName, args) : getattr(self, methodName)(*args), self.jobs, chunksize=1)
+            pool.close()
+            pool.join()
+        finally:
+            timings.call("unstageCactusDisk", unstageCactusDisk, stagedAlignment)
 
-class MakeStats6(MakeStats):
+class MakeStatsAggregates(MakeStats):
+    """Adds the aggregates across samples to the snp and path stats, once they are built,
+    for those stats files whose aggregates are stale.
+    """
     def run(self):
-        self.runScript("danielAlignment", os.path.join(self.outputDir, "danielAlignment.txt"), "--referenceEventString hg19 --otherReferenceEventString NA12891")
-        self.runScript("sequenceCoverages", os.path.join(self.outputDir, "sequenceCoverages.txt"), "--referenceEventString reference")
+        staleAggregates = getStaleAggregates(self.outputDir, self.options, adopt=self.options.adoptUnmanifestedOutputs)
+        if len(staleAggregates) > 0:
+            getStepTimings(self).call("writeAllAggregates", writeAllAggregates, 
+                                      [ (statsFile, aggregatorClass) for aggregatesFile, reason, statsFile, aggregatorClass in staleAggregates ])
+            for aggregatesFile, reason, statsFile, aggregatorClass in staleAggregates:
+                writeManifest(aggregatesFile, getAggregatesManifest(statsFile, aggregatorClass))
+
+def reportStaleOutputs(options, fileHandle=sys.stdout):
+    """Writes the outputs of the sweep that a run would make, and why, without making them.
+    """
+    alignmentNumber = 0
+    outputNumber = 0
+    staleNumber = 0
+    alignmentGroupKeys, alignmentGroups = getAlignmentGroups(options)
+    suffixes = [ "" ] + [ "_" + i for i in options.heldOutSequences.split() ]
+    for key in alignmentGroupKeys:
+        for variant in alignmentGroups[key]:
+            for suffix in suffixes:
+                outputDir = variant[0] + suffix
+                alignment = os.path.join(outputDir, "cactusAlignment")
+                alignmentNumber += 1
+                outputs = [ i[1] for i in getStatsPrograms(outputDir, options) ] + [ getAggregatesFile(i[0]) for i in getStatsFilesAndAggregates(outputDir, options) ]
+                outputs += [ getOutputFile(outputDir, "treeStats.xml", options), getOutputFile(outputDir, "alignment.maf", options),
+                             getOutputFile(outputDir, "alignment_substitutionsOnly.maf", options) ]
+                outputNumber += len(outputs)
+                if not os.path.exists(alignment):
+                    fileHandle.write("%s\tcactusAlignment\tmissing, so all %i outputs\n" % (outputDir, len(outputs)))
+                    staleNumber += len(outputs)
+                    continue
+                staleOutputs = [ i[:2] for i in getStaleStatsOutputs(getAlignmentFingerprint(alignment), outputDir, options) ]
+                staleOutputs += [ i[:2] for i in getStaleAggregates(outputDir, options, set([ i[0] for i in staleOutputs ])) ]
+                for outputFile, reason in staleOutputs:
+                    fileHandle.write("%s\t%s\t%s\n" % (outputDir, os.path.split(outputFile)[-1], reason))
+                staleNumber += len(staleOutputs)
+    fileHandle.write("%i of the %i outputs of %i alignments would be made\n" % (staleNumber, outputNumber, alignmentNumber))
            
 def main():
     ##########################################
@@ -342,6 +704,46 @@ def main():
     parser.add_option("--heldOutSequences", dest="heldOutSequences")
     parser.add_option("--outgroupEvent", dest="outgroupEvent")
     parser.add_option("--gapGamma", dest="gapGamma")
+    parser.add_option("--maxThreadsPerTarget", dest="maxThreadsPerTarget", default=32,
+                      help="Maximum number of threads to give an alignment, typically the cores of a node")
+    parser.add_option("--alignmentThreads", dest="alignmentThreads", default=None,
+                      help="Number of threads for each alignment, overriding the number sized by the sample count")
+    parser.add_option("--alignmentMemory", dest="alignmentMemory", default=None,
+                      help="Memory in bytes for each alignment, overriding the memory sized by the sequence length")
+    parser.add_option("--alignmentMemoryPerBase", dest="alignmentMemoryPerBase", default=50,
+                      help="Bytes of memory to give an alignment per base of input sequence")
+    parser.add_option("--statsMemory", dest="statsMemory", default=None,
+                      help="Memory in bytes for each stats target, overriding the memory sized by the cactus disk")
+    parser.add_option("--blastCacheDir", dest="blastCacheDir", default=None,
+                      help="Directory in which to cache blast results, so alignments sharing sequences (e.g. held out alignments) reuse them")
+    parser.add_option("--alignmentCacheDir", dest="alignmentCacheDir", default=None,
+                      help="Directory in which to cache alignments, keyed by their config, inputs and tool versions")
+    parser.add_option("--alignmentCacheSize", dest="alignmentCacheSize", default=100000000000,
+                      help="Maximum size of the alignment cache in bytes, beyond which the least recently used alignments are evicted")
+    parser.add_option("--alignmentCacheUseLinks", dest="alignmentCacheUseLinks", action="store_true", default=False,
+                      help="Hard link the xml files between the alignment cache and the output dirs rather than copying them (the cactus disk is always copied)")
+    parser.add_option("--stageCactusDisk", dest="stageCactusDisk", action="store_true", default=False,
+                      help="Copy each cactus disk to node local scratch and run its stats programs against the copy, in one target")
+    parser.add_option("--stagingMaxSize", dest="stagingMaxSize", default=100000000000,
+                      help="Bytes of the largest cactus disk to stage, larger ones are read in place")
+    parser.add_option("--stagingTmpfsDir", dest="stagingTmpfsDir", default="/dev/shm",
+                      help="tmpfs dir to stage cactus disks in when they are small enough, before the local temp dir")
+    parser.add_option("--stagingTmpfsMaxSize", dest="stagingTmpfsMaxSize", default=2000000000,
+                      help="Bytes of the largest cactus disk to stage in the tmpfs dir")
+    parser.add_option("--stagedStatsThreads", dest="stagedStatsThreads", default=4,
+                      help="Number of stats programs to run at once against a staged cactus disk")
+    parser.add_option("--compressOutputs", dest="compressOutputs", default=None,
+                      help="gzip, bgzip or zstd, to compress the mafs, snpStats and pathStats (zstd falls back to gzip if not installed, bgzip fails)")
+    parser.add_option("--adoptUnmanifestedOutputs", dest="adoptUnmanifestedOutputs", action="store_true", default=False,
+                      help="Take existing stats outputs without manifests, e.g. from before manifests were written, to be current")
+    parser.add_option("--dryRun", dest="dryRun", action="store_true", default=False,
+                      help="Report the stats outputs of built alignments that are stale, and why, rather than running the pipeline")
+    parser.add_option("--backend", dest="backend", default="cactus",
+                      help="cactus, or stub to stand in for the cactus programs with synthetic outputs (see backends.py)")
+    parser.add_option("--stubOutputSize", dest="stubOutputSize", default=1000000,
+                      help="Bytes of each output of the stub backend")
+    parser.add_option("--stubLatency", dest="stubLatency", default=0.0,
+                      help="Seconds each program of the stub backend takes")
     
     Stack.addJobTreeOptions(parser)
     
@@ -350,6 +752,17 @@ def main():
     
     if len(args) != 0:
         raise RuntimeError("Unrecognised input arguments: %s" % " ".join(args))
+    if options.compressOutputs not in compressions:
+        raise RuntimeError("Unrecognised compression: %s" % options.compressOutputs)
+    #Chosen once, so every target names the outputs the same way
+    compression = getAvailableCompression(options.compressOutputs)
+    if compression != options.compressOutputs:
+        logger.warning("%s is not installed, compressing the outputs with %s" % (options.compressOutputs, compression))
+    options.compressOutputs = compression
+    
+    if options.dryRun:
+        reportStaleOutputs(options)
+        return
     
     Stack(MakeAlignments(options)).startJobTree(options)
     logger.info("Done with job tree")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""Lib and script for recording the wall time, CPU time and peak memory of each step of
+the pipeline targets, and for ranking the most expensive steps across a sweep.
+
+Each step is appended as a line of JSON to stepTimings.jsonl in the output directory of
+its alignment. For external programs, the CPU time and peak resident set size are those of
+the program and the processes it waited for (the peak includes the memory shared with the
+target at the fork, so is an upper bound for small programs). For steps run in the target's own process,
+they are the CPU time of the process and its children during the step and the high water
+mark of their resident set sizes, which is only recorded if the step raised it, as otherwise
+it is that of an earlier step. The CPU time of a step run in a thread other than the main
+thread, e.g. by MakeStagedStats, is not recorded, as it would include that of the other threads.
+
+To rank the steps of a sweep:  stepTimings.py --outputDir output/main/foo --top 20
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import threading
+import subprocess
+from optparse import OptionParser
+
+timingsFileName = "stepTimings.jsonl"
+
+#ru_maxrss is in kilobytes, except on OS X where it is in bytes
+maxRssUnit = 1024
+if sys.platform == "darwin":
+    maxRssUnit = 1
+
+def getUsage():
+    """Returns the (cpuTime, peakRss) of this process and its waited for children so far.
+    """
+    cpuTime = 0.0
+    peakRss = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        cpuTime += usage.ru_utime + usage.ru_stime
+        peakRss = max(peakRss, usage.ru_maxrss * maxRssUnit)
+    return cpuTime, peakRss
+
+class StepTimings:
+    """Records the steps of a target in the timings file of an output directory.
+    """
+    def __init__(self, outputDir, targetName):
+        self.outputDir = outputDir
+        self.targetName = targetName
+
+    def write(self, stepName, startTime, wallTime, cpuTime, peakRss, command=None):
+        if not os.path.isdir(self.outputDir):
+            os.makedirs(self.outputDir)
+        record = { "alignment":os.path.split(os.path.abspath(self.outputDir))[-1], "target":self.targetName, "step":stepName,
+                   "start":startTime, "wallTime":wallTime, "cpuTime":cpuTime, "peakRss":peakRss }
+        if command != None:
+            record["command"] = command
+        #A single write of a short line in append mode, so lines from concurrent targets are not interleaved
+        fileHandle = open(os.path.join(self.outputDir, timingsFileName), 'a')
+        fileHandle.write(json.dumps(record, sort_keys=True) + "\n")
+        fileHandle.close()
+
+    def call(self, stepName, function, *args, **kwargs):
+        """Runs the function in this process, recording it as a step and returning its result.
+        """
+        startTime = time.time()
+        startCpuTime, startPeakRss = getUsage()
+        result = function(*args, **kwargs)
+        cpuTime, peakRss = getUsage()
+        if threading.current_thread().name == "MainThread":
+            cpuTime -= startCpuTime
+        else: #The usage is of the whole process, so includes that of any concurrent threads
+            cpuTime = None
+        if peakRss <= startPeakRss: #The high water mark was reached before the step
+            peakRss = None
+        self.write(stepName, startTime, time.time() - startTime, cpuTime, peakRss)
+        return result
+
+    def system(self, stepName, command):
+        """Runs the command, as sonLib's system does, recording it as a step.
+        """
+        startTime = time.time()
+        process = subprocess.Popen(command, shell=True, bufsize=-1, stdout=sys.stdout, stderr=sys.stderr)
+        pid, status, usage = os.wait4(process.pid, 0)
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+        self.write(stepName, startTime, time.time() - startTime, usage.ru_utime + usage.ru_stime,
+                   usage.ru_maxrss * maxRssUnit, command)
+        if process.returncode != 0:
+            raise RuntimeError("Command: %s exited with non-zero status %i" % (command, process.returncode))
+
+def readTimings(outputDir):
+    """Yields the records of every timings file under the output dir.
+    """
+    for dirPath, dirNames, fileNames in os.walk(outputDir):
+        dirNames[:] = [ i for i in dirNames if i != "cactusAlignment" ]
+        if timingsFileName in fileNames:
+            fileHandle = open(os.path.join(dirPath, timingsFileName), 'r')
+            for line in fileHandle:
+                if line.strip() != "":
+                    yield json.loads(line)
+            fileHandle.close()
+
+def rollup(records, key):
+    """Returns a list of (total, number, maximum, target, step) for each step, by total of the key, largest first.
+    Records without the key, e.g. the CPU time of a step run in a thread or the peak
+    memory of a step that did not raise it, are skipped.
+    """
+    steps = {}
+    for record in records:
+        if record[key] == None:
+            continue
+        step = (record["target"], record["step"])
+        total, number, maximum = steps.get(step, (0.0, 0, 0.0))
+        steps[step] = (total + record[key], number + 1, max(maximum, record[key]))
+    rolledUp = [ (total, number, maximum, target, step) for (target, step), (total, number, maximum) in steps.items() ]
+    rolledUp.sort(reverse=True)
+    return rolledUp
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--outputDir", dest="outputDir", help="The output directory of the sweep")
+    parser.add_option("--sortBy", dest="sortBy", default="wallTime", help="wallTime, cpuTime or peakRss")
+    parser.add_option("--top", dest="top", type="int", default=20, help="Number of steps and of individual runs to show")
+    options, args = parser.parse_args()
+    if options.outputDir == None or options.sortBy not in ("wallTime", "cpuTime", "peakRss"):
+        parser.print_help()
+        sys.exit(1)
+
+    records = list(readTimings(options.outputDir))
+    print "Steps by total %s, across %i runs" % (options.sortBy, len(records))
+    print "\t".join(("total", "runs", "mean", "max", "target", "step"))
+    for total, number, maximum, target, step in rollup(records, options.sortBy)[:options.top]:
+        print "%.2f\t%i\t%.2f\t%.2f\t%s\t%s" % (total, number, total/number, maximum, target, step)
+    print
+    print "Most expensive runs by %s" % options.sortBy
+    print "\t".join(("wallTime", "cpuTime", "peakRss", "alignment", "target", "step"))
+    records = [ record for record in records if record[options.sortBy] != None ]
+    records.sort(key=lambda record : record[options.sortBy], reverse=True)
+    for record in records[:options.top]:
+        cpuTime = "-"
+        if record["cpuTime"] != None:
+            cpuTime = "%.2f" % record["cpuTime"]
+        peakRss = "-"
+        if record["peakRss"] != None:
+            peakRss = "%i" % record["peakRss"]
+        print "%.2f\t%s\t%s\t%s\t%s\t%s" % (record["wallTime"], cpuTime, peakRss,
+                                           record["alignment"], record["target"], record["step"])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Lib for reading and writing files that may be compressed.
+
+Inputs are opened through openInput, which detects gzip (including bgzip, whose blocks
+are gzip members) and zstd from the first bytes of the file, whatever its name, and
+decompresses as it is read. Outputs are written through openOutput with a compression of
+None, "gzip", "bgzip" or "zstd", compressed files being named with the .gz or .zst
+suffix. bgzip and zstd use the bgzip and zstd programs. zstd falls back to gzip where
+it is not installed (see getAvailableCompression), but bgzip does not, as a gzip file
+would have the same suffix but can't be indexed.
+
+To check that each available compression reads back:  compressedIO.py
+"""
+
+import os
+import sys
+import gzip
+import tempfile
+import shutil
+import subprocess
+from distutils.spawn import find_executable
+
+compressions = (None, "gzip", "bgzip", "zstd")
+compressionSuffixes = { "gzip":".gz", "bgzip":".gz", "zstd":".zst" }
+gzipMagic = "\x1f\x8b"
+zstdMagic = "\x28\xb5\x2f\xfd"
+
+class PipeFile:
+    """The end of a pipe to or from a (de)compression program, as a file. Closing it waits
+    for the program, raising an error if it failed.
+    """
+    def __init__(self, command, fileHandle, mode):
+        self.command = command
+        if 'r' in mode:
+            self.process = subprocess.Popen(command, stdin=fileHandle, stdout=subprocess.PIPE, bufsize=-1)
+            self.pipe = self.process.stdout
+        else:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=fileHandle, bufsize=-1)
+            self.pipe = self.process.stdin
+        fileHandle.close() #The program has its own copy
+
+    def __getattr__(self, name):
+        return getattr(self.pipe, name)
+
+    def __iter__(self):
+        return iter(self.pipe.readline, "")
+
+    def close(self):
+        self.pipe.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("Command: %s exited with non-zero status %i" % (" ".join(self.command), self.process.returncode))
+
+def getCompression(fileName):
+    """Returns "gzip" or "zstd" if the file is compressed, from its first bytes, else None.
+    """
+    fileHandle = open(fileName, 'rb')
+    magic = fileHandle.read(4)
+    fileHandle.close()
+    if magic[:2] == gzipMagic:
+        return "gzip"
+    if magic == zstdMagic:
+        return "zstd"
+    return None
+
+def isCompressed(fileName):
+    return getCompression(fileName) != None
+
+def isAvailable(compression):
+    return compression in (None, "gzip") or find_executable(compression) != None
+
+def getAvailableCompression(compression):
+    """Returns the compression, or gzip if it is zstd and zstd is not installed. Raises an error
+    if it is bgzip and bgzip is not installed.
+    """
+    if not isAvailable(compression):
+        if compression == "bgzip":
+            raise RuntimeError("bgzip is not installed, so can't write bgzip compressed files")
+        return "gzip"
+    return compression
+
+def getCompressedFileName(fileName, compression):
+    """Returns the name of the file with the suffix of the compression, if any.
+    """
+    if compression == None:
+        return fileName
+    return fileName + compressionSuffixes[compression]
+
+def stripCompressionSuffix(fileName):
+    for suffix in set(compressionSuffixes.values()):
+        if fileName.endswith(suffix):
+            return fileName[:-len(suffix)]
+    return fileName
+
+def openInput(fileName):
+    """Opens a file for reading, decompressing it if it is compressed.
+    """
+    compression = getCompression(fileName)
+    if compression == "gzip":
+        return gzip.open(fileName, 'rb')
+    if compression == "zstd":
+        return PipeFile([ "zstd", "-q", "-d", "-c" ], open(fileName, 'rb'), 'r')
+    return open(fileName, 'r')
+
+def openOutput(fileName, compression=None):
+    """Opens a file for writing, compressing what is written with the given compression.
+    """
+    compression = getAvailableCompression(compression)
+    if compression == None:
+        return open(fileName, 'w')
+    if compression == "gzip":
+        return gzip.open(fileName, 'wb', 6)
+    if compression == "bgzip":
+        return PipeFile([ "bgzip", "-c" ], open(fileName, 'wb'), 'w')
+    if compression == "zstd":
+        return PipeFile([ "zstd", "-q", "-c" ], open(fileName, 'wb'), 'w')
+    raise RuntimeError("Unrecognised compression: %s" % compression)
+
+def readBack(compression, data):
+    """Writes the data to a temp file with the compression, returning the compression detected
+    in the file and the data read back from it.
+
+    >>> data = "".join([ "line %i\\n" % i for i in xrange(100000) ])
+    >>> [ (i, readBack(i, data)) for i in compressions if isAvailable(i) and readBack(i, data) != ({ "bgzip":"gzip" }.get(i, i), data) ]
+    []
+    """
+    fileHandle, tempFile = tempfile.mkstemp()
+    os.close(fileHandle)
+    try:
+        fileHandle = openOutput(tempFile, compression)
+        fileHandle.write(data)
+        fileHandle.close()
+        fileHandle = openInput(tempFile)
+        readData = "".join([ line for line in fileHandle ])
+        fileHandle.close()
+        return getCompression(tempFile), readData
+    finally:
+        os.remove(tempFile)
+
+def compressFile(inputFile, outputFile, compression):
+    """Writes a copy of the (uncompressed) input file with the given compression.
+    """
+    inputHandle = open(inputFile, 'rb')
+    outputHandle = openOutput(outputFile, compression)
+    shutil.copyfileobj(inputHandle, outputHandle, 1000000)
+    outputHandle.close()
+    inputHandle.close()
+
+def _test():
+    import doctest
+    return doctest.testmod()
+
+if __name__ == '__main__':
+    sys.exit(_test().failed)
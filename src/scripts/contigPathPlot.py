@@ -1,13 +1,15 @@
 import sys
-import xml.etree.ElementTree as ET
 import matplotlib.pyplot as plt
+from statsStore import getStatsForSamples, parseDatabaseOption
+
+database, args = parseDatabaseOption(sys.argv[1:])
 
 #Run command: python2.7-32 ~/sync/eclipse/git/referenceScripts/src/scripts/contigPathPlot.py results1/pathStats_reference.xml 1 results2/pathStats_reference.xml 2 results3/pathStats_reference.xml 3 results4/pathStats_reference.xml 4 results5/pathStats_reference.xml 5 results6/pathStats_reference.xml 6 results7/pathStats_reference.xml 7 results8/pathStats_reference.xml 8 results1/pathStats_hg19.xml hg19
 
-results = [ (j, [ (k.attrib["sampleName"], k.attrib["contigPathN50"]) \
-                 for k in ET.parse(i).getroot().findall("statsForSample") \
-                 if k.attrib["sampleName"] not in ("", "reference", "hg19", "ROOT") ]) \
-           for i, j in zip(sys.argv[1::2], sys.argv[2::2]) ]
+results = [ (j, [ (k["sampleName"], k["contigPathN50"]) \
+                 for k in getStatsForSamples(i, database) \
+                 if k["sampleName"] not in ("", "reference", "hg19", "ROOT") ]) \
+           for i, j in zip(args[0::2], args[1::2]) ]
 
 for i, j in results:
     j.sort()
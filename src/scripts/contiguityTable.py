@@ -1,67 +1,84 @@
 import sys
 from tex import *
-import xml.etree.ElementTree as ET
+from statsStore import getStatsForSamples, parseDatabaseOption
 
-ref = ET.parse(sys.argv[1]).getroot()
-hg19 = ET.parse(sys.argv[2]).getroot()
-fileHandle = open(sys.argv[3], 'w')
+def loadContiguityStats(statsFile, database=None):
+    """Returns a dict of each sample name in a contiguityStats file to the attributes of its statsForSample element.
+    """
+    samples = {}
+    for i in getStatsForSamples(statsFile, database):
+        if i["sampleName"] not in samples:
+            samples[i["sampleName"]] = i
+    return samples
 
-writeDocumentPreliminaries(fileHandle)
-writePreliminaries(5, fileHandle)
+def writeContiguityTable(ref, hg19, fileHandle):
+    """Writes the table, given the loaded contiguity stats with respect to the reference and hg19.
+    """
+    writeDocumentPreliminaries(fileHandle)
+    writePreliminaries(5, fileHandle)
 
-def fn(x):
-    return "%.2f" % (100*x)
+    def fn(x):
+        return "%.2f" % (100*x)
 
-#writeRow(("samples", "sequence", "\% mapped", "\% mapped and contiguous", "\% contigious that mapped"), fileHandle)
+    #writeRow(("samples", "sequence", "\% mapped", "\% mapped and contiguous", "\% contigious that mapped"), fileHandle)
 
-writeLine(5, 1, (("Contiguity Statistics", 0, 4, 0, 0),), fileHandle)
+    writeLine(5, 1, (("Contiguity Statistics", 0, 4, 0, 0),), fileHandle)
 
-writeLine(5, 2, (("Samples", 0, 0, 0, 1), 
-              ("Reference", 1, 1, 0, 1), 
-              ("\% M.", 2, 2, 0, 1),
-              ("\% M. \& C.", 3, 3, 0, 1),
-              ("\% C. w. M.", 4, 4, 0, 1)), fileHandle)
+    writeLine(5, 2, (("Samples", 0, 0, 0, 1), 
+                  ("Reference", 1, 1, 0, 1), 
+                  ("\% M.", 2, 2, 0, 1),
+                  ("\% M. \& C.", 3, 3, 0, 1),
+                  ("\% C. w. M.", 4, 4, 0, 1)), fileHandle)
 
-samples = [ i.attrib["sampleName"] for i in ref.findall("statsForSample") if i.attrib["sampleName"] not in ("hg19", "reference", "", "ROOT")]
-samples.sort()
+    samples = [ i for i in ref.keys() if i not in ("hg19", "reference", "", "ROOT")]
+    samples.sort()
 
-refTotalSamples = 0.0
-refTotalAligned = 0.0
-refTotalContiguous = 0.0
-hg19TotalSamples = 0.0
-hg19TotalAligned = 0.0
-hg19TotalContiguous = 0.0
+    refTotalSamples = 0.0
+    refTotalAligned = 0.0
+    refTotalContiguous = 0.0
+    hg19TotalSamples = 0.0
+    hg19TotalAligned = 0.0
+    hg19TotalContiguous = 0.0
 
-for sample in samples:
-    refSample = [ i for i in ref.findall("statsForSample") if i.attrib["sampleName"] == sample ][0]
-    hg19Sample = [ i for i in hg19.findall("statsForSample") if i.attrib["sampleName"] == sample ][0]
-    refTotalSamples += float(refSample.attrib["totalSamples"])
-    refTotalAligned += float(refSample.attrib["totalAligned"])
-    refTotalContiguous += float(refSample.attrib["totalCorrect"])
-    hg19TotalSamples += float(hg19Sample.attrib["totalSamples"])
-    hg19TotalAligned += float(hg19Sample.attrib["totalAligned"])
-    hg19TotalContiguous += float(hg19Sample.attrib["totalCorrect"])
-    writeLine(5, 2, ((sample, 0, 0, 0, 1), 
-                     ("reference", 1, 1, 0, 0), 
-                     ("hg19", 1, 1, 1, 1), 
-                     (fn(float(refSample.attrib["totalAligned"])/float(refSample.attrib["totalSamples"])), 2, 2, 0, 0), 
-                     (fn(float(hg19Sample.attrib["totalAligned"])/float(hg19Sample.attrib["totalSamples"])), 2, 2, 1, 1),
-                     (fn(float(refSample.attrib["correctPerSample"])), 3, 3, 0, 0), 
-                     (fn(float(hg19Sample.attrib["correctPerSample"])), 3, 3, 1, 1),
-                     (fn(float(refSample.attrib["correctPerAligned"])), 4, 4, 0, 0), 
-                     (fn(float(hg19Sample.attrib["correctPerAligned"])), 4, 4, 1, 1),
-                     ), fileHandle, trailingLines=1)
+    for sample in samples:
+        refSample = ref[sample]
+        hg19Sample = hg19[sample]
+        refTotalSamples += float(refSample["totalSamples"])
+        refTotalAligned += float(refSample["totalAligned"])
+        refTotalContiguous += float(refSample["totalCorrect"])
+        hg19TotalSamples += float(hg19Sample["totalSamples"])
+        hg19TotalAligned += float(hg19Sample["totalAligned"])
+        hg19TotalContiguous += float(hg19Sample["totalCorrect"])
+        writeLine(5, 2, ((sample, 0, 0, 0, 1), 
+                         ("reference", 1, 1, 0, 0), 
+                         ("hg19", 1, 1, 1, 1), 
+                         (fn(float(refSample["totalAligned"])/float(refSample["totalSamples"])), 2, 2, 0, 0), 
+                         (fn(float(hg19Sample["totalAligned"])/float(hg19Sample["totalSamples"])), 2, 2, 1, 1),
+                         (fn(float(refSample["correctPerSample"])), 3, 3, 0, 0), 
+                         (fn(float(hg19Sample["correctPerSample"])), 3, 3, 1, 1),
+                         (fn(float(refSample["correctPerAligned"])), 4, 4, 0, 0), 
+                         (fn(float(hg19Sample["correctPerAligned"])), 4, 4, 1, 1),
+                         ), fileHandle, trailingLines=1)
 
-writeLine(5, 2, (("aggregate", 0, 0, 0, 1), 
-                     ("C. Ref.", 1, 1, 0, 0), 
-                     ("GRCh37", 1, 1, 1, 1), 
-                     (fn(refTotalAligned/refTotalSamples), 2, 2, 0, 0), 
-                     (fn(hg19TotalAligned/hg19TotalSamples), 2, 2, 1, 1),
-                     (fn(refTotalContiguous/refTotalSamples), 3, 3, 0, 0), 
-                     (fn(hg19TotalContiguous/hg19TotalSamples), 3, 3, 1, 1),
-                     (fn(refTotalContiguous/refTotalAligned), 4, 4, 0, 0), 
-                     (fn(hg19TotalContiguous/hg19TotalAligned), 4, 4, 1, 1),
-                     ), fileHandle, trailingLines=1)
+    writeLine(5, 2, (("aggregate", 0, 0, 0, 1), 
+                         ("C. Ref.", 1, 1, 0, 0), 
+                         ("GRCh37", 1, 1, 1, 1), 
+                         (fn(refTotalAligned/refTotalSamples), 2, 2, 0, 0), 
+                         (fn(hg19TotalAligned/hg19TotalSamples), 2, 2, 1, 1),
+                         (fn(refTotalContiguous/refTotalSamples), 3, 3, 0, 0), 
+                         (fn(hg19TotalContiguous/hg19TotalSamples), 3, 3, 1, 1),
+                         (fn(refTotalContiguous/refTotalAligned), 4, 4, 0, 0), 
+                         (fn(hg19TotalContiguous/hg19TotalAligned), 4, 4, 1, 1),
+                         ), fileHandle, trailingLines=1)
 
-writeEnd(fileHandle, "contiguityTable", "Statistics on correct contiguity.")
-writeDocumentEnd(fileHandle)
\ No newline at end of file
+    writeEnd(fileHandle, "contiguityTable", "Statistics on correct contiguity.")
+    writeDocumentEnd(fileHandle)
+
+def main():
+    database, args = parseDatabaseOption(sys.argv[1:])
+    fileHandle = open(args[2], 'w')
+    writeContiguityTable(loadContiguityStats(args[0], database), loadContiguityStats(args[1], database), fileHandle)
+    fileHandle.close()
+
+if __name__ == '__main__':
+    main()
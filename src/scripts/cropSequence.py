@@ -1,9 +1,10 @@
 import sys
 import xml.etree.ElementTree as ET
 from sonLib.bioio import fastaRead, fastaWrite
-node = ET.parse(sys.argv[1]).getroot()
+from compressedIO import openInput
+node = ET.parse(openInput(sys.argv[1])).getroot()
 fH = open(sys.argv[3], 'w')
-seqs = [ i for i in fastaRead(open(sys.argv[2], 'r')) ]
+seqs = [ i for i in fastaRead(openInput(sys.argv[2])) ]
 assert(len(seqs) == 1)
 for name, sequence in seqs:
     #>hg19.chr6.171115067.28377796.5150977.1
@@ -0,0 +1,107 @@
+"""Lib for reading and writing fasta files in fixed size chunks, so that
+memory use is bounded by the chunk size rather than the record length.
+"""
+
+def fastaReadChunks(fileHandle, chunkSize=1000000):
+    """Iterates through a fasta file yielding (name, sequenceChunk) pairs.
+
+    A record always starts with a (name, "") pair, followed by (name, chunk) pairs
+    for successive pieces of its sequence, with whitespace removed. Names are
+    the header lines minus the leading '>', as with sonLib's fastaRead.
+    """
+    name = None
+    buffer = ""
+    while True:
+        data = fileHandle.read(chunkSize)
+        if data == "":
+            break
+        buffer += data
+        while True:
+            i = buffer.find(">")
+            if i == -1:
+                if name != None:
+                    chunk = buffer.translate(None, " \t\r\n")
+                    if chunk != "":
+                        yield name, chunk
+                buffer = ""
+                break
+            if i > 0 and name != None:
+                chunk = buffer[:i].translate(None, " \t\r\n")
+                if chunk != "":
+                    yield name, chunk
+            buffer = buffer[i:]
+            j = buffer.find("\n")
+            while j == -1: #The header runs past the end of the buffer
+                data = fileHandle.read(chunkSize)
+                if data == "":
+                    j = len(buffer)
+                    break
+                buffer += data
+                j = buffer.find("\n")
+            name = buffer[1:j]
+            buffer = buffer[j+1:]
+            yield name, ""
+
+def fastaReadRecords(fileHandle, chunkSize=1000000):
+    """Iterates through a fasta file yielding (name, chunks) pairs, where chunks is an
+    iterator over the sequence of the record in pieces of at most chunkSize.
+    Any part of a chunk iterator not consumed is skipped when moving to the next record.
+    """
+    reader = fastaReadChunks(fileHandle, chunkSize)
+    nextName = [ None ]
+    def chunks():
+        for name, chunk in reader:
+            if chunk == "":
+                nextName[0] = name
+                return
+            yield chunk
+    for name, chunk in reader:
+        nextName[0] = name
+        break
+    while nextName[0] != None:
+        name = nextName[0]
+        nextName[0] = None
+        recordChunks = chunks()
+        yield name, recordChunks
+        for chunk in recordChunks:
+            pass
+
+def fastaRecordLengths(fileHandle, chunkSize=1000000):
+    """Returns a list of (name, sequenceLength) pairs for the records in the file.
+    """
+    lengths = []
+    for name, chunk in fastaReadChunks(fileHandle, chunkSize):
+        if chunk == "":
+            lengths.append([ name, 0 ])
+        else:
+            lengths[-1][1] += len(chunk)
+    return [ tuple(i) for i in lengths ]
+
+class FastaChunkWriter:
+    """Writes fasta records a chunk at a time, with the same line width as
+    sonLib's fastaWrite.
+    """
+    def __init__(self, fileHandle, lineWidth=100):
+        self.fileHandle = fileHandle
+        self.lineWidth = lineWidth
+        self.linePosition = 0
+
+    def writeHeader(self, name):
+        self.finishRecord()
+        self.fileHandle.write(">%s\n" % name)
+
+    def writeChunk(self, chunk):
+        i = 0
+        while i < len(chunk):
+            j = i + self.lineWidth - self.linePosition
+            self.fileHandle.write(chunk[i:j])
+            self.linePosition += len(chunk[i:j])
+            if self.linePosition == self.lineWidth:
+                self.fileHandle.write("\n")
+                self.linePosition = 0
+            i = j
+
+    def finishRecord(self):
+        if self.linePosition > 0:
+            self.fileHandle.write("\n")
+            self.linePosition = 0
@@ -1,16 +1,57 @@
+"""Writes the blocks of a MAF file (see mafIO.py) that have three rows, one of which is from hg19,
+optionally only those touching the given regions (see mafIndex.py).
+
+With more than one process an uncompressed file is split into shards that are filtered
+in parallel, then merged in order.
+"""
+
 import sys
-l = []
-fH = open(sys.argv[2], 'w')
-for line in open(sys.argv[1], 'r').readlines():
-    if line[:1] == 'a':
-        if len(l) == 4 and "hg19" in " ".join(l):
-            print "making block"
-            for i in l:
-                fH.write(i)
-            fH.write("\n")
+from optparse import OptionParser
+from mafIO import writeMafBlock, getShards, readShardBlocks, mapShards, getShardTempFile, appendFile
+from mafIndex import readBlocks
+
+def isValidBlock(block):
+    return len(block.lines) == 3 and "hg19" in " ".join([ row.src for row in block.getRows() ])
+
+def filterBlocks(blocks, fH, logHandle):
+    for block in blocks:
+        if isValidBlock(block):
+            logHandle.write("making block\n")
+            writeMafBlock(fH, block)
         else:
-            print "invalid block", len(l)
-        l = [ line ]
-    elif line[:1] == 's':
-        l.append(line)
-fH.close()
\ No newline at end of file
+            logHandle.write("invalid block %i\n" % (len(block.lines) + 1))
+
+def filterShard((mafFile, start, end, tempFile, tempLogFile)):
+    fH = open(tempFile, 'w')
+    logHandle = open(tempLogFile, 'w')
+    filterBlocks(readShardBlocks(mafFile, start, end), fH, logHandle)
+    fH.close()
+    logHandle.close()
+
+def filterShards(mafFile, outputFile, processes):
+    shards = getShards(mafFile, processes * 4)
+    jobs = [ (mafFile, start, end, getShardTempFile(outputFile, i), getShardTempFile(outputFile + ".log", i)) for i, (start, end) in enumerate(shards) ]
+    mapShards(filterShard, jobs, processes)
+    fH = open(outputFile, 'w')
+    for mafFile, start, end, tempFile, tempLogFile in jobs:
+        appendFile(fH, tempFile)
+        appendFile(sys.stdout, tempLogFile)
+    fH.close()
+
+def main():
+    parser = OptionParser(usage="%prog [options] input.maf output.maf")
+    parser.add_option("--region", dest="regions", action="append", default=[], help="Only blocks touching this region, as sequence:start-end")
+    parser.add_option("--processes", dest="processes", type="int", default=1, help="Filter shards of the file in parallel")
+    options, args = parser.parse_args()
+    if len(args) != 2:
+        parser.print_help()
+        return
+    if options.processes > 1 and len(options.regions) == 0:
+        filterShards(args[0], args[1], options.processes)
+        return
+    fH = open(args[1], 'w')
+    filterBlocks(readBlocks(args[0], options.regions), fH, sys.stdout)
+    fH.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,10 @@
 import sys
 import xml.etree.ElementTree as ET
 from sonLib.bioio import fastaRead, fastaWrite
-i = set([ i for i in ET.parse(sys.argv[1]).getroot().text.split() ])
+from compressedIO import openInput
+i = set([ i for i in ET.parse(openInput(sys.argv[1])).getroot().text.split() ])
 fH = open(sys.argv[3], 'w')
-for name, sequence in fastaRead(open(sys.argv[2], 'r')):
+for name, sequence in fastaRead(openInput(sys.argv[2])):
         if name not in i:
             fastaWrite(fH, name, sequence)
 fH.close()
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""Summarises the jobTreeStats.xml files of every alignment under an output directory.
+
+For each cactus target class it gives the number of targets run and their total, mean
+and maximum time and memory, across the sweep. Each alignment directory's total time is
+related to the sweep parameters encoded in its name (see statsStore.py), giving for each
+parameter setting the mean time of the alignments using it relative to the mean of all of
+them, so the settings that blow up runtime stand out. Where the alignment phase of a group
+of alignments was built once in a base alignment directory, the base's time is attributed
+to each of the alignments built from it, and the base is given its own line in the output.
+
+The stats files hold the times of the targets but not the dependencies between them, so
+the critical path is approximated. The alignments of a sweep run in parallel, so the sweep
+is bounded by its slowest alignment, including the base alignment it was built from, and
+within each of these the slowest target of each class is a lower bound on the time that
+class adds to the path.
+
+Either the raw stats, with a target element per target, or the summary made by the
+jobTreeStats command, with an element per target class under target_types, are read.
+"""
+
+import os
+import sys
+import json
+import xml.etree.ElementTree as ET
+from optparse import OptionParser
+
+from statsStore import getSweepParameters, sweepParameterNames, getBaseParameters, baseParameterNames
+from compressedIO import openInput
+
+def getFloat(attrib, name):
+    try:
+        return float(attrib.get(name, 0.0))
+    except ValueError:
+        return 0.0
+
+class TargetClassStats:
+    """The number, time, clock and memory of the targets of a class.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.number = 0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+        self.totalClock = 0.0
+        self.maxMemory = 0.0
+
+    def add(self, number, totalTime, maxTime, totalClock, maxMemory):
+        self.number += number
+        self.totalTime += totalTime
+        self.maxTime = max(self.maxTime, maxTime)
+        self.totalClock += totalClock
+        self.maxMemory = max(self.maxMemory, maxMemory)
+
+class AlignmentStats:
+    """The parsed jobTreeStats of an alignment directory.
+    """
+    def __init__(self, statsFile):
+        self.alignmentDir = os.path.split(os.path.abspath(statsFile))[0]
+        self.name = os.path.split(self.alignmentDir)[-1]
+        self.parameters = getSweepParameters(self.alignmentDir)
+        self.baseParameters = getBaseParameters(self.alignmentDir)
+        self.baseAlignment = None #The AlignmentStats of the base alignment it was built from, if any
+        self.targetClasses = {}
+        root = ET.parse(openInput(statsFile)).getroot()
+        targetTypes = root.find("target_types")
+        if targetTypes != None:
+            for element in targetTypes:
+                self.getTargetClass(element.tag).add(int(getFloat(element.attrib, "total_number")),
+                                                     getFloat(element.attrib, "total_time"), getFloat(element.attrib, "max_time"),
+                                                     getFloat(element.attrib, "total_clock"), getFloat(element.attrib, "max_memory"))
+        else:
+            for element in root.iter("target"):
+                time = getFloat(element.attrib, "time")
+                self.getTargetClass(element.attrib.get("class", "unknown")).add(1, time, time, getFloat(element.attrib, "clock"),
+                                                                               getFloat(element.attrib, "memory"))
+        targetTime = sum([ i.totalTime for i in self.targetClasses.values() ])
+        #The wall time of the whole job tree, if recorded, else the sum of the target times
+        self.totalTime = getFloat(root.attrib, "total_time") or targetTime
+        self.totalClock = getFloat(root.attrib, "total_clock") or sum([ i.totalClock for i in self.targetClasses.values() ])
+
+    def getTargetClass(self, name):
+        if name not in self.targetClasses:
+            self.targetClasses[name] = TargetClassStats(name)
+        return self.targetClasses[name]
+
+    def getPathTime(self):
+        """The time of the alignment including that of the base alignment it was built from.
+        """
+        if self.baseAlignment == None:
+            return self.totalTime
+        return self.totalTime + self.baseAlignment.totalTime
+
+    def getPathClock(self):
+        if self.baseAlignment == None:
+            return self.totalClock
+        return self.totalClock + self.baseAlignment.totalClock
+
+def loadAlignmentStats(outputDir):
+    """Returns the AlignmentStats of every jobTreeStats.xml file under the output dir, linking each
+    alignment to the base alignment in the same dir it was built from, if any.
+    """
+    alignments = []
+    for dirPath, dirNames, fileNames in os.walk(outputDir):
+        dirNames[:] = [ i for i in dirNames if i != "cactusAlignment" ]
+        dirNames.sort()
+        if "jobTreeStats.xml" in fileNames:
+            alignments.append(AlignmentStats(os.path.join(dirPath, "jobTreeStats.xml")))
+    baseAlignments = {}
+    for alignment in alignments:
+        if alignment.baseParameters != None:
+            key = (os.path.split(alignment.alignmentDir)[0],) + tuple([ alignment.baseParameters[i] for i in baseParameterNames ])
+            baseAlignments[key] = alignment
+    for alignment in alignments:
+        if alignment.parameters != None:
+            key = (os.path.split(alignment.alignmentDir)[0],) + tuple([ alignment.parameters[i] for i in baseParameterNames ])
+            alignment.baseAlignment = baseAlignments.get(key)
+    return alignments
+
+def getTargetClassSummary(alignments):
+    """Returns the TargetClassStats of each target class across the alignments, by total time, largest first.
+    """
+    targetClasses = {}
+    for alignment in alignments:
+        for i in alignment.targetClasses.values():
+            if i.name not in targetClasses:
+                targetClasses[i.name] = TargetClassStats(i.name)
+            targetClasses[i.name].add(i.number, i.totalTime, i.maxTime, i.totalClock, i.maxMemory)
+    summary = targetClasses.values()
+    summary.sort(key=lambda i : i.totalTime, reverse=True)
+    return summary
+
+def getParameterSummary(alignments):
+    """Returns a list of (relativeTime, parameter, value, alignmentNumber, meanTime, meanClock) for each setting
+    of each sweep parameter, relativeTime being the mean time of the alignments with the setting over
+    that of all alignments, largest first. The time of an alignment includes that of its base alignment.
+    """
+    alignments = [ i for i in alignments if i.parameters != None ]
+    if len(alignments) == 0:
+        return []
+    meanTime = sum([ i.getPathTime() for i in alignments ]) / len(alignments)
+    summary = []
+    for parameter in sweepParameterNames:
+        settings = {}
+        for alignment in alignments:
+            settings.setdefault(alignment.parameters[parameter], []).append(alignment)
+        if len(settings) < 2: #Not varied in the sweep
+            continue
+        for value, settingAlignments in settings.items():
+            settingTime = sum([ i.getPathTime() for i in settingAlignments ]) / len(settingAlignments)
+            settingClock = sum([ i.getPathClock() for i in settingAlignments ]) / len(settingAlignments)
+            summary.append((settingTime / meanTime if meanTime > 0 else 0.0, parameter, value, len(settingAlignments), settingTime, settingClock))
+    summary.sort(reverse=True)
+    return summary
+
+def getCriticalPath(alignments):
+    """Returns the slowest alignment, including the time of its base alignment, and the (alignment, targetClasses)
+    of its base alignment, if any, then of itself, the target classes by the time of their slowest target, largest first.
+    """
+    alignments = [ i for i in alignments if i.baseParameters == None ] #Base alignments are on the path of their alignments
+    if len(alignments) == 0:
+        return None, []
+    slowest = max(alignments, key=lambda i : i.getPathTime())
+    phases = []
+    for alignment in (slowest.baseAlignment, slowest):
+        if alignment != None:
+            targetClasses = alignment.targetClasses.values()
+            targetClasses.sort(key=lambda i : i.maxTime, reverse=True)
+            phases.append((alignment, targetClasses))
+    return slowest, phases
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--outputDir", dest="outputDir", help="The output directory of the sweep")
+    parser.add_option("--top", dest="top", type="int", default=20, help="Number of rows of each section to show")
+    parser.add_option("--format", dest="format", default="tsv", help="tsv or json")
+    options, args = parser.parse_args()
+    if options.outputDir == None:
+        parser.print_help()
+        sys.exit(1)
+
+    alignments = loadAlignmentStats(options.outputDir)
+    targetClasses = getTargetClassSummary(alignments)
+    parameters = getParameterSummary(alignments)
+    slowest, criticalPhases = getCriticalPath(alignments)
+
+    if options.format == "json":
+        def fn(i):
+            return { "targetClass":i.name, "number":i.number, "totalTime":i.totalTime, "maxTime":i.maxTime,
+                     "totalClock":i.totalClock, "maxMemory":i.maxMemory }
+        json.dump({ "alignments":[ { "name":i.name, "totalTime":i.totalTime, "totalClock":i.totalClock, "parameters":i.parameters,
+                                     "baseAlignment":i.baseAlignment and i.baseAlignment.name, "pathTime":i.getPathTime() } for i in alignments ],
+                    "targetClasses":[ fn(i) for i in targetClasses ],
+                    "parameters":[ dict(zip(("relativeTime", "parameter", "value", "alignments", "meanTime", "meanClock"), i)) for i in parameters ],
+                    "criticalPath":{ "alignment":slowest and slowest.name, "pathTime":slowest and slowest.getPathTime(),
+                                     "phases":[ { "alignment":alignment.name, "totalTime":alignment.totalTime,
+                                                  "targetClasses":[ fn(i) for i in phaseTargetClasses ] } for alignment, phaseTargetClasses in criticalPhases ] } },
+                  sys.stdout, indent=1)
+        print
+    elif options.format == "tsv":
+        print "Target classes by total time, across %i alignments" % len(alignments)
+        print "\t".join(("totalTime", "targets", "meanTime", "maxTime", "totalClock", "maxMemory", "targetClass"))
+        for i in targetClasses[:options.top]:
+            print "%.2f\t%i\t%.2f\t%.2f\t%.2f\t%i\t%s" % (i.totalTime, i.number, i.totalTime/max(1, i.number), i.maxTime, i.totalClock, i.maxMemory, i.name)
+        print
+        print "Sweep parameter settings by mean alignment time, including any base alignment, relative to the mean of all alignments"
+        print "\t".join(("relativeTime", "parameter", "value", "alignments", "meanTime", "meanClock"))
+        for i in parameters[:options.top]:
+            print "%.2f\t%s\t%s\t%i\t%.2f\t%.2f" % i
+        baseAlignments = [ i for i in alignments if i.baseParameters != None ]
+        if len(baseAlignments) > 0:
+            print "Of which base alignments, shared by the alignments built from them: %i, mean time %.2f, mean clock %.2f" % \
+            (len(baseAlignments), sum([ i.totalTime for i in baseAlignments ]) / len(baseAlignments), sum([ i.totalClock for i in baseAlignments ]) / len(baseAlignments))
+        print
+        if slowest != None:
+            print "Critical path: slowest alignment %s, %.2f seconds" % (slowest.name, slowest.getPathTime())
+            for alignment, phaseTargetClasses in criticalPhases:
+                print "%s, %.2f seconds" % (alignment.name, alignment.totalTime)
+                print "\t".join(("maxTime", "totalTime", "targets", "targetClass"))
+                for i in phaseTargetClasses[:options.top]:
+                    print "%.2f\t%.2f\t%i\t%s" % (i.maxTime, i.totalTime, i.number, i.name)
+    else:
+        raise RuntimeError("Unrecognised format: %s" % options.format)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Lib for streaming the blocks of a MAF file, plain or compressed (see compressedIO.py),
+so that memory use is bounded by the largest block rather than the file.
+
+Each block keeps its 'a' line and its 's' lines as read, which are only parsed into
+rows when asked for. Other lines ('i', 'e', 'q' and comments) are skipped.
+
+Uncompressed files can also be split into shards at block boundaries, to be
+processed in parallel.
+"""
+
+import os
+from multiprocessing import Pool
+from collections import namedtuple
+
+from compressedIO import openInput, isCompressed
+
+MafRow = namedtuple("MafRow", ("src", "start", "size", "strand", "srcSize", "text", "line"))
+
+class MafBlock:
+    """The 'a' line, 's' lines and byte offset of a block in the (uncompressed) file.
+    """
+    def __init__(self, header, lines, offset):
+        self.header = header
+        self.lines = lines
+        self.offset = offset
+        self.rows = None
+
+    def getRows(self):
+        """The parsed rows of the block, in the order of its lines.
+        """
+        if self.rows == None:
+            self.rows = [ parseRow(line) for line in self.lines ]
+        return self.rows
+
+def openMaf(fileName):
+    """Opens a MAF file for reading, decompressing it if it is compressed.
+    """
+    return openInput(fileName)
+
+def parseRow(line):
+    lineType, src, start, size, strand, srcSize, text = line.split()
+    return MafRow(src, int(start), int(size), strand, int(srcSize), text, line)
+
+def readMafBlocks(fileHandle, offset=0):
+    """Iterates through the blocks of a MAF file, yielding MafBlocks. The offset is
+    that of the current position of the file handle.
+    """
+    block = None
+    lines = None #The 's' lines of the current block, or None if outside a block
+    for line in fileHandle:
+        lineType = line[:1]
+        if lineType == 's': #Tested first as by far the most common
+            if lines != None:
+                lines.append(line)
+        elif lineType == 'a':
+            if block != None:
+                yield block
+            lines = []
+            block = MafBlock(line, lines, offset)
+        elif block != None and line.strip() == "":
+            yield block
+            block = None
+            lines = None
+        offset += len(line)
+    if block != None:
+        yield block
+
+def writeMafBlock(fileHandle, block):
+    """Writes the block's lines as they were read, then a blank line.
+    """
+    fileHandle.write(block.header)
+    fileHandle.writelines(block.lines)
+    fileHandle.write("\n")
+
+def getShards(fileName, shardNumber):
+    """Splits an uncompressed MAF file into up to shardNumber (start, end) byte ranges, each
+    starting at an 'a' line, so that every block is in exactly one shard. Compressed files
+    can't be split, so are a single shard, with no end.
+    """
+    if isCompressed(fileName):
+        return [ (0, None) ]
+    fileSize = os.path.getsize(fileName)
+    if shardNumber <= 1:
+        return [ (0, fileSize) ]
+    fileHandle = open(fileName, 'r')
+    boundaries = [ 0 ]
+    for i in xrange(1, shardNumber):
+        offset = max(boundaries[-1], (fileSize * i) / shardNumber - 1)
+        fileHandle.seek(offset)
+        offset += len(fileHandle.readline()) #Move to the start of the next line
+        while True:
+            line = fileHandle.readline()
+            if line == "" or line[:1] == 'a':
+                break
+            offset += len(line)
+        if offset > boundaries[-1]:
+            boundaries.append(offset)
+    fileHandle.close()
+    boundaries.append(fileSize)
+    return [ (boundaries[i], boundaries[i+1]) for i in xrange(len(boundaries)-1) if boundaries[i] < boundaries[i+1] ]
+
+def readShardBlocks(fileName, start, end):
+    """Yields the blocks whose 'a' lines are within the byte range of the file, or
+    from the start onwards if the end is None.
+    """
+    fileHandle = openMaf(fileName)
+    if start != 0: #Only uncompressed files are split, compressed files can't seek
+        fileHandle.seek(start)
+    for block in readMafBlocks(fileHandle, start):
+        if end != None and block.offset >= end:
+            break
+        yield block
+    fileHandle.close()
+
+def mapShards(function, jobs, processes):
+    """Applies the function to each job across a pool of processes, returning the
+    results in the order of the jobs.
+    """
+    if processes <= 1 or len(jobs) <= 1:
+        return map(function, jobs)
+    pool = Pool(processes)
+    results = pool.map(function, jobs, chunksize=1)
+    pool.close()
+    pool.join()
+    return results
+
+def getShardTempFile(outputFile, shard):
+    """Temp file for the output of a shard, in the same directory as the output.
+    """
+    directory, name = os.path.split(os.path.abspath(outputFile))
+    return os.path.join(directory, ".%s.shard%i.tmp.%i" % (name, shard, os.getpid()))
+
+def appendFile(fileHandle, fileName):
+    """Copies the contents of a file onto the end of the file handle, then removes the file.
+    """
+    inputHandle = open(fileName, 'r')
+    while True:
+        data = inputHandle.read(1000000)
+        if data == "":
+            break
+        fileHandle.write(data)
+    inputHandle.close()
+    os.remove(fileName)
@@ -0,0 +1,168 @@
+"""Lib and script for a sidecar index of a MAF file, mapping the interval of each row
+of each block to the byte offset of the block, so that the blocks touching a region
+can be read without scanning the whole file.
+
+The index is an sqlite database written next to the MAF (alignment.maf.idx for
+alignment.maf) and is rebuilt whenever the size or modification time of the MAF
+changes. Intervals are in forward strand coordinates. Regions are given as
+sequence:start-end, e.g. hg19.chr6:29000000-29100000, or as a sequence name alone.
+
+Compressed MAFs can't seek to a block (see compressedIO.py), so are not indexed. Region
+queries on them scan the whole file instead.
+
+To build:  mafIndex.py alignment.maf
+"""
+
+import os
+import re
+import sys
+import sqlite3
+
+from mafIO import openMaf, readMafBlocks
+from compressedIO import isCompressed
+
+regionPattern = re.compile("^(.+):([0-9,]+)-([0-9,]+)$")
+
+def getIndexFile(mafFile):
+    return mafFile + ".idx"
+
+def getForwardInterval(row):
+    if row.strand == "-":
+        return row.srcSize - row.start - row.size, row.srcSize - row.start
+    return row.start, row.start + row.size
+
+def buildIndex(mafFile, indexFile):
+    """Indexes the rows of every block of the MAF, replacing any existing index.
+    """
+    if isCompressed(mafFile):
+        raise RuntimeError("Can't index the compressed MAF %s, decompress it first" % mafFile)
+    tempIndexFile = "%s.tmp.%i" % (indexFile, os.getpid())
+    connection = sqlite3.connect(tempIndexFile)
+    connection.execute("CREATE TABLE maf (size INTEGER, mtime REAL)")
+    connection.execute("CREATE TABLE rows (src TEXT, start INTEGER, end INTEGER, offset INTEGER)")
+    connection.execute("CREATE TABLE sequences (src TEXT PRIMARY KEY, maxLength INTEGER)")
+    connection.execute("INSERT INTO maf (size, mtime) VALUES (?, ?)", (os.path.getsize(mafFile), os.path.getmtime(mafFile)))
+    maxLengths = {}
+    fileHandle = openMaf(mafFile)
+    for block in readMafBlocks(fileHandle):
+        rows = []
+        for row in block.getRows():
+            start, end = getForwardInterval(row)
+            rows.append((row.src, start, end, block.offset))
+            maxLengths[row.src] = max(maxLengths.get(row.src, 0), end - start)
+        connection.executemany("INSERT INTO rows (src, start, end, offset) VALUES (?, ?, ?, ?)", rows)
+    fileHandle.close()
+    connection.executemany("INSERT INTO sequences (src, maxLength) VALUES (?, ?)", maxLengths.items())
+    connection.execute("CREATE INDEX rowsBySrc ON rows (src, start)")
+    connection.commit()
+    connection.close()
+    os.rename(tempIndexFile, indexFile)
+
+def isIndexCurrent(mafFile, indexFile):
+    if not os.path.exists(indexFile):
+        return False
+    connection = sqlite3.connect(indexFile)
+    try:
+        row = connection.execute("SELECT size, mtime FROM maf").fetchone()
+    except sqlite3.DatabaseError:
+        row = None
+    connection.close()
+    return row != None and row[0] == os.path.getsize(mafFile) and row[1] == os.path.getmtime(mafFile)
+
+def getIndex(mafFile):
+    """Returns a connection to the index of the MAF, building it first if missing or out of date.
+    """
+    indexFile = getIndexFile(mafFile)
+    if not isIndexCurrent(mafFile, indexFile):
+        buildIndex(mafFile, indexFile)
+    return sqlite3.connect(indexFile)
+
+def parseRegion(region):
+    """Returns the (sequence, start, end) of a region string. The start and end are None
+    if the region is a sequence name alone.
+    """
+    m = regionPattern.match(region)
+    if m == None:
+        return region, None, None
+    start, end = int(m.group(2).replace(",", "")), int(m.group(3).replace(",", ""))
+    if start >= end:
+        raise RuntimeError("Empty region: %s" % region)
+    return m.group(1), start, end
+
+def getBlockOffsets(connection, regions):
+    """Returns the sorted offsets of the blocks with a row overlapping any of the regions.
+    """
+    offsets = set()
+    for src, start, end in regions:
+        if start == None:
+            query = connection.execute("SELECT offset FROM rows WHERE src = ?", (src,))
+        else:
+            row = connection.execute("SELECT maxLength FROM sequences WHERE src = ?", (src,)).fetchone()
+            if row == None:
+                continue
+            query = connection.execute("SELECT offset FROM rows WHERE src = ? AND start >= ? AND start < ? AND end > ?",
+                                       (src, start - row[0], end, start))
+        offsets.update([ i[0] for i in query ])
+    offsets = list(offsets)
+    offsets.sort()
+    return offsets
+
+def touchesRegions(block, regions):
+    for row in block.getRows():
+        for src, start, end in regions:
+            if row.src == src:
+                if start == None:
+                    return True
+                rowStart, rowEnd = getForwardInterval(row)
+                if rowStart < end and rowEnd > start:
+                    return True
+    return False
+
+def scanRegionBlocks(mafFile, regions):
+    """Yields the blocks of the MAF touching any of the parsed regions, reading the whole file.
+    """
+    fileHandle = openMaf(mafFile)
+    for block in readMafBlocks(fileHandle):
+        if touchesRegions(block, regions):
+            yield block
+    fileHandle.close()
+
+def readRegionBlocks(mafFile, regions):
+    """Yields, in file order, the blocks of the MAF touching any of the region strings.
+    """
+    if isCompressed(mafFile):
+        for block in scanRegionBlocks(mafFile, [ parseRegion(i) for i in regions ]):
+            yield block
+        return
+    connection = getIndex(mafFile)
+    offsets = getBlockOffsets(connection, [ parseRegion(i) for i in regions ])
+    connection.close()
+    fileHandle = openMaf(mafFile)
+    for offset in offsets:
+        fileHandle.seek(offset)
+        for block in readMafBlocks(fileHandle, offset):
+            yield block
+            break
+    fileHandle.close()
+
+def readBlocks(mafFile, regions=[]):
+    """Yields the blocks of the MAF touching any of the regions, or all of them if no regions are given.
+    """
+    if len(regions) > 0:
+        for block in readRegionBlocks(mafFile, regions):
+            yield block
+    else:
+        fileHandle = openMaf(mafFile)
+        for block in readMafBlocks(fileHandle):
+            yield block
+        fileHandle.close()
+
+def main():
+    if len(sys.argv) < 2:
+        print "Usage: mafIndex.py alignment1.maf alignment2.maf ..."
+        sys.exit(1)
+    for mafFile in sys.argv[1:]:
+        buildIndex(mafFile, getIndexFile(mafFile))
+
+if __name__ == '__main__':
+    main()
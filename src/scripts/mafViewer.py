@@ -1,40 +1,102 @@
-import sys
-
-fH = open(sys.argv[2], 'w')
-seqs = sys.argv[3:]
-pL = {}
-l = []
-for line in open(sys.argv[1], 'r'):
-    if line[:2] == 'a ':
-        l.sort()
-        def fn(i):
-            for name in seqs:
-                if name in i:
-                    return True
-            return False
-        l = [ i for i in l if len(seqs) == 0 or fn(i) ]
+"""Prints the rows of each block of a MAF file (see mafIO.py), optionally only those of
+the given sequences, flagging for each row whether its sequence was in the previous block
+printed, on the same strand, and adjacent to it. Only the blocks touching the given regions
+are read, if any are given (see mafIndex.py).
+
+With more than one process an uncompressed file is split into shards that are viewed in
+parallel. The first block printed by each shard depends on the last block printed by the
+shards before it, so is printed when the shards are merged.
+"""
+
+from optparse import OptionParser
+from mafIO import parseRow, getShards, readShardBlocks, mapShards, getShardTempFile, appendFile
+from mafIndex import readBlocks
+
+def getViewRows(block, seqs):
+    """Returns the rows of the block to be printed, in the order of their sorted lines.
+    """
+    lines = block.lines[:]
+    lines.sort()
+    l = [ parseRow(line) for line in lines ]
+    return [ row for row in l if len(seqs) == 0 or True in [ name in row.src for name in seqs ] ]
+
+def viewBlock(l, pL, fH):
+    """Prints the rows of a block, given the rows of the previous block printed by
+    sequence name, returning the rows of this block by sequence name.
+    """
+    pL2 = {}
+    fH.write("%i\n" % len(l))
+    for row in l:
+        src, start, size, strand, srcSize, text, line = row
+        b = 0
+        b2 = 0
+        b3 = 0
+        pL2[src] = row
+        if src in pL:
+            b = 1
+            pSrc, pStart, pSize, pStrand = pL[src][:4]
+            if strand == pStrand:
+                b2 = 1
+                if start == pStart + pSize:
+                    b3 = 1
+        fH.write("%s\t%s\t%s\t%s\t%s\t%s\n" % \
+                 (src[:10] + " " * (10 - len(src[:10])), start, b, b2, b3, text[:30]))
+    fH.write("\n")
+    return pL2
+
+def viewBlocks(blocks, seqs, fH):
+    pL = {}
+    for block in blocks:
+        l = getViewRows(block, seqs)
         if l != []:
-            pL2 = {}
-            fH.write("%i\n" % len(l))
-            for i in l:
-                i = i.split()
-                b = 0
-                b2 = 0
-                b3 = 0
-                pL2[i[1]] = i
-                if pL.has_key(i[1]):
-                    b = 1
-                    if i[4] == pL[i[1]][4]:
-                        b2 = 1
-                        if int(i[2]) == int(pL[i[1]][2]) + int(pL[i[1]][3]):
-                            b3 = 1
-                fH.write("%s\t%s\t%i\t%i\t%i\t%s\n" % \
-                         (i[1][:10] + " " * (10 - len(i[1][:10])), i[2], b, b2, b3, i[-1][:30]))
-            fH.write("\n")
-            pL = pL2
-        l = []    
-    elif line[0] == 's':
-        l.append(line)
-fH.close()
-        
-                
\ No newline at end of file
+            pL = viewBlock(l, pL, fH)
+
+def viewShard((mafFile, start, end, seqs, tempFile)):
+    """Prints all but the first of the blocks of the shard to be printed to the temp file,
+    returning the rows of the first and the last blocks to be printed.
+    """
+    firstRows = None
+    pL = None
+    fH = open(tempFile, 'w')
+    for block in readShardBlocks(mafFile, start, end):
+        l = getViewRows(block, seqs)
+        if l == []:
+            continue
+        if firstRows == None:
+            firstRows = l
+            pL = dict([ (row.src, row) for row in l ])
+        else:
+            pL = viewBlock(l, pL, fH)
+    fH.close()
+    return firstRows, pL
+
+def viewShards(mafFile, seqs, outputFile, processes):
+    shards = getShards(mafFile, processes * 4)
+    tempFiles = [ getShardTempFile(outputFile, i) for i in xrange(len(shards)) ]
+    results = mapShards(viewShard, [ (mafFile, start, end, seqs, tempFile) for (start, end), tempFile in zip(shards, tempFiles) ], processes)
+    fH = open(outputFile, 'w')
+    pL = {}
+    for (firstRows, lastPL), tempFile in zip(results, tempFiles):
+        if firstRows != None:
+            viewBlock(firstRows, pL, fH)
+            pL = lastPL
+        appendFile(fH, tempFile)
+    fH.close()
+
+def main():
+    parser = OptionParser(usage="%prog [options] input.maf output.txt [sequence1 sequence2 ...]")
+    parser.add_option("--region", dest="regions", action="append", default=[], help="Only blocks touching this region, as sequence:start-end")
+    parser.add_option("--processes", dest="processes", type="int", default=1, help="View shards of the file in parallel")
+    options, args = parser.parse_args()
+    if len(args) < 2:
+        parser.print_help()
+        return
+    if options.processes > 1 and len(options.regions) == 0:
+        viewShards(args[0], args[2:], args[1], options.processes)
+        return
+    fH = open(args[1], 'w')
+    viewBlocks(readBlocks(args[0], options.regions), args[2:], fH)
+    fH.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,59 @@
-from sonLib.bioio import fastaRead, fastaWrite
+"""Makes a haploid sequence from a diploid one by replacing each IUPAC ambiguity
+code with one of the bases it represents, chosen at random, preserving case.
+
+The sequences are streamed in chunks and resolved in a single pass.
+"""
+
 import sys
+import re
 import random
-fH = open(sys.argv[2], "w")
-def fn(k, i, j):
-    if k.upper() == i.upper():
-        l = random.choice(j)
-        if k == k.upper():
-            return l.upper()
-        return l.lower()
-    else:
-        return k
-for name, seq in fastaRead(open(sys.argv[1], "r")):
-    for i, j in [ ("W", ("A", "T")),
-                 ("S", ("C", "G")),
-                 ("M", ("A", "C")),
-                 ("K", ("G", "T")),
-                 ("R", ("A", "G")),
-                 ("Y", ("C", "T")),
-                 ("B", ("C", "G", "T")),
-                 ("D", ("A", "G", "T")),
-                 ("H", ("A", "C", "T")),
-                 ("V", ("A", "C", "G")) ]:
-        seq = "".join([ fn(k, i, j) for k in seq ])
-    fastaWrite(fH, name, seq)
-fH.close()
\ No newline at end of file
+from fastaStream import fastaReadRecords, FastaChunkWriter
+from compressedIO import openInput
+
+ambiguityCodes = { "W":"AT", "S":"CG", "M":"AC", "K":"GT", "R":"AG", "Y":"CT",
+                   "B":"CGT", "D":"AGT", "H":"ACT", "V":"ACG" }
+
+#Maps each (upper or lower case) ambiguity byte to the bytes it may be resolved to
+choicesForCode = [ None ] * 256
+for code, bases in ambiguityCodes.items():
+    choicesForCode[ord(code)] = bytearray(bases)
+    choicesForCode[ord(code.lower())] = bytearray(bases.lower())
+
+ambiguityPattern = re.compile("[%s]" % "".join(ambiguityCodes.keys() + [ i.lower() for i in ambiguityCodes.keys() ]))
+
+def makeHaploid(chunks, rng=random):
+    """Resolves the ambiguity codes in an iterator of sequence chunks, yielding the
+    resolved chunks. Only the ambiguous positions are visited in Python, the scan
+    for them is done by the regex engine over the whole chunk.
+    """
+    for chunk in chunks:
+        positions = [ m.start() for m in ambiguityPattern.finditer(chunk) ]
+        if len(positions) == 0:
+            yield chunk
+            continue
+        sequence = bytearray(chunk)
+        for i in positions:
+            choices = choicesForCode[sequence[i]]
+            sequence[i] = choices[int(rng.random() * len(choices))]
+        yield str(sequence)
+
+def main():
+    if len(sys.argv) < 3:
+        print "fasta-file-in fasta-file-out [random-seed]"
+        sys.exit()
+    rng = random.Random()
+    if len(sys.argv) == 4:
+        rng.seed(int(sys.argv[3]))
+    fH = openInput(sys.argv[1])
+    fH2 = open(sys.argv[2], "w")
+    writer = FastaChunkWriter(fH2)
+    for name, chunks in fastaReadRecords(fH):
+        writer.writeHeader(name)
+        for chunk in makeHaploid(chunks, rng):
+            writer.writeChunk(chunk)
+        writer.finishRecord()
+    fH.close()
+    fH2.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Lib for the manifests recording how an output was made, so that a rerun recomputes only
+the outputs that are stale. Used for the stats outputs of the pipeline, the prepared
+haplotypes (see preprocessHaplotypes.py) and the report tables (see reportBuilder.py).
+
+The manifest of an output is written next to it, as .<name>.manifest, once the output is
+in place. It records the program and its version, its arguments and a fingerprint of each
+of its inputs. An output is stale if it is missing, has no manifest, or any of these
+differ from those it would be made with now. Input fingerprints are either of the sizes and
+modification times of their files, which are cheap to take across a sweep, or digests of
+their contents.
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+def getManifestFile(outputFile):
+    path, name = os.path.split(outputFile)
+    return os.path.join(path, ".%s.manifest" % name)
+
+def getTempOutputFile(outputFile):
+    """Temp file in the same directory as the output, so it can be renamed into place.
+    """
+    directory, name = os.path.split(os.path.abspath(outputFile))
+    return os.path.join(directory, ".%s.tmp.%i" % (name, os.getpid()))
+
+def getFingerprint(paths):
+    """Returns a digest of the names, sizes and modification times of the files, and of the files under the dirs.
+    """
+    fingerprint = hashlib.md5()
+    for path in paths:
+        filePaths = [ path ]
+        if os.path.isdir(path):
+            filePaths = []
+            for dirPath, dirNames, fileNames in os.walk(path):
+                dirNames.sort()
+                filePaths += [ os.path.join(dirPath, i) for i in sorted(fileNames) ]
+        for filePath in filePaths:
+            fingerprint.update("%s %i %f\n" % (os.path.relpath(filePath, os.path.split(path)[0]),
+                                               os.path.getsize(filePath), os.path.getmtime(filePath)))
+    return fingerprint.hexdigest()
+
+fileDigests = {}
+
+def getFileDigest(path):
+    """Returns the md5 of the contents of a file, remembered while its size and modification time are unchanged.
+    """
+    key = (os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path))
+    if key not in fileDigests:
+        digest = hashlib.md5()
+        fileHandle = open(path, 'rb')
+        while True:
+            data = fileHandle.read(1000000)
+            if data == "":
+                break
+            digest.update(data)
+        fileHandle.close()
+        fileDigests[key] = digest.hexdigest()
+    return fileDigests[key]
+
+def getCodeVersion(function):
+    """Returns the digest of the source of the module defining a python function.
+    """
+    sourceFile = sys.modules[function.__module__].__file__
+    if sourceFile.endswith(".pyc"):
+        sourceFile = sourceFile[:-1]
+    return getFileDigest(sourceFile)
+
+def makeManifest(program, version, arguments, inputs):
+    """Inputs is a dict of the name of each input to its fingerprint.
+    """
+    return { "program":program, "version":version, "arguments":arguments, "inputs":inputs }
+
+def readManifest(outputFile):
+    manifestFile = getManifestFile(outputFile)
+    if not os.path.exists(manifestFile):
+        return None
+    fileHandle = open(manifestFile, 'r')
+    try:
+        return json.load(fileHandle)
+    except ValueError: #Truncated, so treated as absent
+        return None
+    finally:
+        fileHandle.close()
+
+def writeManifest(outputFile, manifest):
+    manifestFile = getManifestFile(outputFile)
+    tempFile = getTempOutputFile(manifestFile)
+    fileHandle = open(tempFile, 'w')
+    json.dump(manifest, fileHandle, sort_keys=True)
+    fileHandle.close()
+    os.rename(tempFile, manifestFile)
+
+def getStaleReason(outputFile, manifest, adopt=False):
+    """Returns why the output is stale given the manifest it would be made with now, or None if it is current.
+    If adopt is true an output without a manifest is taken to be current, and given the manifest.
+    """
+    if not os.path.exists(outputFile):
+        return "missing"
+    oldManifest = readManifest(outputFile)
+    if oldManifest == None:
+        if adopt:
+            writeManifest(outputFile, manifest)
+            return None
+        return "no manifest"
+    for key, name in (("program", "program"), ("version", "program version"), ("arguments", "arguments")):
+        if oldManifest.get(key) != manifest[key]:
+            return "%s changed" % name
+    for name, fingerprint in sorted(manifest["inputs"].items()):
+        if oldManifest.get("inputs", {}).get(name) != fingerprint:
+            return "input %s changed" % name
+    return None
@@ -1,35 +1,82 @@
-import xml.etree.ElementTree as ET
+"""Summarises a set of pathStats files, giving the statistics in statNames for the
+samples common to all of them, and their average across samples, for each file.
+
+Each file is parsed once, across a pool of processes, keeping only the statistics
+to be summarised. Samples missing any of the statistics, e.g. the aggregate of a
+_withAggregates file, are skipped and reported on stderr.
+"""
+
 import sys
+import json
+from optparse import OptionParser
+from multiprocessing import Pool
+from statsStore import iterStatsForSamples, getStatsForSamples
 
-def getSampleNames(fileName):
-    sampleNames = set()
-    pathStatsTag = ET.parse(fileName).getroot()
-    for pathStatForSampleTag in pathStatsTag.findall("statsForSample"):
-        sampleName = pathStatForSampleTag.attrib["sampleName"]
-        if sampleName != "":
-           sampleNames.add(sampleName)
-    return sampleNames
-
-sampleNames = getSampleNames(sys.argv[1])
-for fileName in sys.argv[2:]:
-    sampleNames = sampleNames.intersection(getSampleNames(fileName))
-
-sampleNamesToComparisons = {}
-for sampleName in sampleNames:
-    sampleNamesToComparisons[sampleName] = []
-
-for fileName in sys.argv[1:]:
-    pathStatsTag = ET.parse(fileName).getroot()
-    for pathStatForSampleTag in pathStatsTag.findall("statsForSample"):
-        sampleName = pathStatForSampleTag.attrib["sampleName"]
-        if sampleName in sampleNames:
-            sampleNamesToComparisons[sampleName].append(pathStatForSampleTag)
-        
-print "args", sys.argv[1:]
-        
 statNames = ("blockN50", "contigPathN50", "scaffoldPathN50", "totalInsertion", "totalDeletion")
-        
-for sampleName in sampleNames:
-    print sampleName + "\t" + "\t".join([ "\t".join([ i.attrib[statName] for i in sampleNamesToComparisons[sampleName] ]) for statName in statNames ])
 
-print "aggregate" + "\t" + "\t".join([ "\t".join([ str(sum([ float(sampleNamesToComparisons[sampleName][i].attrib[statName]) for sampleName in sampleNames ])/len(sampleNames)) for i in xrange(len(sys.argv[1:])) ]) for statName in statNames ])
\ No newline at end of file
+def getSampleStats((fileName, database)):
+    """Returns a dict of each named sample in the file to the values of its statNames, and a
+    list of the (sampleName, missingStatNames) of the samples skipped as they lack some of them.
+    """
+    if database == None:
+        pathStatsForSamples = iterStatsForSamples(fileName)
+    else:
+        pathStatsForSamples = getStatsForSamples(fileName, database)
+    sampleStats = {}
+    missingSamples = []
+    for pathStatForSample in pathStatsForSamples:
+        sampleName = pathStatForSample["sampleName"]
+        if sampleName != "":
+            missingStatNames = [ statName for statName in statNames if statName not in pathStatForSample ]
+            if len(missingStatNames) > 0:
+                missingSamples.append((sampleName, missingStatNames))
+            else:
+                sampleStats[sampleName] = tuple([ pathStatForSample[statName] for statName in statNames ])
+    return sampleStats, missingSamples
+
+def main():
+    parser = OptionParser(usage="%prog [options] pathStatsFile1 pathStatsFile2 ...")
+    parser.add_option("--database", dest="database", default=None, help="Read the stats from this statsStore database")
+    parser.add_option("--processes", dest="processes", type="int", default=None, help="Defaults to the number of cores")
+    parser.add_option("--format", dest="format", default="tsv", help="tsv or json")
+    options, fileNames = parser.parse_args()
+
+    if options.database != None or len(fileNames) == 1: #The store is updated by one process at a time
+        sampleStatsForFiles = map(getSampleStats, [ (fileName, options.database) for fileName in fileNames ])
+    else:
+        pool = Pool(options.processes)
+        sampleStatsForFiles = pool.map(getSampleStats, [ (fileName, None) for fileName in fileNames ], chunksize=1)
+        pool.close()
+        pool.join()
+    for fileName, (sampleStats, missingSamples) in zip(fileNames, sampleStatsForFiles):
+        for sampleName, missingStatNames in missingSamples:
+            sys.stderr.write("Skipped sample %s of %s, missing: %s\n" % (sampleName, fileName, " ".join(missingStatNames)))
+    sampleStatsForFiles = [ sampleStats for sampleStats, missingSamples in sampleStatsForFiles ]
+
+    sampleNames = set(sampleStatsForFiles[0].keys())
+    for sampleStats in sampleStatsForFiles[1:]:
+        sampleNames = sampleNames.intersection(sampleStats.keys())
+    if len(sampleNames) == 0:
+        raise RuntimeError("No sample with all the statistics is common to all the files")
+
+    #The values of each statistic, for each sample, in file order
+    comparisons = {}
+    for sampleName in sampleNames:
+        comparisons[sampleName] = [ [ sampleStats[sampleName][i] for sampleStats in sampleStatsForFiles ] for i in xrange(len(statNames)) ]
+    aggregates = [ [ (sum([ float(comparisons[sampleName][i][j]) for sampleName in sampleNames ])/len(sampleNames)) for j in xrange(len(fileNames)) ] for i in xrange(len(statNames)) ]
+
+    if options.format == "json":
+        json.dump({ "files":fileNames, "statNames":statNames,
+                    "samples":dict([ (sampleName, dict(zip(statNames, comparisons[sampleName]))) for sampleName in sampleNames ]),
+                    "aggregate":dict(zip(statNames, aggregates)) }, sys.stdout, indent=1)
+        print
+    elif options.format == "tsv":
+        print "args", fileNames
+        for sampleName in sampleNames:
+            print sampleName + "\t" + "\t".join([ "\t".join(comparisons[sampleName][i]) for i in xrange(len(statNames)) ])
+        print "aggregate" + "\t" + "\t".join([ "\t".join([ str(j) for j in aggregates[i] ]) for i in xrange(len(statNames)) ])
+    else:
+        raise RuntimeError("Unrecognised format: %s" % options.format)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Prepares a set of haplotype sequences for alignment, haploidising the diploid ones
+(see makeHaploid.py) and splitting all of them at runs of Ns (see removeNs.py).
+
+The samples are processed in parallel across a pool of processes. Outputs are written
+atomically and a sample is skipped if its input and the parameters are unchanged since
+it was last prepared, as recorded by its manifest (see outputManifest.py).
+"""
+
+import os
+import random
+import hashlib
+from optparse import OptionParser
+from multiprocessing import Pool
+
+from sonLib.bioio import logger, setLogLevel
+
+from removeNs import removeNsFromFile
+from makeHaploid import makeHaploid
+from outputManifest import getTempOutputFile, getFileDigest, makeManifest, writeManifest, getStaleReason
+
+def getSampleManifest(inputFile, parameters):
+    """The manifest of a prepared sample (see outputManifest.py): the parameters used to
+    prepare it and the digest of the contents of its input.
+    """
+    return makeManifest("preprocessHaplotypes", None, list(parameters), { "input":getFileDigest(inputFile) })
+
+def preprocessSample((sample, inputFile, outputDir, haploid, minimumNsForScaffoldGap, minimumLengthOfFragment, seed)):
+    """Prepares one sample, returning true if it was rebuilt, false if it was up to date.
+    """
+    outputFile = os.path.join(outputDir, sample)
+    manifest = getSampleManifest(inputFile, (haploid, minimumNsForScaffoldGap, minimumLengthOfFragment, seed))
+    if getStaleReason(outputFile, manifest) == None:
+        logger.info("Sample %s is up to date" % sample)
+        return False
+    processChunks = None
+    if haploid:
+        #Seed each sample independently, so the results don't depend on the order samples are run
+        rng = random.Random(int(hashlib.md5("%s_%s" % (seed, sample)).hexdigest(), 16))
+        processChunks = lambda chunks : makeHaploid(chunks, rng)
+    tempOutputFile = getTempOutputFile(outputFile)
+    try:
+        removeNsFromFile(inputFile, tempOutputFile, minimumNsForScaffoldGap, minimumLengthOfFragment, processChunks=processChunks)
+        os.rename(tempOutputFile, outputFile)
+    finally:
+        #On failure the original exception propagates once the temp file, if any, is removed
+        if os.path.exists(tempOutputFile):
+            try:
+                os.remove(tempOutputFile)
+            except OSError:
+                pass
+    writeManifest(outputFile, manifest)
+    logger.info("Prepared sample %s" % sample)
+    return True
+
+def main():
+    parser = OptionParser(usage="%prog [options] sample1 sample2 ...")
+    parser.add_option("--inputDir", dest="inputDir", help="Directory containing the unprocessed sequence of each sample")
+    parser.add_option("--outputDir", dest="outputDir", default=".")
+    parser.add_option("--haploidSequences", dest="haploidSequences", default="", help="Samples to haploidise before splitting")
+    parser.add_option("--minimumNsForScaffoldGap", dest="minimumNsForScaffoldGap", type="int", default=10)
+    parser.add_option("--minimumLengthOfFragment", dest="minimumLengthOfFragment", type="int", default=0)
+    parser.add_option("--seed", dest="seed", type="int", default=0, help="Seed for resolving ambiguity codes")
+    parser.add_option("--processes", dest="processes", type="int", default=None, help="Defaults to the number of cores")
+    parser.add_option("--logLevel", dest="logLevel", default="INFO")
+
+    options, args = parser.parse_args()
+    setLogLevel(options.logLevel)
+    if options.inputDir == None:
+        raise RuntimeError("No input directory given")
+
+    haploidSequences = set(options.haploidSequences.split())
+    jobs = [ (sample, os.path.join(options.inputDir, sample), options.outputDir, sample in haploidSequences,
+              options.minimumNsForScaffoldGap, options.minimumLengthOfFragment, options.seed) for sample in args ]
+    pool = Pool(options.processes)
+    rebuilt = pool.map(preprocessSample, jobs, chunksize=1)
+    pool.close()
+    pool.join()
+    logger.info("Prepared %i samples, %i were up to date" % (sum(rebuilt), len(rebuilt) - sum(rebuilt)))
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,16 @@
-
 """Replaces all runs of Ns greater than M in length with M Ns.
+
+The fasta file is streamed in fixed size chunks, so memory use is bounded
+regardless of the length of the records.
 """
 
 import sys, re
-from sonLib.bioio import fastaRead, fastaWrite, logger, setLogLevel
+import tempfile
+from itertools import izip
+from sonLib.bioio import logger, setLogLevel
+from fastaStream import fastaReadRecords, fastaRecordLengths, FastaChunkWriter
+from compressedIO import openInput
 
-if len(sys.argv) == 0:
-    print "fasta-file-in fasta-file-out minimum-length-of-ns-to-mask"
-    sys.exit()
-    
 class Header:
     def __init__(self, header, lenSeq):
         items = header.split('.')
@@ -30,56 +32,133 @@ class Header:
     def getStr( self ):
         return '.'.join( [self.name, self.chr, self.chrSize, str(self.start), str(self.fragSize), self.strand] )
 
-def fn( header, sequence, lengthOfNs ):
-    def fn2(header, sequence):
-        nonRepetitiveSequence = sequence.replace("a", "").replace("c", '').replace("g", '').replace("t", "")
-        logger.debug("Got a non-repetitive sequence of length %s for a sequence starting with length %s" % (len(nonRepetitiveSequence), len(sequence)))
-        if len(nonRepetitiveSequence) >= lengthOfFragment:
-            header.fragSize = len( sequence )
-            return header.getStr(), sequence
-        return None
-    
-    pattern = "(?P<Nstr>[Nn]+)"
-    searchedSeq = ""
-    m = re.search( pattern, sequence )
-    while m:
-        lenNs = len( m.group('Nstr') )
-        if lenNs < lengthOfNs:
-            searchedSeq += sequence[: m.start() + lenNs]
+def splitOnNs( chunks, lengthOfNs ):
+    """Scans the sequence chunks in a single pass, yielding strings of sequence
+    and, for each run of at least lengthOfNs Ns, the integer length of the run.
+    Runs that span chunk boundaries are joined up. Only short runs are buffered.
+    """
+    pattern = re.compile( "[Nn]+" )
+    nRun = [ 0, "" ] #Length of the current run and, while it is short, its characters
+    def flushRun():
+        if nRun[0] >= lengthOfNs:
+            i = nRun[0]
         else:
-            subSequence = searchedSeq + sequence[: m.start()]
-            i = fn2(header, subSequence)
-            if i != None:
-                yield i
-            searchedSeq = ""
-            #Update the start coordinate:
-            header.start += len( subSequence ) + lenNs
-        
-        sequence = sequence[m.start() + lenNs: ]
-        m = re.search( pattern, sequence )
-    
-    i = fn2(header, searchedSeq + sequence)
-    if i != None:
-        yield i
+            i = nRun[1]
+        nRun[0], nRun[1] = 0, ""
+        return i
+    for chunk in chunks:
+        i = 0
+        for m in pattern.finditer( chunk ):
+            if m.start() > i:
+                if nRun[0] > 0:
+                    yield flushRun()
+                yield chunk[i:m.start()]
+            nRun[0] += m.end() - m.start()
+            nRun[1] = nRun[1] + m.group() if nRun[0] < lengthOfNs else ""
+            i = m.end()
+        if i < len( chunk ):
+            if nRun[0] > 0:
+                yield flushRun()
+            yield chunk[i:]
+    if nRun[0] > 0:
+        yield flushRun()
+
+class Fragment:
+    """Accumulates the sequence of a fragment, spilling to a temporary file once
+    it exceeds the chunk size.
+    """
+    def __init__( self, chunkSize ):
+        self.chunkSize = chunkSize
+        self.chunks = []
+        self.bufferedLength = 0
+        self.spillFile = None
+        self.length = 0
+        self.nonRepetitiveLength = 0
+
+    def add( self, sequence ):
+        self.chunks.append( sequence )
+        self.bufferedLength += len( sequence )
+        self.length += len( sequence )
+        self.nonRepetitiveLength += len( sequence.translate( None, "acgt" ) )
+        if self.bufferedLength > self.chunkSize:
+            if self.spillFile == None:
+                self.spillFile = tempfile.TemporaryFile()
+            self.spillFile.write( "".join( self.chunks ) )
+            self.chunks = []
+            self.bufferedLength = 0
 
-#=========== MAIN ====================
-fH = open(sys.argv[1], 'r')
-fH2 = open(sys.argv[2], 'w')
-lengthOfNs = int(sys.argv[3])
-lengthOfFragment = int(sys.argv[4])
-if len(sys.argv) == 6:
-    setLogLevel(sys.argv[5])
+    def write( self, writer ):
+        if self.spillFile != None:
+            self.spillFile.seek( 0 )
+            while True:
+                chunk = self.spillFile.read( self.chunkSize )
+                if chunk == "":
+                    break
+                writer.writeChunk( chunk )
+            self.spillFile.close()
+        for chunk in self.chunks:
+            writer.writeChunk( chunk )
+        writer.finishRecord()
 
-headers = set()
-for name, sequence in fastaRead(fH):
-    header = Header( name.split()[0], len(sequence) )
-    logger.info("Got a sequence of length %i with header %s for processing" % (len(sequence), name.split()[0]))
-    for newheader, subsequence in fn( header, sequence, lengthOfNs ):
-        if len( subsequence ) > 0:
-            logger.info("Writing out a sequence of length %i with header %s" % (len(subsequence), newheader))
+def removeNs( header, chunks, lengthOfNs, lengthOfFragment, writer, headers, chunkSize=1000000 ):
+    """Splits the sequence given by the chunk iterator at runs of Ns of length lengthOfNs or
+    greater, writing out each fragment with its start coordinate and size in the header.
+    Fragments with fewer than lengthOfFragment non-repetitive bases are dropped.
+    """
+    def finish( fragment ):
+        logger.debug("Got a non-repetitive sequence of length %s for a sequence starting with length %s" % (fragment.nonRepetitiveLength, fragment.length))
+        if fragment.nonRepetitiveLength >= lengthOfFragment and fragment.length > 0:
+            header.fragSize = fragment.length
+            newheader = header.getStr()
+            logger.info("Writing out a sequence of length %i with header %s" % (fragment.length, newheader))
             assert newheader not in headers
             headers.add(newheader)
-            fastaWrite(fH2, newheader, subsequence)
-        
-fH.close()
-fH2.close()
+            writer.writeHeader( newheader )
+            fragment.write( writer )
+        elif fragment.spillFile != None:
+            fragment.spillFile.close()
+    
+    fragment = Fragment( chunkSize )
+    for i in splitOnNs( chunks, lengthOfNs ):
+        if isinstance( i, int ):
+            finish( fragment )
+            #Update the start coordinate:
+            header.start += fragment.length + i
+            fragment = Fragment( chunkSize )
+        else:
+            fragment.add( i )
+    finish( fragment )
+
+def removeNsFromFile( inputFile, outputFile, lengthOfNs, lengthOfFragment, chunkSize=1000000, processChunks=None ):
+    """Runs removeNs over every record of a fasta file. If given, processChunks is applied
+    to the chunk iterator of each record first, it must not change the sequence length.
+    """
+    #Headers lacking coordinates take the length of the sequence, so get the lengths first
+    fH = openInput(inputFile)
+    recordLengths = fastaRecordLengths(fH, chunkSize)
+    fH.close()
+    
+    fH = openInput(inputFile)
+    fH2 = open(outputFile, 'w')
+    writer = FastaChunkWriter(fH2)
+    headers = set()
+    for (name, chunks), (recordName, lenSeq) in izip(fastaReadRecords(fH, chunkSize), recordLengths):
+        assert name == recordName
+        header = Header( name.split()[0], lenSeq )
+        logger.info("Got a sequence of length %i with header %s for processing" % (lenSeq, name.split()[0]))
+        if processChunks != None:
+            chunks = processChunks( chunks )
+        removeNs( header, chunks, lengthOfNs, lengthOfFragment, writer, headers, chunkSize )
+    fH.close()
+    fH2.close()
+
+def main():
+    if len(sys.argv) < 5:
+        print "fasta-file-in fasta-file-out minimum-length-of-ns-to-mask minimum-length-of-fragment [log-level]"
+        sys.exit()
+    if len(sys.argv) == 6:
+        setLogLevel(sys.argv[5])
+    removeNsFromFile(sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Builds the LaTeX tables (see contiguityTable.py, snpTable.py and indelTable.py) for every
+alignment directory of a sweep in one invocation.
+
+Each input is loaded once and shared by the tables that use it. Each table has a manifest
+(see outputManifest.py) of the code rendering it and the size and modification time of its
+inputs, so that it is only re-rendered when these have changed since the last build.
+Tables whose inputs are missing are skipped.
+"""
+
+import os
+from optparse import OptionParser
+
+from sonLib.bioio import logger, setLogLevel
+
+from contiguityTable import loadContiguityStats, writeContiguityTable
+from snpTable import loadSnpSummary, writeSnpTable
+from indelTable import loadIndelSummary, writeIndelTable
+from outputManifest import getTempOutputFile, getFingerprint, getCodeVersion, makeManifest, writeManifest, getStaleReason
+
+def getTables(options):
+    """Returns the (tableFile, inputFiles, loadFn, writeFn) of each table, with the input
+    files relative to an alignment directory.
+    """
+    ref1, ref2 = options.referenceSpecies.split()
+    loadContiguity = lambda statsFile : loadContiguityStats(statsFile, options.database)
+    tables = [ ("contiguityTable.tex", ("contiguityStats_%s.xml" % ref1, "contiguityStats_%s.xml" % ref2), loadContiguity, writeContiguityTable) ]
+    if options.snpSummary != None and options.recurrentSnpSummary != None:
+        tables.append(("snpTable.tex", (options.snpSummary, options.recurrentSnpSummary), loadSnpSummary, writeSnpTable))
+    if options.indelSummary != None and options.exactIndelSummary != None:
+        tables.append(("indelTable.tex", (options.indelSummary, options.exactIndelSummary), loadIndelSummary, writeIndelTable))
+    return tables
+
+def getTableManifest(tableFile, inputNames, inputFiles, writeFn):
+    return makeManifest(tableFile, getCodeVersion(writeFn), list(inputNames),
+                        dict([ (name, getFingerprint([ inputFile ])) for name, inputFile in zip(inputNames, inputFiles) ]))
+
+class ReportBuilder:
+    """Renders the tables of a set of alignment directories, loading each input at most once.
+    """
+    def __init__(self, tables, reportDir):
+        self.tables = tables
+        self.reportDir = reportDir
+        self.loaded = {}
+
+    def load(self, loadFn, inputFile):
+        key = (loadFn, os.path.abspath(inputFile))
+        if key not in self.loaded:
+            self.loaded[key] = loadFn(inputFile)
+        return self.loaded[key]
+
+    def buildAlignment(self, alignmentDir):
+        """Renders the out of date tables of an alignment directory, returning the number rendered.
+        """
+        alignmentName = os.path.split(alignmentDir.rstrip("/"))[-1]
+        outputDir = os.path.join(self.reportDir, alignmentName)
+        rendered = 0
+        for tableFile, inputNames, loadFn, writeFn in self.tables:
+            inputFiles = [ os.path.join(alignmentDir, i) for i in inputNames ]
+            if False in [ os.path.exists(i) for i in inputFiles ]:
+                continue
+            outputFile = os.path.join(outputDir, tableFile)
+            manifest = getTableManifest(tableFile, inputNames, inputFiles, writeFn)
+            if getStaleReason(outputFile, manifest) == None:
+                continue
+            if not os.path.isdir(outputDir):
+                os.makedirs(outputDir)
+            tempOutputFile = getTempOutputFile(outputFile)
+            fileHandle = open(tempOutputFile, 'w')
+            try:
+                writeFn(*([ self.load(loadFn, i) for i in inputFiles ] + [ fileHandle ]))
+            except:
+                fileHandle.close()
+                os.remove(tempOutputFile)
+                raise
+            fileHandle.close()
+            os.rename(tempOutputFile, outputFile)
+            writeManifest(outputFile, manifest)
+            logger.info("Rendered %s" % outputFile)
+            rendered += 1
+        return rendered
+
+    def build(self, alignmentDirs):
+        """Renders the out of date tables of each alignment directory, returning the number rendered.
+        """
+        rendered = 0
+        for alignmentDir in alignmentDirs:
+            rendered += self.buildAlignment(alignmentDir)
+        return rendered
+
+def main():
+    parser = OptionParser(usage="%prog [options] [alignmentDir1 alignmentDir2 ...]")
+    parser.add_option("--outputDir", dest="outputDir", help="Build tables for every alignment directory in this directory")
+    parser.add_option("--reportDir", dest="reportDir", default="report", help="The tables of each alignment are written to a sub directory of this, of the same name as the alignment directory")
+    parser.add_option("--referenceSpecies", dest="referenceSpecies", default="reference hg19")
+    parser.add_option("--database", dest="database", default=None, help="Read the stats from this statsStore database")
+    parser.add_option("--snpSummary", dest="snpSummary", default=None, help="Summary of all snps, relative to each alignment directory")
+    parser.add_option("--recurrentSnpSummary", dest="recurrentSnpSummary", default=None, help="Summary of recurrent snps, relative to each alignment directory")
+    parser.add_option("--indelSummary", dest="indelSummary", default=None, help="Summary of all indels, relative to each alignment directory")
+    parser.add_option("--exactIndelSummary", dest="exactIndelSummary", default=None, help="Summary of exactly matched indels, relative to each alignment directory")
+    parser.add_option("--logLevel", dest="logLevel", default="INFO")
+    options, alignmentDirs = parser.parse_args()
+    setLogLevel(options.logLevel)
+
+    if options.outputDir != None:
+        alignmentDirs += [ os.path.join(options.outputDir, i) for i in sorted(os.listdir(options.outputDir)) ]
+    reportDir = os.path.abspath(options.reportDir)
+    alignmentDirs = [ i for i in alignmentDirs if os.path.isdir(i) and os.path.abspath(i) != reportDir ]
+    rendered = ReportBuilder(getTables(options), options.reportDir).build(alignmentDirs)
+    logger.info("Rendered %i tables for %i alignments" % (rendered, len(alignmentDirs)))
+
+if __name__ == '__main__':
+    main()
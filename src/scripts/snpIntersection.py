@@ -1,23 +1,5 @@
-import xml.etree.ElementTree as ET
 import sys
+from statsAggregation import writeAllAggregates, SnpAggregator
 
 print sys.argv
-i = ET.parse(sys.argv[1]).getroot()
-l = []
-l2 = set()
-for j in i.findall("statsForSample"):
-    if "panTro" not in j.attrib["sampleName"] and "reference" not in j.attrib["sampleName"]:
-        for k in j.text.split("\n"):
-            key = " ".join(k.split()[2:])
-            if key not in l2:
-                l2.add(key)
-                l.append(k)
-j = i.find("statsForSample").attrib.copy()
-j["substitutionNumber"] = str(len(l))
-j["sampleNumber"] = "NaN"
-j["substitutionRate"] = "NaN"
-j["sampleName"] = "aggregate"
-ET.SubElement(i, "statsForSample", attrib=j).text = "\n".join(l)
-fH = open(sys.argv[1][:-4] + "_withAggregates.xml", 'w')
-ET.ElementTree(i).write(fH)
-fH.close()
\ No newline at end of file
+writeAllAggregates([ (sys.argv[1], SnpAggregator) ], streaming="--streaming" in sys.argv[2:])
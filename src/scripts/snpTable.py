@@ -1,10 +1,11 @@
 import sys
 from tex import *
+from compressedIO import openInput
 import xml.etree.ElementTree as ET
 
 def fn(file):
     l = {}
-    for line in [ line.split() for line in open(file, "r").readlines()[2:] ]:
+    for line in [ line.split() for line in openInput(file).readlines()[2:] ]:
         l[line[0]] = line[1:]
     referenceLine = l.pop("reference")
     aggregateLine = l.pop("aggregate")
@@ -26,54 +27,60 @@ def fn(file):
     yield "aggregate", int(aggregateLine[samples]), int(aggregateLine[truePositives]), None, None
     yield "C. Ref.", int(referenceLine[samples]), int(referenceLine[truePositives]), None, None
     
-fileHandle = open(sys.argv[3], "w")
+def loadSnpSummary(file):
+    """Returns the rows of a snp summary file.
+    """
+    return list(fn(file))
 
-writeDocumentPreliminaries(fileHandle)
-writePreliminaries(9, fileHandle)
+def writeSnpTable(allRows, filteredRows, fileHandle):
+    """Writes the table, given the rows loaded from the summaries of all and of recurrent snps.
+    """
+    writeDocumentPreliminaries(fileHandle)
+    writePreliminaries(9, fileHandle)
 
-#writeRow(("samples", "sequence", "\% mapped", "\% mapped and contiguous", "\% contigious that mapped"), fileHandle)
+    #writeRow(("samples", "sequence", "\% mapped", "\% mapped and contiguous", "\% contigious that mapped"), fileHandle)
 
-writeLine(9, 1, (("Single Nucleotide Polymorphisms", 0, 8, 0, 0),), fileHandle)
+    writeLine(9, 1, (("Single Nucleotide Polymorphisms", 0, 8, 0, 0),), fileHandle)
 
 
-writeLine(9, 2, (("Sample", 0, 0, 0, 1), 
-              ("All", 1, 4, 0, 0), 
-              ("T\#", 1, 1, 1, 1), 
-              ("TP", 2, 2, 1, 1), 
-              ("STP", 3, 3, 1, 1), 
-              ("SFN", 4, 4, 1, 1),
-              ("Recurrent", 5, 8, 0, 0), 
-              ("T\#", 5, 5, 1, 1), 
-              ("TP", 6, 6, 1, 1), 
-              ("STP", 7, 7, 1, 1), 
-              ("SFN", 8, 8, 1, 1)), fileHandle)
+    writeLine(9, 2, (("Sample", 0, 0, 0, 1), 
+                  ("All", 1, 4, 0, 0), 
+                  ("T\#", 1, 1, 1, 1), 
+                  ("TP", 2, 2, 1, 1), 
+                  ("STP", 3, 3, 1, 1), 
+                  ("SFN", 4, 4, 1, 1),
+                  ("Recurrent", 5, 8, 0, 0), 
+                  ("T\#", 5, 5, 1, 1), 
+                  ("TP", 6, 6, 1, 1), 
+                  ("STP", 7, 7, 1, 1), 
+                  ("SFN", 8, 8, 1, 1)), fileHandle)
 
-for sampleName, samples, truePositives, \
-    sampleTruePositives, sampleTrueNegatives, \
-    filteredSamples, filteredTruePositives,\
-    filteredSampleTruePositives, filteredSampleTrueNegatives in [ tuple(list(i) + list(j[1:])) for i, j in zip(fn(sys.argv[1]), fn(sys.argv[2])) if i[0] == j[0] ]:
-    def fn2(i, j=samples):
-        if i != None:
-            return "%.0f" % (100.0*float(i)/float(j))
-        return "NA"
-    def fn3(i, j=filteredSamples):
-        return fn2(i, j)
-    def fn4(i, j):
-        if i == None:
+    for sampleName, samples, truePositives, \
+        sampleTruePositives, sampleTrueNegatives, \
+        filteredSamples, filteredTruePositives,\
+        filteredSampleTruePositives, filteredSampleTrueNegatives in [ tuple(list(i) + list(j[1:])) for i, j in zip(allRows, filteredRows) if i[0] == j[0] ]:
+        def fn2(i, j=samples):
+            if i != None:
+                return "%.0f" % (100.0*float(i)/float(j))
             return "NA"
-        return "%.0f" % (100.0*float(j)/(float(i) + float(j)))
-    writeLine(9, 1, ((sampleName, 0, 0, 0, 0), 
-                     (samples, 1, 1, 0, 0),
-                     (fn2(truePositives), 2, 2, 0, 0),
-                     (fn2(sampleTruePositives), 3, 3, 0, 0),
-                     (fn4(sampleTruePositives, sampleTrueNegatives), 4, 4, 0, 0),
-                     (filteredSamples, 5, 5, 0, 0),
-                     (fn3(filteredTruePositives), 6, 6, 0, 0),
-                     (fn3(filteredSampleTruePositives), 7, 7, 0, 0),
-                     (fn4(filteredSampleTruePositives, filteredSampleTrueNegatives), 8, 8, 0, 0)), fileHandle, trailingLines=0)
+        def fn3(i, j=filteredSamples):
+            return fn2(i, j)
+        def fn4(i, j):
+            if i == None:
+                return "NA"
+            return "%.0f" % (100.0*float(j)/(float(i) + float(j)))
+        writeLine(9, 1, ((sampleName, 0, 0, 0, 0), 
+                         (samples, 1, 1, 0, 0),
+                         (fn2(truePositives), 2, 2, 0, 0),
+                         (fn2(sampleTruePositives), 3, 3, 0, 0),
+                         (fn4(sampleTruePositives, sampleTrueNegatives), 4, 4, 0, 0),
+                         (filteredSamples, 5, 5, 0, 0),
+                         (fn3(filteredTruePositives), 6, 6, 0, 0),
+                         (fn3(filteredSampleTruePositives), 7, 7, 0, 0),
+                         (fn4(filteredSampleTruePositives, filteredSampleTrueNegatives), 8, 8, 0, 0)), fileHandle, trailingLines=0)
        
 
-writeEnd(fileHandle, "snpTable", "All: all SNPs detected in each sample with respect to GRCh37. \
+    writeEnd(fileHandle, "snpTable", "All: all SNPs detected in each sample with respect to GRCh37. \
 Recurrent: as All, but excluding SNPs not present in at least two samples, including chimp. \
 T\#: Total number of SNPs. \
 TP: Percentage true positives, as validated by a matching SNP in dbSNP. \
@@ -82,5 +89,12 @@ SFN: Percentage (sample) false negatives, as validated by those reported for the
 An NA entry denotes that the data was not available. \
 Aggregate row: gives the total SNPs in human samples (excluding chimp). \
 C. Ref. row: gives SNPs in C. Ref. with respect to GRCh37")
-writeDocumentEnd(fileHandle)
-fileHandle.close()
\ No newline at end of file
+    writeDocumentEnd(fileHandle)
+
+def main():
+    fileHandle = open(sys.argv[3], "w")
+    writeSnpTable(loadSnpSummary(sys.argv[1]), loadSnpSummary(sys.argv[2]), fileHandle)
+    fileHandle.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,7 @@
-import sys
-import xml.etree.ElementTree as ET
-from sonLib.tree import BinaryTree
-from sonLib.tree import njI
-from sonLib.tree import upgmaI
-from sonLib.tree import DistancePair
-from sonLib.bioio import printBinaryTree
+"""Prints the NJ and UPGMA trees of the substitution distances between events in a snpStats file.
+"""
 
-l = {}
-def fn(eventName):
-    if not l.has_key(eventName):
-        l[eventName] = BinaryTree(0.0, False, None, None, eventName)
-    return l[eventName]
-distancePairs = [ DistancePair(float(i.attrib["substitutionRate"]), fn(i.attrib["eventName1"]), 1, fn(i.attrib["eventName2"]), 1) for i in ET.parse(sys.argv[1]).getroot().findall("distancesForSamples") ] 
-distancePairs += [ DistancePair(i.distance, i.leaf2, 1, i.leaf1, 1) for i in distancePairs ]
+from treeBuilding import main, loadSnpDistances
 
-print len(distancePairs), l
-print "NJ", printBinaryTree(njI(distancePairs, len(l.keys())), includeDistances=True)
-print "UPGMA", printBinaryTree(upgmaI(distancePairs, len(l.keys())), includeDistances=True)
+if __name__ == '__main__':
+    main(loadSnpDistances)
@@ -1,7 +1,8 @@
 import sys
 import xml.etree.ElementTree as ET
+from compressedIO import openInput
 
-for i in [ i for i in ET.parse(sys.argv[1]).getroot().findall("statsForSample") if i.attrib["sampleName"] == sys.argv[2] ][0].text.split("\n"):
+for i in [ i for i in ET.parse(openInput(sys.argv[1])).getroot().findall("statsForSample") if i.attrib["sampleName"] == sys.argv[2] ][0].text.split("\n"):
     i = i.split()
     if len(i) > 0:
         j = i[3].split(".")
@@ -0,0 +1,209 @@
+"""Lib for adding aggregates across samples to the snpStats and pathStats files.
+
+The aggregates can be made from a parsed stats document, or by streaming through
+the stats file, in which case each statsForSample element is released once it has
+been processed and memory use is proportional to the number of distinct records.
+"""
+
+import hashlib
+import tempfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from compressedIO import openInput, openOutput, getCompression, stripCompressionSuffix
+
+def isAggregatedSample(statsForSampleNode):
+    """The chimp and reference samples are excluded from the aggregates.
+    """
+    sampleName = statsForSampleNode.attrib["sampleName"]
+    return "panTro" not in sampleName and "reference" not in sampleName
+
+class Aggregator:
+    """Accumulates the distinct records in the text of a series of statsForSample elements.
+    Only a digest of the key of each record is kept in memory, the records themselves
+    are spilled to a temporary file.
+    """
+    def __init__(self):
+        self.keys = set()
+        self.records = tempfile.TemporaryFile()
+        self.recordNumber = 0
+        self.firstAttrib = None
+
+    def getKey(self, tokens):
+        """Returns the string identifying a record, or None if the record is to be ignored.
+        """
+        raise NotImplementedError()
+
+    def addRecord(self, tokens):
+        """Called for each distinct record.
+        """
+        pass
+
+    def getAttrib(self):
+        """Returns the attributes of the aggregate element.
+        """
+        raise NotImplementedError()
+
+    def add(self, statsForSampleNode):
+        if self.firstAttrib == None:
+            self.firstAttrib = statsForSampleNode.attrib.copy()
+        if isAggregatedSample(statsForSampleNode):
+            for record in (statsForSampleNode.text or "").split("\n"):
+                tokens = record.split()
+                key = self.getKey(tokens)
+                if key == None:
+                    continue
+                digest = hashlib.md5(key).digest()
+                if digest not in self.keys:
+                    self.keys.add(digest)
+                    if self.recordNumber > 0:
+                        self.records.write("\n")
+                    self.records.write(record)
+                    self.recordNumber += 1
+                    self.addRecord(tokens)
+
+    def getRecordChunks(self, chunkSize=1000000):
+        self.records.seek(0)
+        while True:
+            chunk = self.records.read(chunkSize)
+            if chunk == "":
+                break
+            yield chunk
+
+    def getElement(self):
+        aggregate = ET.Element("statsForSample", attrib=self.getAttrib())
+        aggregate.text = "".join(self.getRecordChunks())
+        return aggregate
+
+    def writeElement(self, fileHandle):
+        """Writes the aggregate element as ElementTree would, without holding its text in memory.
+        """
+        startTag, endTag = getTags(ET.Element("statsForSample", attrib=self.getAttrib()))
+        if self.records.tell() == 0:
+            fileHandle.write(startTag[:-1] + " />")
+            return
+        fileHandle.write(startTag)
+        for chunk in self.getRecordChunks():
+            fileHandle.write(escape(chunk))
+        fileHandle.write(endTag)
+
+class SnpAggregator(Aggregator):
+    """Aggregates the distinct snps of the samples of a snpStats file.
+    """
+    def getKey(self, tokens):
+        return " ".join(tokens[2:])
+
+    def getAttrib(self):
+        j = self.firstAttrib.copy()
+        j["substitutionNumber"] = str(self.recordNumber)
+        j["sampleNumber"] = "NaN"
+        j["substitutionRate"] = "NaN"
+        j["sampleName"] = "aggregate"
+        return j
+
+class IndelAggregator(Aggregator):
+    """Aggregates the distinct indels of the samples of a pathStats file.
+    """
+    def __init__(self):
+        Aggregator.__init__(self)
+        self.totalInsertion = 0
+        self.totalDeletion = 0
+        self.totalInsertionAndDeletion = 0
+
+    def getKey(self, tokens):
+        if len(tokens) > 1:
+            return " ".join(tokens[:6])
+        return None
+
+    def addRecord(self, tokens):
+        if int(tokens[5]) > 0:
+            self.totalInsertion += 1
+            if int(tokens[13]) > 0:
+                self.totalDeletion += 1
+                self.totalInsertionAndDeletion += 1
+        elif int(tokens[13]) > 0:
+            self.totalDeletion += 1
+
+    def getAttrib(self):
+        return { "totalInsertion":str(self.totalInsertion),
+                 "totalDeletion":str(self.totalDeletion),
+                 "totalInsertionAndDeletion":str(self.totalInsertionAndDeletion),
+                 "sampleName":"aggregate",
+                 "referenceName":"hg19" }
+
+def getAggregate(statsNode, aggregator):
+    for j in statsNode.findall("statsForSample"):
+        aggregator.add(j)
+    return aggregator.getElement()
+
+def getSnpAggregate(statsNode):
+    """Returns a statsForSample element giving the distinct snps across the samples of a parsed snpStats file.
+    """
+    return getAggregate(statsNode, SnpAggregator())
+
+def getIndelAggregate(statsNode):
+    """Returns a statsForSample element giving the distinct indels across the samples of a parsed pathStats file.
+    """
+    return getAggregate(statsNode, IndelAggregator())
+
+def getTags(element):
+    """Returns the start and end tags of an element, as ElementTree serialises them.
+    """
+    element = ET.Element(element.tag, attrib=element.attrib)
+    element.text = "TEXT"
+    i = ET.tostring(element)
+    j = i.rindex("TEXT")
+    return i[:j], i[j+len("TEXT"):]
+
+def getAggregatesFile(statsFile):
+    """Returns the name of the copy of the stats file with the aggregates, which keeps its compression suffix.
+    """
+    plainFile = stripCompressionSuffix(statsFile)
+    return plainFile[:-4] + "_withAggregates.xml" + statsFile[len(plainFile):]
+
+def writeAggregates(statsFile, getAggregate):
+    """Writes a copy of the stats file with the aggregate element appended.
+    """
+    statsNode = ET.parse(openInput(statsFile)).getroot()
+    statsNode.append(getAggregate(statsNode))
+    fH = openOutput(getAggregatesFile(statsFile), getCompression(statsFile))
+    ET.ElementTree(statsNode).write(fH)
+    fH.close()
+
+def writeAggregatesStreaming(statsFile, aggregator):
+    """As writeAggregates, but streams through the stats file, writing out each child of the
+    root as it is parsed and then releasing it. The output is identical.
+    """
+    fH = openOutput(getAggregatesFile(statsFile), getCompression(statsFile))
+    root = None
+    rootStartWritten = False
+    depth = 0
+    for event, element in ET.iterparse(openInput(statsFile), events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = element
+            elif depth == 2 and not rootStartWritten: #The text of the root is known once its first child starts
+                fH.write(getTags(root)[0] + escape(root.text or ""))
+                rootStartWritten = True
+        else:
+            depth -= 1
+            if depth == 1:
+                fH.write(ET.tostring(element))
+                if element.tag == "statsForSample":
+                    aggregator.add(element)
+                root.remove(element)
+    if not rootStartWritten:
+        fH.write(getTags(root)[0] + escape(root.text or ""))
+    aggregator.writeElement(fH)
+    fH.write(getTags(root)[1])
+    fH.close()
+
+def writeAllAggregates(statsFilesAndAggregators, streaming=True):
+    """Writes the aggregates for a list of (statsFile, aggregatorClass) pairs, in one process.
+    """
+    for statsFile, aggregatorClass in statsFilesAndAggregators:
+        if streaming:
+            writeAggregatesStreaming(statsFile, aggregatorClass())
+        else:
+            writeAggregates(statsFile, lambda statsNode : getAggregate(statsNode, aggregatorClass()))
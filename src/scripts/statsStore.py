@@ -0,0 +1,197 @@
+"""Lib and script for an indexed store of the per sample attributes of the stats files
+under an output directory, so that summaries across a sweep can be made without
+re-parsing the xml.
+
+The store is an sqlite database. Files are re-ingested only when their size or
+modification time changes. Each alignment directory is also indexed by the sweep
+parameters encoded in its name by the pipeline.
+
+To ingest:  statsStore.py ingest --database stats.db --outputDir output/main/foo
+To query:   statsStore.py query --database stats.db --statsFile pathStats_hg19.xml --statName blockN50 --parameter theta=0.001
+"""
+
+import os
+import re
+import sys
+import sqlite3
+import xml.etree.ElementTree as ET
+from optparse import OptionParser
+
+from compressedIO import openInput, stripCompressionSuffix
+
+#The directory names made by MakeAlignments in bin/pipeline.py, optionally with a held out sequence suffix
+sweepParameterNames = ("requiredSpecies", "singleCopySpecies", "referenceAlgorithm", "minimumBlockDegree",
+                       "blastAlignmentStringIndex", "baseLevel", "maxNumberOfChains", "permutations", "theta",
+                       "useSimulatedAnnealing", "pruneOutStubAlignments", "gapGamma", "heldOutSequence")
+sweepDirPattern = re.compile("^((?:no-)?required-species)-((?:no-)?single-copy-species(?:_[0-9]+)?)-([^-]+)-([0-9]+)-([0-9]+)-(True|False)-([0-9]+)-([0-9]+)-([0-9.]+(?:e-?[0-9]+)?)-(True|False)-(True|False)-([0-9.]+(?:e-?[0-9]+)?)(?:_(.+))?$")
+
+def getSweepParameters(sweepDir):
+    """Returns a dict of the sweep parameters encoded in an alignment directory name, or None
+    if the name is not one made by the pipeline.
+    """
+    m = sweepDirPattern.match(os.path.split(sweepDir.rstrip("/"))[-1])
+    if m == None:
+        return None
+    return dict(zip(sweepParameterNames, m.groups()))
+
+#The directory names of the alignment phases shared by the variants of a group (see MakeBaseAlignment in bin/pipeline.py)
+baseParameterNames = ("requiredSpecies", "singleCopySpecies", "minimumBlockDegree", "blastAlignmentStringIndex",
+                      "baseLevel", "pruneOutStubAlignments", "gapGamma", "heldOutSequence")
+baseDirPattern = re.compile("^baseAlignment-((?:no-)?required-species)-((?:no-)?single-copy-species(?:_[0-9]+)?)-([0-9]+)-([0-9]+)-(True|False)-(True|False)-([0-9.]+(?:e-?[0-9]+)?)(?:_(.+))?$")
+
+def getBaseParameters(baseDir):
+    """Returns a dict of the parameters encoded in a base alignment directory name, which are shared
+    by the alignments built from it, or None if the name is not that of a base alignment.
+    """
+    m = baseDirPattern.match(os.path.split(baseDir.rstrip("/"))[-1])
+    if m == None:
+        return None
+    return dict(zip(baseParameterNames, m.groups()))
+
+def isStatsFile(fileName):
+    fileName = stripCompressionSuffix(fileName)
+    return fileName.endswith(".xml") and "Stats" in fileName
+
+def connect(database):
+    connection = sqlite3.connect(database)
+    connection.execute("CREATE TABLE IF NOT EXISTS files (fileId INTEGER PRIMARY KEY, path TEXT UNIQUE, sweepDir TEXT, statsFile TEXT, size INTEGER, mtime REAL)")
+    connection.execute("CREATE TABLE IF NOT EXISTS stats (fileId INTEGER, sampleIndex INTEGER, sampleName TEXT, statName TEXT, value TEXT, numericValue REAL)")
+    connection.execute("CREATE TABLE IF NOT EXISTS sweeps (sweepDir TEXT PRIMARY KEY, %s)" % ", ".join([ "%s TEXT" % i for i in sweepParameterNames ]))
+    connection.execute("CREATE INDEX IF NOT EXISTS statsByName ON stats (statName, sampleName)")
+    connection.execute("CREATE INDEX IF NOT EXISTS statsByFile ON stats (fileId, sampleIndex)")
+    connection.execute("CREATE INDEX IF NOT EXISTS filesByStatsFile ON files (statsFile, sweepDir)")
+    return connection
+
+def getNumericValue(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def ingestFile(connection, path):
+    """Loads the attributes of the statsForSample elements of a file, if not already
+    loaded or changed since, returning true if it was loaded.
+    """
+    path = os.path.abspath(path)
+    size, mtime = os.path.getsize(path), os.path.getmtime(path)
+    row = connection.execute("SELECT fileId, size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+    if row != None:
+        if row[1] == size and row[2] == mtime:
+            return False
+        connection.execute("DELETE FROM stats WHERE fileId = ?", (row[0],))
+        connection.execute("DELETE FROM files WHERE fileId = ?", (row[0],))
+    sweepDir, statsFile = os.path.split(path)
+    statsFile = stripCompressionSuffix(statsFile) #Compressed files are queried by the name of the plain file
+    fileId = connection.execute("INSERT INTO files (path, sweepDir, statsFile, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                                (path, sweepDir, statsFile, size, mtime)).lastrowid
+    sweepParameters = getSweepParameters(sweepDir)
+    if sweepParameters != None:
+        connection.execute("INSERT OR REPLACE INTO sweeps (sweepDir, %s) VALUES (?, %s)" % (", ".join(sweepParameterNames), ", ".join([ "?" ] * len(sweepParameterNames))),
+                           [ sweepDir ] + [ sweepParameters[i] for i in sweepParameterNames ])
+    for sampleIndex, attrib in enumerate(iterStatsForSamples(path)):
+        sampleName = attrib.get("sampleName", "")
+        connection.executemany("INSERT INTO stats (fileId, sampleIndex, sampleName, statName, value, numericValue) VALUES (?, ?, ?, ?, ?, ?)",
+                               [ (fileId, sampleIndex, sampleName, statName, value, getNumericValue(value)) for statName, value in attrib.items() ])
+    return True
+
+def ingest(connection, outputDir):
+    """Loads every stats file under the output dir that is new or has changed, returning the number loaded.
+    """
+    loaded = 0
+    for dirPath, dirNames, fileNames in os.walk(outputDir):
+        dirNames[:] = [ i for i in dirNames if i != "cactusAlignment" ]
+        for fileName in fileNames:
+            if isStatsFile(fileName):
+                if ingestFile(connection, os.path.join(dirPath, fileName)):
+                    loaded += 1
+    connection.commit()
+    return loaded
+
+def iterStatsForSamples(statsFile):
+    """Yields the attributes of each statsForSample element of the file, in order, as dicts,
+    streaming through the file and releasing each element once read.
+    """
+    depth = 0
+    for event, element in ET.iterparse(openInput(statsFile), events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = element
+            continue
+        depth -= 1
+        if depth == 1:
+            if element.tag == "statsForSample":
+                yield dict(element.attrib)
+            root.remove(element)
+
+def getStatsForSamples(statsFile, database=None):
+    """Returns the attributes of each statsForSample element of the file, in order, as dicts.
+    If a database is given the attributes are read from the store, loading the file first if needed.
+    """
+    if database == None:
+        return list(iterStatsForSamples(statsFile))
+    connection = connect(database)
+    if ingestFile(connection, statsFile):
+        connection.commit()
+    samples = []
+    for sampleIndex, statName, value in connection.execute("SELECT sampleIndex, statName, value FROM stats, files WHERE stats.fileId = files.fileId AND files.path = ? ORDER BY sampleIndex",
+                                                           (os.path.abspath(statsFile),)):
+        while len(samples) <= sampleIndex:
+            samples.append({})
+        samples[sampleIndex][statName.encode("utf-8")] = value.encode("utf-8")
+    connection.close()
+    return samples
+
+def parseDatabaseOption(args):
+    """Removes a leading '--database FILE' from the arguments of a script, returning the database (or None) and the remaining arguments.
+    """
+    if len(args) >= 2 and args[0] == "--database":
+        return args[1], args[2:]
+    return None, args
+
+def query(connection, statsFile=None, statName=None, sampleName=None, parameters={}):
+    """Yields (sweepDir, statsFile, sampleName, statName, value) rows matching the given constraints.
+    """
+    conditions = [ "stats.fileId = files.fileId" ]
+    values = []
+    for column, value in (("files.statsFile", statsFile), ("stats.statName", statName), ("stats.sampleName", sampleName)):
+        if value != None:
+            conditions.append("%s = ?" % column)
+            values.append(value)
+    tables = "stats, files"
+    if len(parameters) > 0:
+        tables += ", sweeps"
+        conditions.append("sweeps.sweepDir = files.sweepDir")
+        for parameter, value in parameters.items():
+            if parameter not in sweepParameterNames:
+                raise RuntimeError("Unrecognised sweep parameter: %s" % parameter)
+            conditions.append("sweeps.%s = ?" % parameter)
+            values.append(value)
+    return connection.execute("SELECT files.sweepDir, files.statsFile, stats.sampleName, stats.statName, stats.value FROM %s WHERE %s ORDER BY files.sweepDir, files.statsFile, stats.sampleIndex" %
+                              (tables, " AND ".join(conditions)), values)
+
+def main():
+    parser = OptionParser(usage="%prog (ingest|query) [options]")
+    parser.add_option("--database", dest="database")
+    parser.add_option("--outputDir", dest="outputDir")
+    parser.add_option("--statsFile", dest="statsFile")
+    parser.add_option("--statName", dest="statName")
+    parser.add_option("--sampleName", dest="sampleName")
+    parser.add_option("--parameter", dest="parameters", action="append", default=[], help="A sweep parameter constraint, as name=value")
+    options, args = parser.parse_args()
+    if len(args) != 1 or args[0] not in ("ingest", "query") or options.database == None:
+        parser.print_help()
+        sys.exit(1)
+    connection = connect(options.database)
+    if args[0] == "ingest":
+        if options.outputDir == None:
+            raise RuntimeError("No output dir given to ingest")
+        print "Loaded %i new or changed stats files" % ingest(connection, options.outputDir)
+    else:
+        parameters = dict([ i.split("=", 1) for i in options.parameters ])
+        for row in query(connection, options.statsFile, options.statName, options.sampleName, parameters):
+            print "\t".join([ i.encode("utf-8") for i in row ])
+    connection.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""Lib for building neighbour joining and UPGMA trees from the pairwise distances between
+events in the snpStats (distancesForSamples) and pathStats (indelDistanceForEvents) files.
+
+The distances are held in a dense symmetric numpy matrix, and each join updates the matrix
+with vector operations. Support values come from bootstrap replicates, run across a pool of
+processes. The stats files give the number of events and the number of bases each distance
+is estimated from, rather than the aligned columns, so each replicate redraws every pairwise
+count from a binomial with the observed rate (a parametric bootstrap). The support of a
+clade is the percentage of replicate trees that contain it, unrooted splits being compared
+for neighbour joining and rooted clades for UPGMA.
+"""
+
+import random
+import xml.etree.ElementTree as ET
+from optparse import OptionParser
+from multiprocessing import Pool
+
+import numpy
+
+from compressedIO import openInput
+
+class Node:
+    """Node of a tree. Leaves have a name, internal nodes a left and right child.
+    """
+    def __init__(self, distance, name=None, left=None, right=None):
+        self.distance = distance
+        self.name = name
+        self.left = left
+        self.right = right
+
+    def isLeaf(self):
+        return self.left == None
+
+    def getLeaves(self):
+        if self.isLeaf():
+            return frozenset([ self.name ])
+        return self.left.getLeaves() | self.right.getLeaves()
+
+class EventDistances:
+    """The pairwise distances between a set of events, and for each the counts it is estimated from.
+    Where both orderings of a pair are given their distances are averaged.
+    """
+    def __init__(self, entries):
+        """Entries is a list of (eventName1, eventName2, distance, count, total).
+        """
+        self.names = []
+        indices = {}
+        for entry in entries:
+            for name in entry[:2]:
+                if name not in indices:
+                    indices[name] = len(self.names)
+                    self.names.append(name)
+        self.rows = numpy.array([ indices[entry[0]] for entry in entries ], dtype=int)
+        self.columns = numpy.array([ indices[entry[1]] for entry in entries ], dtype=int)
+        self.distances = numpy.array([ entry[2] for entry in entries ], dtype=float)
+        self.counts = numpy.array([ entry[3] for entry in entries ], dtype=int)
+        self.totals = numpy.array([ entry[4] for entry in entries ], dtype=int)
+
+    def getMatrix(self, distances=None):
+        """Returns the symmetric matrix of the given distances for the entries, by default the observed ones.
+        """
+        if distances is None:
+            distances = self.distances
+        n = len(self.names)
+        sums = numpy.zeros((n, n))
+        numbers = numpy.zeros((n, n))
+        numpy.add.at(sums, (self.rows, self.columns), distances)
+        numpy.add.at(sums, (self.columns, self.rows), distances)
+        numpy.add.at(numbers, (self.rows, self.columns), 1)
+        numpy.add.at(numbers, (self.columns, self.rows), 1)
+        numpy.fill_diagonal(numbers, 1)
+        if (numbers == 0).any():
+            i, j = numpy.argwhere(numbers == 0)[0]
+            raise RuntimeError("No distance between events %s and %s" % (self.names[i], self.names[j]))
+        matrix = sums / numbers
+        numpy.fill_diagonal(matrix, 0.0)
+        return matrix
+
+    def getReplicateMatrix(self, rng):
+        """Returns a matrix of distances with each count redrawn from a binomial with its observed rate.
+        """
+        totals = numpy.maximum(self.totals, 1)
+        rates = numpy.minimum(self.counts / totals.astype(float), 1.0)
+        return self.getMatrix(rng.binomial(totals, rates) / totals.astype(float))
+
+def loadEventDistances(statsFile, tag, distanceAttrib, countAttrib, totalAttrib):
+    """Loads the distances of the given elements of a stats file, ignoring those between an event and itself.
+    """
+    entries = []
+    for element in ET.parse(openInput(statsFile)).getroot().findall(tag):
+        if element.attrib["eventName1"] != element.attrib["eventName2"]:
+            entries.append((element.attrib["eventName1"], element.attrib["eventName2"], float(element.attrib[distanceAttrib]),
+                            int(element.attrib[countAttrib]), int(element.attrib[totalAttrib])))
+    return EventDistances(entries)
+
+def loadSnpDistances(statsFile):
+    return loadEventDistances(statsFile, "distancesForSamples", "substitutionRate", "substitutionNumber", "sampleNumber")
+
+def loadIndelDistances(statsFile):
+    return loadEventDistances(statsFile, "indelDistanceForEvents", "indelsPerBase", "totalIndels", "alignmentLength")
+
+def removeIndex(matrix, i):
+    return numpy.delete(numpy.delete(matrix, i, 0), i, 1)
+
+def nj(matrix, names):
+    """Returns the neighbour joining tree of the distance matrix, rooted at the last join.
+    """
+    matrix = numpy.array(matrix, dtype=float)
+    nodes = [ Node(0.0, name) for name in names ]
+    while len(nodes) > 2:
+        n = len(nodes)
+        rowSums = matrix.sum(1)
+        q = (n - 2) * matrix - rowSums[:, None] - rowSums[None, :]
+        numpy.fill_diagonal(q, numpy.inf)
+        i, j = numpy.unravel_index(numpy.argmin(q), q.shape)
+        i, j = min(i, j), max(i, j)
+        nodes[i].distance = 0.5 * matrix[i, j] + (rowSums[i] - rowSums[j]) / (2.0 * (n - 2))
+        nodes[j].distance = matrix[i, j] - nodes[i].distance
+        newDistances = 0.5 * (matrix[i] + matrix[j] - matrix[i, j])
+        matrix[i, :] = newDistances
+        matrix[:, i] = newDistances
+        matrix[i, i] = 0.0
+        matrix = removeIndex(matrix, j)
+        nodes[i] = Node(0.0, None, nodes[i], nodes.pop(j))
+    if len(nodes) == 1:
+        return nodes[0]
+    nodes[0].distance = matrix[0, 1] / 2.0
+    nodes[1].distance = matrix[0, 1] / 2.0
+    return Node(0.0, None, nodes[0], nodes[1])
+
+def upgma(matrix, names):
+    """Returns the UPGMA tree of the distance matrix.
+    """
+    matrix = numpy.array(matrix, dtype=float)
+    nodes = [ Node(0.0, name) for name in names ]
+    heights = [ 0.0 ] * len(nodes)
+    sizes = numpy.ones(len(nodes))
+    while len(nodes) > 1:
+        masked = matrix + numpy.diag(numpy.repeat(numpy.inf, len(nodes)))
+        i, j = numpy.unravel_index(numpy.argmin(masked), masked.shape)
+        i, j = min(i, j), max(i, j)
+        height = matrix[i, j] / 2.0
+        nodes[i].distance = height - heights[i]
+        nodes[j].distance = height - heights[j]
+        newDistances = (sizes[i] * matrix[i] + sizes[j] * matrix[j]) / (sizes[i] + sizes[j])
+        matrix[i, :] = newDistances
+        matrix[:, i] = newDistances
+        matrix[i, i] = 0.0
+        matrix = removeIndex(matrix, j)
+        sizes[i] += sizes[j]
+        sizes = numpy.delete(sizes, j)
+        heights[i] = height
+        heights.pop(j)
+        nodes[i] = Node(0.0, None, nodes[i], nodes.pop(j))
+    return nodes[0]
+
+treeBuilders = { "NJ":nj, "UPGMA":upgma }
+
+def getSplit(clade, leaves, rooted):
+    """Returns the clade, or if not rooted the side of its split not containing the first of the
+    sorted leaves, or None if the split is trivial.
+    """
+    if rooted:
+        return clade
+    if min(leaves) in clade:
+        clade = leaves - clade
+    if len(clade) < 2:
+        return None
+    return clade
+
+def getClades(tree, leaves, rooted):
+    """Returns the set of clades (see getSplit) of the internal nodes below the root.
+    """
+    clades = set()
+    def fn(node):
+        if node.isLeaf():
+            return frozenset([ node.name ])
+        clade = fn(node.left) | fn(node.right)
+        if node is not tree and getSplit(clade, leaves, rooted) != None:
+            clades.add(getSplit(clade, leaves, rooted))
+        return clade
+    fn(tree)
+    return clades
+
+def getReplicateClades((eventDistances, method, seed)):
+    """Builds the tree of a bootstrap replicate, returning its clades.
+    """
+    tree = treeBuilders[method](eventDistances.getReplicateMatrix(numpy.random.RandomState(seed)), eventDistances.names)
+    return getClades(tree, frozenset(eventDistances.names), method == "UPGMA")
+
+def getSupport(tree, eventDistances, method, replicates, processes=None, seed=0):
+    """Returns a dict of each clade of the tree (as in getClades) to the percentage of replicates containing it.
+    """
+    leaves = frozenset(eventDistances.names)
+    rng = random.Random(seed)
+    jobs = [ (eventDistances, method, rng.randint(0, 2**31-1)) for i in xrange(replicates) ]
+    if processes == 1:
+        replicateClades = map(getReplicateClades, jobs)
+    else:
+        pool = Pool(processes)
+        replicateClades = pool.map(getReplicateClades, jobs, chunksize=max(1, replicates / 100))
+        pool.close()
+        pool.join()
+    support = {}
+    for clade in getClades(tree, leaves, method == "UPGMA"):
+        support[clade] = 100.0 * sum([ clade in i for i in replicateClades ]) / replicates
+    return support
+
+def getNewick(tree, support=None, leaves=None, rooted=True):
+    """Returns the newick string of the tree, labelling the internal nodes with their support if given.
+    """
+    def fn(node):
+        if node.isLeaf():
+            label = node.name
+        else:
+            label = "(%s,%s)" % (fn(node.left), fn(node.right))
+            if support != None and node is not tree:
+                clade = getSplit(node.getLeaves(), leaves, rooted)
+                if clade != None:
+                    label += "%.0f" % support[clade]
+        return "%s:%f" % (label, node.distance)
+    return fn(tree) + ";"
+
+def buildTrees(eventDistances, replicates=0, processes=None, seed=0):
+    """Yields the (method, newick string) of the NJ and UPGMA trees of the distances.
+    """
+    matrix = eventDistances.getMatrix()
+    leaves = frozenset(eventDistances.names)
+    for method in ("NJ", "UPGMA"):
+        tree = treeBuilders[method](matrix, eventDistances.names)
+        support = None
+        if replicates > 0:
+            support = getSupport(tree, eventDistances, method, replicates, processes, seed)
+        yield method, getNewick(tree, support, leaves, method == "UPGMA")
+
+def main(loadFn):
+    """Prints the trees of the stats file given on the command line, using the given function to load its distances.
+    """
+    parser = OptionParser(usage="%prog [options] statsFile")
+    parser.add_option("--bootstrap", dest="bootstrap", type="int", default=0, help="Number of bootstrap replicates used to give support values")
+    parser.add_option("--processes", dest="processes", type="int", default=None, help="Defaults to the number of cores")
+    parser.add_option("--seed", dest="seed", type="int", default=0)
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.print_help()
+        return
+    eventDistances = loadFn(args[0])
+    print len(eventDistances.names), " ".join(eventDistances.names)
+    for method, newick in buildTrees(eventDistances, options.bootstrap, options.processes, options.seed):
+        print method, newick
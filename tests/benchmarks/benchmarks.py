@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+
+"""Micro-benchmarks of the preprocessing and post-processing scripts in src/scripts.
+
+The fixtures are made at each scale from the dataDir/test sequences: a fasta file of the
+sequences repeated scale times, with runs of Ns and ambiguity codes added, a MAF file of
+blocks cut from them, and snpStats and pathStats files with records made from them.
+
+Each benchmark is run at each scale in a fresh process, so that its peak resident set size
+can be measured, keeping the best of a number of repeats. Throughput is reported in the
+units the benchmark processes (bases, blocks or records per second). The results can be
+saved as a baseline, and later results compared to it, flagging those whose throughput
+falls, or whose peak memory rises, by more than the threshold.
+
+To save a baseline:  benchmarks.py --fixtureDir /tmp/benchmarks --saveBaseline
+To compare to it:    benchmarks.py --fixtureDir /tmp/benchmarks
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+benchmarksDir = os.path.split(os.path.abspath(__file__))[0]
+rootDir = os.path.split(os.path.split(benchmarksDir)[0])[0]
+sys.path.append(os.path.join(rootDir, "src", "scripts"))
+
+testSequences = [ os.path.join(rootDir, "dataDir", "test", i) for i in ("HUMAN", "HUMAN2", "HUMAN3", "HUMAN4", "CHIMP") ]
+
+#ru_maxrss is in kilobytes, except on OS X where it is in bytes
+maxRssUnit = 1024
+if sys.platform == "darwin":
+    maxRssUnit = 1
+
+######################
+#Fixtures
+######################
+
+def getSequenceFile(fixtureDir, scale):
+    return os.path.join(fixtureDir, "sequences_%i.fa" % scale)
+
+def getMafFile(fixtureDir, scale):
+    return os.path.join(fixtureDir, "alignment_%i.maf" % scale)
+
+def getStatsFile(fixtureDir, scale, statsType):
+    return os.path.join(fixtureDir, "%s_%i.xml" % (statsType, scale))
+
+def readTestSequences():
+    from fastaStream import fastaReadChunks
+    sequences = []
+    for sequenceFile in testSequences:
+        fileHandle = open(sequenceFile, 'r')
+        for name, chunk in fastaReadChunks(fileHandle):
+            if chunk == "":
+                sequences.append([ name, "" ])
+            else:
+                sequences[-1][1] += chunk
+        fileHandle.close()
+    return sequences
+
+def makeSequenceFile(outputFile, sequences, scale, rng):
+    """Writes the sequences scale times, with runs of Ns and ambiguity codes added.
+    """
+    from fastaStream import FastaChunkWriter
+    fileHandle = open(outputFile, 'w')
+    writer = FastaChunkWriter(fileHandle)
+    for copy in xrange(scale):
+        for index, (name, sequence) in enumerate(sequences): #Some names are shared between the test files
+            writer.writeHeader("%s_%i_%i" % (name, index, copy))
+            for i in xrange(0, len(sequence), 1000):
+                writer.writeChunk(sequence[i:i+1000])
+                writer.writeChunk(rng.choice(("N" * rng.randint(1, 50), "RYKM", "")))
+    writer.finishRecord()
+    fileHandle.close()
+
+def makeMafFile(outputFile, sequences, scale, rng):
+    """Writes blocks cut from the sequences, each with a reference row and a row from each of a random
+    subset of the other sequences, the rows of a block differing by the odd substitution.
+    """
+    fileHandle = open(outputFile, 'w')
+    fileHandle.write("##maf version=1\n\n")
+    names = [ "reference.chr6" ] + [ "%s.chr6" % name for name, sequence in sequences ]
+    positions = dict([ (name, 0) for name in names ])
+    reference = "".join([ sequence for name, sequence in sequences ]).upper()
+    for copy in xrange(scale):
+        i = 0
+        while i + 100 < len(reference):
+            length = rng.randint(10, 100)
+            text = reference[i:i+length]
+            fileHandle.write("a score=0\n")
+            for name in [ names[0] ] + rng.sample(names[1:], rng.randint(1, len(names) - 1)):
+                rowText = "".join([ rng.choice("ACGT") if rng.random() < 0.01 else j for j in text ])
+                fileHandle.write("s %s %i %i + %i %s\n" % (name, positions[name], length, len(reference) * scale, rowText))
+                positions[name] += length + rng.choice((0, 0, 0, 1))
+            fileHandle.write("\n")
+            i += length
+    fileHandle.close()
+
+def makeStatsFile(outputFile, sequences, scale, rng, statsType):
+    """Writes a stats file with a statsForSample element for each sequence, whose records are
+    shared between samples often enough for the aggregates to have work to do.
+    """
+    fileHandle = open(outputFile, 'w')
+    fileHandle.write("<%s>" % statsType)
+    names = [ name for name, sequence in sequences ][:10] + [ "reference", "panTro3" ]
+    for name in names:
+        fileHandle.write("<statsForSample sampleName=\"%s\" referenceName=\"hg19\" totalInsertion=\"0\" totalDeletion=\"0\">" % name)
+        records = []
+        for i in xrange(2000 * scale):
+            position = rng.randint(0, 10000 * scale)
+            if statsType == "snpStats":
+                records.append("%s %i hg19 %i %s %s" % (name, position, position, rng.choice("ACGT"), rng.choice("ACGT")))
+            else:
+                records.append(" ".join([ "hg19", "chr6", str(position), "1", "+", str(rng.choice((0, 1, 5))),
+                                          name, "chr6", str(position), "1", "+", "0", "0", str(rng.choice((0, 2))) ]))
+        fileHandle.write("\n".join(records))
+        fileHandle.write("</statsForSample>")
+    fileHandle.write("</%s>\n" % statsType)
+    fileHandle.close()
+
+def makeFixtures(fixtureDir, scales):
+    """Makes the fixtures for each scale that are not already present.
+    """
+    if not os.path.isdir(fixtureDir):
+        os.makedirs(fixtureDir)
+    sequences = None
+    for scale in scales:
+        for fixtureFile, makeFn in ((getSequenceFile(fixtureDir, scale), makeSequenceFile),
+                                    (getMafFile(fixtureDir, scale), makeMafFile),
+                                    (getStatsFile(fixtureDir, scale, "snpStats"), lambda *args : makeStatsFile(*(args + ("snpStats",)))),
+                                    (getStatsFile(fixtureDir, scale, "pathStats"), lambda *args : makeStatsFile(*(args + ("pathStats",))))):
+            if not os.path.exists(fixtureFile):
+                if sequences == None:
+                    sequences = readTestSequences()
+                makeFn(fixtureFile + ".tmp", sequences, scale, random.Random(scale))
+                os.rename(fixtureFile + ".tmp", fixtureFile)
+
+######################
+#Benchmarks, each returning the number of units processed
+######################
+
+def getBaseNumber(sequenceFile):
+    from fastaStream import fastaRecordLengths
+    fileHandle = open(sequenceFile, 'r')
+    baseNumber = sum([ length for name, length in fastaRecordLengths(fileHandle) ])
+    fileHandle.close()
+    return baseNumber
+
+def getTempOutputFile(fixtureDir):
+    return os.path.join(fixtureDir, "output.%i" % os.getpid())
+
+def benchmarkRemoveNs(fixtureDir, scale):
+    from removeNs import removeNsFromFile
+    sequenceFile = getSequenceFile(fixtureDir, scale)
+    outputFile = getTempOutputFile(fixtureDir)
+    start = time.time()
+    removeNsFromFile(sequenceFile, outputFile, 10, 0)
+    seconds = time.time() - start
+    os.remove(outputFile)
+    return getBaseNumber(sequenceFile), seconds
+
+def benchmarkMakeHaploid(fixtureDir, scale):
+    from fastaStream import fastaReadRecords
+    from makeHaploid import makeHaploid
+    sequenceFile = getSequenceFile(fixtureDir, scale)
+    start = time.time()
+    fileHandle = open(sequenceFile, 'r')
+    for name, chunks in fastaReadRecords(fileHandle):
+        for chunk in makeHaploid(chunks, random.Random(0)):
+            pass
+    fileHandle.close()
+    return getBaseNumber(sequenceFile), time.time() - start
+
+def benchmarkMafBlocks(fixtureDir, scale, processBlocks):
+    from mafIO import openMaf, readMafBlocks
+    outputFile = getTempOutputFile(fixtureDir)
+    blocks = [ 0 ]
+    def countBlocks(blocks2):
+        for block in blocks2:
+            blocks[0] += 1
+            yield block
+    start = time.time()
+    inputHandle = openMaf(getMafFile(fixtureDir, scale))
+    outputHandle = open(outputFile, 'w')
+    processBlocks(countBlocks(readMafBlocks(inputHandle)), outputHandle)
+    outputHandle.close()
+    inputHandle.close()
+    seconds = time.time() - start
+    os.remove(outputFile)
+    return blocks[0], seconds
+
+def benchmarkReadMaf(fixtureDir, scale):
+    def fn(blocks, outputHandle):
+        for block in blocks:
+            pass
+    return benchmarkMafBlocks(fixtureDir, scale, fn)
+
+def benchmarkMafViewer(fixtureDir, scale):
+    from mafViewer import viewBlocks
+    return benchmarkMafBlocks(fixtureDir, scale, lambda blocks, outputHandle : viewBlocks(blocks, [], outputHandle))
+
+def benchmarkFilterMaf(fixtureDir, scale):
+    from filterMafFor2Blocks import filterBlocks
+    logFile = getTempOutputFile(fixtureDir) + ".log"
+    logHandle = open(logFile, 'w')
+    result = benchmarkMafBlocks(fixtureDir, scale, lambda blocks, outputHandle : filterBlocks(blocks, outputHandle, logHandle))
+    logHandle.close()
+    os.remove(logFile)
+    return result
+
+def getRecordNumber(statsFile):
+    import xml.etree.ElementTree as ET
+    recordNumber = 0
+    for event, element in ET.iterparse(statsFile):
+        if element.tag == "statsForSample":
+            recordNumber += len((element.text or "").split("\n"))
+            element.clear()
+    return recordNumber
+
+def benchmarkAggregation(fixtureDir, scale, statsType, aggregatorClass):
+    from statsAggregation import writeAggregatesStreaming, getAggregatesFile
+    statsFile = getStatsFile(fixtureDir, scale, statsType)
+    start = time.time()
+    writeAggregatesStreaming(statsFile, aggregatorClass())
+    seconds = time.time() - start
+    os.remove(getAggregatesFile(statsFile))
+    return getRecordNumber(statsFile), seconds
+
+def benchmarkSnpAggregation(fixtureDir, scale):
+    from statsAggregation import SnpAggregator
+    return benchmarkAggregation(fixtureDir, scale, "snpStats", SnpAggregator)
+
+def benchmarkIndelAggregation(fixtureDir, scale):
+    from statsAggregation import IndelAggregator
+    return benchmarkAggregation(fixtureDir, scale, "pathStats", IndelAggregator)
+
+def benchmarkStatsParsing(fixtureDir, scale):
+    from statsStore import iterStatsForSamples
+    statsFile = getStatsFile(fixtureDir, scale, "pathStats")
+    start = time.time()
+    for attrib in iterStatsForSamples(statsFile):
+        pass
+    return getRecordNumber(statsFile), time.time() - start
+
+#The name, function and units of each benchmark
+benchmarks = [ ("removeNs", benchmarkRemoveNs, "bases"),
+               ("makeHaploid", benchmarkMakeHaploid, "bases"),
+               ("readMaf", benchmarkReadMaf, "blocks"),
+               ("mafViewer", benchmarkMafViewer, "blocks"),
+               ("filterMafFor2Blocks", benchmarkFilterMaf, "blocks"),
+               ("snpAggregation", benchmarkSnpAggregation, "records"),
+               ("indelAggregation", benchmarkIndelAggregation, "records"),
+               ("statsParsing", benchmarkStatsParsing, "records") ]
+
+######################
+#Running and comparing
+######################
+
+def runBenchmark(name, fixtureDir, scale):
+    """Runs a benchmark in a fresh process, returning its (units, seconds, peakRss).
+    """
+    process = subprocess.Popen([ sys.executable, os.path.abspath(__file__), "--runOne", name, "--fixtureDir", fixtureDir, "--scales", str(scale) ],
+                               stdout=subprocess.PIPE)
+    output = process.stdout.read()
+    pid, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.WEXITSTATUS(status)
+    if status != 0:
+        raise RuntimeError("Benchmark %s at scale %i failed" % (name, scale))
+    units, seconds = json.loads(output.strip().split("\n")[-1])
+    return units, seconds, usage.ru_maxrss * maxRssUnit
+
+def getKey(name, scale):
+    return "%s %i" % (name, scale)
+
+def compareToBaseline(result, baseline, threshold):
+    """Returns a list of the regressions of the result with respect to the baseline.
+    """
+    regressions = []
+    if result["throughput"] < baseline["throughput"] * (1.0 - threshold):
+        regressions.append("throughput %.0f < %.0f" % (result["throughput"], baseline["throughput"]))
+    if result["peakRss"] > baseline["peakRss"] * (1.0 + threshold):
+        regressions.append("peakRss %i > %i" % (result["peakRss"], baseline["peakRss"]))
+    return regressions
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--fixtureDir", dest="fixtureDir", help="Directory in which to make the fixtures")
+    parser.add_option("--scales", dest="scales", default="1 4 16", help="Number of copies of the test data in each fixture")
+    parser.add_option("--benchmarks", dest="benchmarks", default=" ".join([ i[0] for i in benchmarks ]), help="Benchmarks to run")
+    parser.add_option("--repeats", dest="repeats", type="int", default=3, help="Runs of each benchmark, the fastest being kept")
+    parser.add_option("--baseline", dest="baseline", default=os.path.join(benchmarksDir, "baseline.json"))
+    parser.add_option("--saveBaseline", dest="saveBaseline", action="store_true", default=False, help="Save the results as the baseline")
+    parser.add_option("--threshold", dest="threshold", type="float", default=0.2, help="Fractional change from the baseline flagged as a regression")
+    parser.add_option("--runOne", dest="runOne", default=None, help=SUPPRESS_HELP)
+    options, args = parser.parse_args()
+    if options.fixtureDir == None:
+        parser.print_help()
+        sys.exit(1)
+    scales = [ int(i) for i in options.scales.split() ]
+    benchmarkFunctions = dict([ (name, function) for name, function, unitName in benchmarks ])
+
+    if options.runOne != None: #Called by runBenchmark
+        print json.dumps(benchmarkFunctions[options.runOne](options.fixtureDir, scales[0]))
+        return
+
+    baselines = {}
+    if os.path.exists(options.baseline):
+        baselines = json.load(open(options.baseline, 'r'))
+    elif not options.saveBaseline:
+        print "There is no baseline at %s to compare to, save one first with --saveBaseline (make baseline)" % options.baseline
+        sys.exit(1)
+    makeFixtures(options.fixtureDir, scales)
+    results = {}
+    regressionNumber = 0
+    print "\t".join(("benchmark", "scale", "units", "seconds", "throughput", "peakRss", "regressions"))
+    for name, function, unitName in benchmarks:
+        if name not in options.benchmarks.split():
+            continue
+        for scale in scales:
+            runs = [ runBenchmark(name, options.fixtureDir, scale) for i in xrange(options.repeats) ]
+            units, seconds = min([ (units, seconds) for units, seconds, peakRss in runs ], key=lambda i : i[1])
+            result = { "units":units, "seconds":seconds, "throughput":units / max(seconds, 0.000001),
+                       "peakRss":min([ peakRss for units, seconds, peakRss in runs ]) }
+            results[getKey(name, scale)] = result
+            regressions = []
+            if getKey(name, scale) in baselines and not options.saveBaseline:
+                regressions = compareToBaseline(result, baselines[getKey(name, scale)], options.threshold)
+                regressionNumber += len(regressions)
+            print "%s\t%i\t%i %s\t%.3f\t%.0f %s/s\t%i\t%s" % (name, scale, units, unitName, seconds, result["throughput"], unitName,
+                                                               result["peakRss"], ", ".join(regressions) or "-")
+    if options.saveBaseline:
+        baselines.update(results)
+        fileHandle = open(options.baseline, 'w')
+        json.dump(baselines, fileHandle, indent=1, sort_keys=True)
+        fileHandle.close()
+        print "Saved the baseline to %s" % options.baseline
+    elif regressionNumber > 0:
+        print "%i regressions beyond the threshold of %.0f%%" % (regressionNumber, 100 * options.threshold)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()